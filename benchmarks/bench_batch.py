@@ -0,0 +1,70 @@
+"""Compare `jsonvc batch` with one `jsonvc` process per operation
+
+Usage: python benchmarks/bench_batch.py [NUM_DOCS]
+
+Runs on Linux and MacOS, where the configuration directory is
+redirected to a temporary location via XDG_CONFIG_HOME.
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+from pathlib import Path
+
+
+def _run(args, env, stdin=None):
+    subprocess.run(
+        [sys.executable, '-m', 'jsonvc.cmd', '--no-daemon', *args],
+        env=env, input=stdin, check=True, stdout=subprocess.DEVNULL,
+    )
+
+
+def _prepare(root: Path, num_docs: int):
+    config_dir = root / 'config'
+    storage_dir = root / 'storage'
+    doc_dir = root / 'docs'
+    for d in (config_dir, storage_dir, doc_dir):
+        d.mkdir()
+    env = dict(os.environ, XDG_CONFIG_HOME=str(config_dir))
+    env.pop('JSON_STORAGE_PATH', None)
+    _run(['config', 'set', 'storage-backend', 'local'], env)
+    _run(['config', 'set', 'local-storage-path', str(storage_dir)], env)
+    filenames = []
+    for i in range(num_docs):
+        filename = doc_dir / f'doc_{i}.json'
+        records = [{'id': j, 'doc': i, 'value': j * 0.5} for j in range(50)]
+        filename.write_text(json.dumps({'records': records}))
+        filenames.append(str(filename))
+    return env, filenames
+
+
+def bench_separate_calls(num_docs: int) -> float:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        env, filenames = _prepare(Path(tmpdir), num_docs)
+        start = time.perf_counter()
+        for filename in filenames:
+            _run(['track', filename, '-m', 'benchmark'], env)
+        return time.perf_counter() - start
+
+
+def bench_batch(num_docs: int) -> float:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        env, filenames = _prepare(Path(tmpdir), num_docs)
+        ops = ''.join(
+            json.dumps({'op': 'track', 'filename': f, 'message': 'benchmark'}) + '\n'
+            for f in filenames
+        )
+        start = time.perf_counter()
+        _run(['batch'], env, stdin=ops.encode('utf-8'))
+        return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    num_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    separate_time = bench_separate_calls(num_docs)
+    batch_time = bench_batch(num_docs)
+    print(f'{num_docs} separate calls: {separate_time:.2f} s')
+    print(f'one batch call:      {batch_time:.2f} s')
+    print(f'speedup:             {separate_time / batch_time:.1f}x')
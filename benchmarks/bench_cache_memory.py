@@ -0,0 +1,79 @@
+"""Memory used by the node cache for a large synthetic graph
+
+Usage: python benchmarks/bench_cache_memory.py [NUM_NODES]
+
+Compares the former representation of the cache entries (hex
+strings in sets) with the current one of `JsonNodeCache`.
+"""
+import sys
+import hashlib
+import tracemalloc
+from jsonvc.storage import JsonStorageProvider
+from jsonvc.version_control import JsonNodeCache
+
+
+class _NoStorage(JsonStorageProvider):
+
+    def load(self, json_hash):
+        raise KeyError(json_hash)
+
+    def store(self, json_dict):
+        raise NotImplementedError
+
+    def exists(self, json_hash):
+        return False
+
+    def compute_hash(self, json_dict):
+        raise NotImplementedError
+
+
+def _make_cache_dict(num_nodes: int) -> dict:
+    """Linear histories of ten nodes each, as in the persisted cache"""
+    def h(kind, i):
+        return hashlib.sha256(f'{kind}{i}'.encode()).hexdigest()
+    known_nodes = {}
+    known_docs = {}
+    for i in range(num_nodes):
+        known_nodes[h('node', i)] = [] if i % 10 == 0 else [h('node', i - 1)]
+        known_docs[h('doc', i)] = [h('node', i)]
+    return {'known_nodes': known_nodes, 'known_docs': known_docs}
+
+
+def _measure(build) -> int:
+    tracemalloc.start()
+    obj = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del obj
+    return size
+
+
+def _build_str_sets(cache_dict):
+    return (
+        {h: set(v) for h, v in cache_dict['known_nodes'].items()},
+        {h: set(v) for h, v in cache_dict['known_docs'].items()},
+    )
+
+
+def _build_node_cache(cache_dict):
+    cache = JsonNodeCache(_NoStorage())
+    cache.from_dict(cache_dict)
+    return cache
+
+
+def main(num_nodes: int) -> None:
+    # round-trip through bytes so that no string is shared with the input
+    cache_dict = _make_cache_dict(num_nodes)
+    str_sets = _measure(lambda: _build_str_sets(
+        {k: {h.encode().decode(): [x.encode().decode() for x in v] for h, v in d.items()}
+         for k, d in cache_dict.items()}
+    ))
+    packed = _measure(lambda: _build_node_cache(cache_dict))
+    print(f'nodes: {num_nodes}')
+    print(f'hex strings in sets: {str_sets / 2**20:8.1f} MiB')
+    print(f'packed hashes:       {packed / 2**20:8.1f} MiB')
+    print(f'reduction:           {str_sets / packed:8.1f}x')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
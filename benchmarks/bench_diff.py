@@ -0,0 +1,49 @@
+"""Diff of a node and its parent from the stored patch vs. by content
+
+Usage: python benchmarks/bench_diff.py [NUM_RECORDS]
+
+Tracks a large document and a slightly modified version, then
+compares `get_node_diff`, which returns the patch stored with the
+child node, with `get_diff`, which loads both documents, diffs
+them and validates the result.
+"""
+import sys
+import time
+from jsonvc.storage import MemoryJsonStorageProvider
+from jsonvc.version_control import JsonDocVersionControl
+
+
+def _make_docs(num_records: int):
+    old_doc = {
+        'records': [{'id': i, 'name': f'record {i}', 'value': i * 0.5} for i in range(num_records)]
+    }
+    new_doc = {'records': [dict(r) for r in old_doc['records']]}
+    for record in new_doc['records'][::1000]:
+        record['value'] = -1
+    new_doc['records'].append({'id': num_records, 'name': 'new', 'value': 0})
+    return old_doc, new_doc
+
+
+def _time(func, repeat=5) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == '__main__':
+    num_records = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    old_doc, new_doc = _make_docs(num_records)
+    docvc = JsonDocVersionControl(MemoryJsonStorageProvider())
+    old_node_hash = docvc.track(old_doc, 'old')
+    new_node_hash = docvc.update(old_node_hash, new_doc, 'new')
+    stored_time = _time(lambda: docvc.get_node_diff(old_node_hash, new_node_hash))
+    content_time = _time(lambda: docvc.get_diff(
+        docvc.get_doc(old_node_hash), docvc.get_doc(new_node_hash)
+    ))
+    print(f'{num_records} records')
+    print(f'stored patch:  {stored_time * 1000:.2f} ms')
+    print(f'diff content:  {content_time * 1000:.2f} ms')
+    print(f'speedup:       {content_time / stored_time:.0f}x')
@@ -0,0 +1,76 @@
+"""Time and peak memory of loading and hashing a large JSON file
+
+Usage: python benchmarks/bench_file_loading.py [NUM_RECORDS]
+
+Compares reading the file into a str, as done before, with the
+memory-mapped read of `load_json_file`, and hashing the loaded
+document with hashing the file by the event parser of
+`jsonvc.json_events`, also for a file whose root keys are not sorted.
+Peak memory is the one traced by tracemalloc, which does not include
+the pages of mapped files.
+"""
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+import orjson
+from jsonvc.checksum import compute_json_hash
+from jsonvc.storage_utils import load_json_file
+from jsonvc.json_events import compute_json_file_hash, load_json_pointer
+
+
+def _make_doc(num_records: int) -> dict:
+    return {
+        'records': [
+            {'id': i, 'name': f'record {i}', 'value': i * 0.5,
+             'tags': ['a', 'b'], 'meta': {'index': i}}
+            for i in range(num_records)
+        ],
+    }
+
+
+def _make_unsorted_doc(num_records: int) -> dict:
+    # the root is streamed from the offsets of its values
+    return {**_make_doc(num_records), 'count': num_records}
+
+
+def _load_text(filepath):
+    with open(filepath, 'r') as f:
+        return orjson.loads(f.read())
+
+
+def _measure(func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    # measured separately, as tracing slows down the parser
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+if __name__ == '__main__':
+    num_records = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath = os.path.join(tmpdir, 'doc.json')
+        with open(filepath, 'wb') as f:
+            f.write(orjson.dumps(_make_doc(num_records)))
+        unsorted_filepath = os.path.join(tmpdir, 'unsorted.json')
+        with open(unsorted_filepath, 'wb') as f:
+            f.write(orjson.dumps(_make_unsorted_doc(num_records)))
+        print(f'file size {os.path.getsize(filepath) / 2**20:.1f} MiB')
+        pointer = f'/records/{num_records - 1}/name'
+        cases = (
+            ('load text', lambda: _load_text(filepath)),
+            ('load mapped', lambda: load_json_file(filepath)),
+            ('hash loaded', lambda: compute_json_hash(load_json_file(filepath))),
+            ('hash streamed', lambda: compute_json_file_hash(filepath)),
+            ('hash unsorted', lambda: compute_json_file_hash(unsorted_filepath)),
+            ('pointer streamed', lambda: load_json_pointer(filepath, pointer)),
+        )
+        for label, func in cases:
+            elapsed, peak = _measure(func)
+            print(f'{label:16} {elapsed:6.2f} s  peak {peak / 2**20:8.1f} MiB')
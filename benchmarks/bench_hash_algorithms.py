@@ -0,0 +1,43 @@
+"""Throughput of the hash algorithms on canonical JSON documents
+
+Usage: python benchmarks/bench_hash_algorithms.py
+
+Hashes documents of typical sizes, from single records to large
+tables, with every algorithm of `checksum.HASH_ALGORITHMS` and
+reports MB/s of canonical JSON including the encoding.
+"""
+import time
+import orjson
+from jsonvc.checksum import HASH_ALGORITHMS, compute_json_hash
+
+
+SIZES = {'1 KB': 10, '100 KB': 1000, '10 MB': 100000}
+
+
+def _make_doc(num_records: int) -> dict:
+    return {
+        'records': [
+            {'id': i, 'name': f'record {i}', 'value': i * 0.5, 'tags': ['a', 'b']}
+            for i in range(num_records)
+        ],
+    }
+
+
+def _throughput(doc: dict, algo: str, min_time: float=0.5) -> float:
+    num_bytes = len(orjson.dumps(doc, option=orjson.OPT_SORT_KEYS))
+    count = 0
+    start = time.perf_counter()
+    while True:
+        compute_json_hash(doc, algo)
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return count * num_bytes / elapsed / 1e6
+
+
+if __name__ == '__main__':
+    docs = {label: _make_doc(n) for label, n in SIZES.items()}
+    print(f'{"algorithm":12}' + ''.join(f'{label:>12}' for label in docs))
+    for algo in HASH_ALGORITHMS:
+        rates = [_throughput(doc, algo) for doc in docs.values()]
+        print(f'{algo:12}' + ''.join(f'{r:>8.0f} MB/s' for r in rates))
@@ -0,0 +1,58 @@
+"""Compare the SQLite storage backend with the local directory backend
+
+Usage: python benchmarks/bench_sqlite_storage.py [NUM_DOCS] [NUM_UPDATES]
+
+Tracks NUM_DOCS documents with NUM_UPDATES updates each and then
+loads the documents of all nodes again.
+"""
+import sys
+import time
+import tempfile
+from pathlib import Path
+from jsonvc.storage import LocalJsonStorageProvider
+from jsonvc.sqlite_storage import SqliteJsonStorageProvider
+from jsonvc.version_control import JsonDocVersionControl
+
+
+def _make_doc(i: int, version: int) -> dict:
+    records = [{'id': j, 'doc': i, 'value': j * 0.5} for j in range(50)]
+    records[version % 50]['value'] = version
+    return {'records': records, 'version': version}
+
+
+def bench(store, num_docs: int, num_updates: int):
+    docvc = JsonDocVersionControl(store)
+    start = time.perf_counter()
+    node_hashes = []
+    for i in range(num_docs):
+        node_hash = docvc.track(_make_doc(i, 0), 'benchmark')
+        node_hashes.append(node_hash)
+        for version in range(1, num_updates + 1):
+            node_hash = docvc.update(node_hash, _make_doc(i, version), 'update')
+            node_hashes.append(node_hash)
+    write_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for node_hash in node_hashes:
+        docvc.get_doc(node_hash)
+    read_time = time.perf_counter() - start
+    return write_time, read_time
+
+
+def main(num_docs: int, num_updates: int) -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmpdir = Path(tmpdir)
+        (tmpdir / 'local').mkdir()
+        results = {
+            'local': bench(LocalJsonStorageProvider(tmpdir / 'local'), num_docs, num_updates),
+            'sqlite': bench(SqliteJsonStorageProvider(tmpdir / 'objects.db'), num_docs, num_updates),
+        }
+    num_nodes = num_docs * (num_updates + 1)
+    print(f'{num_nodes} nodes')
+    for name, (write_time, read_time) in results.items():
+        print(f'{name:8} write: {write_time:7.2f}s  read: {read_time:7.2f}s')
+
+
+if __name__ == '__main__':
+    num_docs = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    num_updates = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    main(num_docs, num_updates)
@@ -0,0 +1,41 @@
+"""Time and peak memory of hashing a large document
+
+Usage: python benchmarks/bench_streaming_hash.py [NUM_RECORDS]
+
+Compares `compute_json_hash`, which encodes the document in one go,
+with its streaming variant based on `jsonvc.canonical_json`.
+"""
+import sys
+import time
+import tracemalloc
+from jsonvc.checksum import compute_json_hash
+
+
+def _make_doc(num_records: int) -> dict:
+    return {
+        'records': [
+            {'id': i, 'name': f'record {i}', 'value': i * 0.5,
+             'tags': ['a', 'b'], 'meta': {'index': i}}
+            for i in range(num_records)
+        ],
+    }
+
+
+def _measure(func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    # measured separately, as tracing slows down the encoder
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+if __name__ == '__main__':
+    num_records = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    doc = _make_doc(num_records)
+    for label, streaming in (('in memory', False), ('streaming', True)):
+        elapsed, peak = _measure(lambda: compute_json_hash(doc, streaming=streaming))
+        print(f'{label:10} {elapsed:6.2f} s  peak {peak / 2**20:8.1f} MiB')
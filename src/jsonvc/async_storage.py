@@ -0,0 +1,114 @@
+import asyncio
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import List, Optional, Union
+from .storage import JsonStorageProvider, LocalJsonStorageProvider
+from .checksum import DEFAULT_HASH_ALGORITHM
+from .ipfs_storage import IpfsJsonStorageProvider
+
+
+class AsyncJsonStorageProvider(ABC):
+    """Counterpart of `JsonStorageProvider` for asyncio applications"""
+
+    @abstractmethod
+    async def load(self, json_hash: str) -> dict:
+        """Retrieve JSON object using JSON hash"""
+        pass
+
+    @abstractmethod
+    async def store(self, json_dict: dict) -> str:
+        """Store JSON object and return JSON hash"""
+        pass
+
+    @abstractmethod
+    async def exists(self, json_hash: str) -> bool:
+        """Check if JSON object associated with JSON hash exists"""
+        pass
+
+    @abstractmethod
+    async def compute_hash(self, json_dict: dict) -> str:
+        """Compute the hash of a JSON object"""
+        pass
+
+
+class AsyncJsonStorageAdapter(AsyncJsonStorageProvider):
+    """Run the calls of a synchronous storage in a thread pool
+
+    The event loop is not blocked while waiting for the storage and
+    up to `max_workers` calls are executed concurrently, so the
+    synchronous storage must be safe to use from several threads.
+    This holds for the local, SQLite and IPFS storages, and for cached
+    and tiered storages over such backends, but not for
+    `MemoryJsonStorageProvider`.
+    """
+
+    def __init__(self, backend: JsonStorageProvider, max_workers: int=8):
+        self._backend = backend
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def get_backend(self) -> JsonStorageProvider:
+        return self._backend
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args))
+
+    async def load(self, json_hash: str) -> dict:
+        return await self._run(self._backend.load, json_hash)
+
+    async def store(self, json_dict: dict) -> str:
+        return await self._run(self._backend.store, json_dict)
+
+    async def exists(self, json_hash: str) -> bool:
+        return await self._run(self._backend.exists, json_hash)
+
+    async def compute_hash(self, json_dict: dict) -> str:
+        return await self._run(self._backend.compute_hash, json_dict)
+
+    def close(self) -> None:
+        """Wait for pending calls and release the threads"""
+        self._executor.shutdown(wait=True)
+
+
+class AsyncLocalJsonStorageProvider(AsyncJsonStorageAdapter):
+    """Asynchronous access to a `LocalJsonStorageProvider` directory
+
+    Hashes are computed in the event loop thread, which is cheaper
+    than passing the object to a worker thread.
+    """
+
+    def __init__(self, storage_path: Path, compression: Optional[str]=None,
+                 compression_level: Optional[int]=None,
+                 bloom_filter_fpr: Optional[float]=None, max_workers: int=8,
+                 hash_algorithm: str=DEFAULT_HASH_ALGORITHM):
+        backend = LocalJsonStorageProvider(
+            storage_path, compression, compression_level, bloom_filter_fpr,
+            hash_algorithm
+        )
+        super().__init__(backend, max_workers)
+
+    async def compute_hash(self, json_dict: dict) -> str:
+        return self._backend.compute_hash(json_dict)
+
+
+class AsyncIpfsJsonStorageProvider(AsyncJsonStorageAdapter):
+    """Asynchronous access to IPFS via gateway and RPC API
+
+    Every request occupies a worker thread, so `max_workers` limits
+    the number of concurrent requests.
+    """
+
+    def __init__(self, cache_dir: Optional[Path], gateway_url: Union[str, List[str]], rpc_api_url: str,
+                 rpc_api_url_upload: Optional[str]=None, max_workers: int=16):
+        backend = IpfsJsonStorageProvider(
+            cache_dir, gateway_url, rpc_api_url, rpc_api_url_upload
+        )
+        super().__init__(backend, max_workers)
+
+    def enable_provide(self):
+        self._backend.enable_provide()
+
+    def disable_provide(self):
+        self._backend.disable_provide()
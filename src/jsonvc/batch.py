@@ -0,0 +1,120 @@
+import orjson
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Union
+from .version_control import JsonFileVersionControl
+
+
+def _op_track(filevc, filename, message, force=False):
+    return {'node_hash': filevc.track(Path(filename), message, force)}
+
+
+def _op_istracked(filevc, filename):
+    node_hashes = filevc.get_associated_node_hashes(Path(filename))
+    return {'tracked': len(node_hashes) > 0, 'node_hashes': sorted(node_hashes)}
+
+
+def _op_update(filevc, old_objref, new_objref, message, force=False):
+    return {'node_hash': filevc.update(old_objref, new_objref, message, force)}
+
+
+def _op_replace(filevc, target_file, update_file, message, force=False, targethash=None):
+    node_hash = filevc.replace(
+        Path(target_file), Path(update_file), message, force, targethash
+    )
+    return {'node_hash': node_hash}
+
+
+def _op_showassoc(filevc, objref):
+    return {'messages': filevc.get_messages(objref)}
+
+
+def _op_showlog(filevc, objref, path=None):
+    if path is None:
+        log_info = filevc.get_linear_history(objref)
+    else:
+        log_info = filevc.get_path_history(objref, path)
+    log = [{'hash': n.get_hash(), 'message': n.get_meta()['message']} for n in log_info]
+    return {'log': log}
+
+
+def _op_blame(filevc, objref, path=''):
+    return {'blame': filevc.blame(objref, path)}
+
+
+def _op_showdoc(filevc, objref):
+    return {'document': filevc.load_doc(objref)}
+
+
+def _op_showdiff(filevc, old_objref, new_objref):
+    return {'patch': filevc.create_diff(old_objref, new_objref)}
+
+
+def _op_discover(filevc, node_hashes):
+    discovered_nodes = filevc.get_cache().discover_nodes(node_hashes)
+    return {'discovered': sorted(discovered_nodes)}
+
+
+BATCH_OPERATIONS = {
+    'track': _op_track,
+    'istracked': _op_istracked,
+    'update': _op_update,
+    'replace': _op_replace,
+    'showassoc': _op_showassoc,
+    'showlog': _op_showlog,
+    'blame': _op_blame,
+    'showdoc': _op_showdoc,
+    'showdiff': _op_showdiff,
+    'discover': _op_discover,
+}
+
+
+def run_batch_operation(filevc: JsonFileVersionControl, operation: dict) -> dict:
+    """Execute a single operation and return the result record
+
+    The operation is a dictionary with the operation name under `op`,
+    an optional `id` that is copied to the result record, and the
+    arguments named as in the corresponding command-line subcommand.
+    Errors are reported in the result record instead of being raised.
+    """
+    result = {}
+    if 'id' in operation:
+        result['id'] = operation['id']
+    try:
+        op = operation.get('op', None)
+        if op not in BATCH_OPERATIONS:
+            raise ValueError(f'Unknown operation `{op}`')
+        kwargs = {k: v for k, v in operation.items() if k not in ('op', 'id')}
+        op_result = BATCH_OPERATIONS[op](filevc, **kwargs)
+        result['ok'] = True
+        result['result'] = op_result
+    except Exception as exc:
+        result['ok'] = False
+        result['error'] = str(exc)
+        result['error_type'] = type(exc).__name__
+        if hasattr(exc, 'node_hashes'):
+            result['node_hashes'] = sorted(exc.node_hashes)
+    return result
+
+
+def run_batch(filevc: JsonFileVersionControl, lines: Iterable[Union[str, bytes]],
+              write_func: Callable[[bytes], Optional[int]]) -> int:
+    """Execute JSON-lines operations and write JSON-lines results
+
+    Returns the number of failed operations.
+    """
+    num_failed = 0
+    for line in lines:
+        if len(line.strip()) == 0:
+            continue
+        try:
+            operation = orjson.loads(line)
+            if not isinstance(operation, dict):
+                raise ValueError('Each line must contain a JSON object')
+        except (orjson.JSONDecodeError, ValueError) as exc:
+            result = {'ok': False, 'error': str(exc), 'error_type': type(exc).__name__}
+        else:
+            result = run_batch_operation(filevc, operation)
+        if not result['ok']:
+            num_failed += 1
+        write_func(orjson.dumps(result) + b'\n')
+    return num_failed
@@ -0,0 +1,156 @@
+import math
+import mmap
+import struct
+import hashlib
+from pathlib import Path
+from typing import Iterable
+from .file_utils import write_file_atomic, locked_file
+
+
+BLOOM_FILTER_MAGIC = b'JVCBLOOM'
+BLOOM_FILTER_VERSION = 1
+# magic, version, stale flag, number of bits, capacity,
+# number of items, false positive rate, number of hash functions
+_HEADER = struct.Struct('<8sIBxxxQQQdI4x')
+_STALE_OFFSET = 12
+_NUM_ITEMS_OFFSET = 32
+
+
+def compute_filter_size(capacity: int, false_positive_rate: float):
+    """Return the optimal number of bits and hash functions"""
+    if not 0 < false_positive_rate < 1:
+        raise ValueError('The false positive rate must be between 0 and 1')
+    capacity = max(capacity, 1)
+    num_bits = math.ceil(-capacity * math.log(false_positive_rate) / math.log(2)**2)
+    num_bits = max(8 * math.ceil(num_bits / 8), 64)
+    num_hashes = max(round(num_bits / capacity * math.log(2)), 1)
+    return num_bits, num_hashes
+
+
+def _get_bit_positions(item: str, num_bits: int, num_hashes: int):
+    digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:], 'little') | 1
+    return [(h1 + i * h2) % num_bits for i in range(num_hashes)]
+
+
+def locked_bloom_filter(filepath: Path):
+    """Context manager holding the lock of a filter file"""
+    filepath = Path(filepath)
+    return locked_file(filepath.with_name(filepath.name + '.lock'))
+
+
+def locked_bloom_filter_writers(filepath: Path, shared: bool=True):
+    """Context manager held by writers of the objects of a filter file
+
+    Writers add hashes to the filter before storing their objects and
+    hold the lock shared in between. A filter built from the stored
+    objects must be created with the lock held exclusively, as it would
+    otherwise miss the hashes of objects not written yet.
+    """
+    filepath = Path(filepath)
+    return locked_file(filepath.with_name(filepath.name + '.writers.lock'), shared)
+
+
+class BloomFilter:
+    """Persisted Bloom filter over a set of hashes
+
+    The filter file is memory-mapped, so queries need no I/O and
+    additions become visible to all processes using the same file.
+    Additions are serialized by a lock file. A full filter is replaced
+    by a larger one with `create`, which marks the old file as stale,
+    upon which processes still using it switch to the new file.
+    """
+
+    def __init__(self, filepath: Path):
+        self._filepath = Path(filepath)
+        self._open()
+
+    def _open(self) -> None:
+        with open(self._filepath, 'r+b') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0)
+        (magic, version, _, self._num_bits, self._capacity, _,
+         self._false_positive_rate, self._num_hashes) = _HEADER.unpack_from(self._mmap)
+        if magic != BLOOM_FILTER_MAGIC or version != BLOOM_FILTER_VERSION:
+            self._mmap.close()
+            raise ValueError(
+                f'{self._filepath} is not a Bloom filter file of version {BLOOM_FILTER_VERSION}'
+            )
+
+    @classmethod
+    def create(cls, filepath: Path, items: Iterable[str], capacity: int,
+               false_positive_rate: float) -> 'BloomFilter':
+        """Create a new filter file containing `items` and open it
+
+        The caller must hold the lock of the filter file (see
+        `locked_bloom_filter`) to prevent additions to a replaced
+        file from getting lost, and if `items` are the stored objects,
+        the writers lock exclusively (see `locked_bloom_filter_writers`).
+        """
+        num_bits, num_hashes = compute_filter_size(capacity, false_positive_rate)
+        bits = bytearray(num_bits // 8)
+        num_items = 0
+        for item in items:
+            for pos in _get_bit_positions(item, num_bits, num_hashes):
+                bits[pos >> 3] |= 1 << (pos & 7)
+            num_items += 1
+        header = _HEADER.pack(
+            BLOOM_FILTER_MAGIC, BLOOM_FILTER_VERSION, 0, num_bits,
+            capacity, num_items, false_positive_rate, num_hashes
+        )
+        filepath = Path(filepath)
+        try:
+            old_file = open(filepath, 'r+b')
+        except FileNotFoundError:
+            old_file = None
+        write_file_atomic(filepath, header + bits)
+        if old_file is not None:
+            # tell processes still using the old file to switch over
+            with old_file:
+                old_file.seek(_STALE_OFFSET)
+                old_file.write(b'\x01')
+        return cls(filepath)
+
+    def get_capacity(self) -> int:
+        return self._capacity
+
+    def get_false_positive_rate(self) -> float:
+        return self._false_positive_rate
+
+    def __len__(self) -> int:
+        """Number of added items not already reported as contained"""
+        return struct.unpack_from('<Q', self._mmap, _NUM_ITEMS_OFFSET)[0]
+
+    def _refresh(self) -> None:
+        if self._mmap[_STALE_OFFSET] != 0:
+            self._mmap.close()
+            self._open()
+
+    def _contains(self, positions) -> bool:
+        buf = self._mmap
+        offset = _HEADER.size
+        return all(buf[offset + (pos >> 3)] & (1 << (pos & 7)) for pos in positions)
+
+    def might_contain(self, item: str) -> bool:
+        """Return False only if `item` has never been added"""
+        self._refresh()
+        positions = _get_bit_positions(item, self._num_bits, self._num_hashes)
+        return self._contains(positions)
+
+    def add(self, item: str) -> None:
+        with locked_bloom_filter(self._filepath):
+            self._refresh()
+            positions = _get_bit_positions(item, self._num_bits, self._num_hashes)
+            if self._contains(positions):
+                return
+            buf = self._mmap
+            offset = _HEADER.size
+            for pos in positions:
+                buf[offset + (pos >> 3)] |= 1 << (pos & 7)
+            struct.pack_into('<Q', buf, _NUM_ITEMS_OFFSET, len(self) + 1)
+
+    def is_full(self) -> bool:
+        return len(self) > self._capacity
+
+    def close(self) -> None:
+        self._mmap.close()
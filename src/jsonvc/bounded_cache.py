@@ -0,0 +1,267 @@
+import os
+import time
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Set
+import orjson
+from .json.models import JsonGraphNode
+from .tiered_storage import DirectoryJsonStorageProvider
+from .file_utils import write_file_atomic
+from .journal import JournaledStateFile
+
+
+CACHE_POLICIES = ('lru', 'lfu')
+# eviction frees space down to this fraction of the limit,
+# so that it does not run again on the next stored object
+LOW_WATERMARK = 0.9
+
+
+class _CacheIndex:
+    """Size, last access time and number of accesses of cached objects
+
+    State object of a `JournaledStateFile`, keyed by hash. Removed
+    objects are journaled as null entries.
+    """
+
+    def __init__(self):
+        # hash -> [size, last access time, number of accesses]
+        self.entries = dict()
+        self.total_bytes = 0
+        self._dirty_hashes = set()
+
+    def add(self, json_hash: str, size: int, access_time: float, num_accesses: int) -> None:
+        self.forget(json_hash)
+        self.entries[json_hash] = [size, access_time, num_accesses]
+        self.total_bytes += size
+        self._dirty_hashes.add(json_hash)
+
+    def touch(self, json_hash: str) -> None:
+        entry = self.entries.get(json_hash, None)
+        if entry is not None:
+            entry[1] = time.time()
+            entry[2] += 1
+            self._dirty_hashes.add(json_hash)
+
+    def forget(self, json_hash: str) -> None:
+        entry = self.entries.pop(json_hash, None)
+        if entry is not None:
+            self.total_bytes -= entry[0]
+            self._dirty_hashes.add(json_hash)
+
+    def to_dict(self):
+        return dict(self.entries)
+
+    def from_dict(self, index_dict, update=True):
+        if not update:
+            self.entries = dict()
+            self.total_bytes = 0
+        for json_hash, entry in index_dict.items():
+            if json_hash in self._dirty_hashes:
+                # not saved yet, so newer than the persisted entry
+                # except for the access statistics
+                cur_entry = self.entries.get(json_hash, None)
+                if cur_entry is not None and entry is not None:
+                    cur_entry[1] = max(cur_entry[1], entry[1])
+                    cur_entry[2] = max(cur_entry[2], entry[2])
+                continue
+            cur_entry = self.entries.pop(json_hash, None)
+            if cur_entry is not None:
+                self.total_bytes -= cur_entry[0]
+            if entry is None:
+                continue
+            if cur_entry is not None:
+                entry = [entry[0], max(entry[1], cur_entry[1]), max(entry[2], cur_entry[2])]
+            self.entries[json_hash] = list(entry)
+            self.total_bytes += entry[0]
+
+    def pop_delta(self) -> Optional[dict]:
+        """Return entries changed since the last call, null if removed"""
+        if len(self._dirty_hashes) == 0:
+            return None
+        delta = {h: self.entries.get(h, None) for h in self._dirty_hashes}
+        self._dirty_hashes = set()
+        return delta
+
+
+class BoundedDirectoryJsonStorageProvider(DirectoryJsonStorageProvider):
+    """Directory of cached objects whose total size is limited
+
+    The size, last access time and number of accesses of each object
+    are kept in memory, so reading an object needs no `stat`. Once the
+    total size exceeds `max_bytes`, the least recently (`lru`) or least
+    frequently (`lfu`) used objects are removed, except for those
+    returned by `pinned_func`. If `verify_func` is given, it checks
+    the bytes of an object read from the directory against its hash
+    and objects failing the check are removed and reported as missing.
+
+    The index is persisted in the directory as a base file plus a
+    journal (see `JournaledStateFile`), so processes sharing the
+    directory only read the changes of the others. `save_index`
+    appends the access statistics. With a limit, stored objects are
+    journaled right away and the total size is checked under the lock
+    of the index, including the objects stored by other processes.
+    The directory is only listed if there is no index yet, and objects
+    written there by other means are indexed once they are read.
+    """
+
+    INDEX_FILENAME = '.cache-index.json'
+    INDEX_JOURNAL_FILENAME = '.cache-index.journal'
+    LOCK_FILENAME = '.cache-index.lock'
+
+    def __init__(self, directory: Path, hash_func: Callable[[dict], str],
+                 max_bytes: Optional[int]=None, policy: str='lru',
+                 verify_func: Optional[Callable[[str, bytes], bool]]=None,
+                 pinned_func: Optional[Callable[[], Set[str]]]=None):
+        super().__init__(directory, hash_func)
+        if policy not in CACHE_POLICIES:
+            raise ValueError(f'policy must be one of ({", ".join(CACHE_POLICIES)})')
+        self._max_bytes = max_bytes
+        self._policy = policy
+        self._verify_func = verify_func
+        self._pinned_func = pinned_func
+        self._index = _CacheIndex()
+        self._index_file = JournaledStateFile(
+            self._directory / self.INDEX_FILENAME,
+            self._directory / self.INDEX_JOURNAL_FILENAME,
+            self._directory / self.LOCK_FILENAME,
+        )
+        self._lock = threading.RLock()
+        self._load_index()
+
+    def _load_index(self) -> None:
+        if (self._directory / self.INDEX_FILENAME).is_file() \
+                or (self._directory / self.INDEX_JOURNAL_FILENAME).is_file():
+            self._index_file.load(self._index)
+            return
+        # e.g. a directory filled by an older version
+        for entry in os.scandir(self._directory):
+            if not entry.is_file() or entry.name.startswith('.'):
+                continue
+            stat_result = entry.stat()
+            self._index.add(entry.name, stat_result.st_size, stat_result.st_mtime, 0)
+
+    def save_index(self) -> None:
+        """Append the changes of the index, merged by other processes"""
+        with self._lock:
+            self._index_file.save(self._index)
+
+    def set_pinned_func(self, pinned_func: Optional[Callable[[], Set[str]]]) -> None:
+        self._pinned_func = pinned_func
+
+    def get_max_bytes(self) -> Optional[int]:
+        return self._max_bytes
+
+    def get_total_bytes(self) -> int:
+        return self._index.total_bytes
+
+    def load(self, json_hash: str) -> dict:
+        with self._lock:
+            try:
+                with open(self._directory / json_hash, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                self._index.forget(json_hash)
+                raise
+            if self._verify_func is not None and not self._verify_func(json_hash, data):
+                self.remove(json_hash)
+                raise FileNotFoundError(f'Cached object {json_hash} is corrupt and was removed')
+            if json_hash not in self._index.entries:
+                self._index.add(json_hash, len(data), time.time(), 0)
+            self._index.touch(json_hash)
+            return orjson.loads(data)
+
+    def exists(self, json_hash: str) -> bool:
+        if json_hash in self._index.entries:
+            return True
+        return super().exists(json_hash)
+
+    def store_under_hash(self, json_hash: str, json_dict: dict) -> None:
+        data = orjson.dumps(json_dict, option=orjson.OPT_SORT_KEYS)
+        with self._lock:
+            write_file_atomic(self._directory / json_hash, data)
+            self._index.add(json_hash, len(data), time.time(), 1)
+            if self._max_bytes is not None:
+                # the total includes the objects stored by other processes
+                self._index_file.update(self._index, self._evict_if_full)
+
+    def _evict_if_full(self) -> List[str]:
+        if self._index.total_bytes <= self._max_bytes:
+            return []
+        return self._evict(int(LOW_WATERMARK * self._max_bytes))
+
+    def evict(self, target_bytes: int) -> List[str]:
+        """Remove unpinned objects until at most `target_bytes` are used
+
+        The index is refreshed first and saved afterwards while holding
+        its lock, so that the objects stored by other processes count
+        and are not evicted by several processes at once.
+        """
+        with self._lock:
+            return self._index_file.update(self._index, lambda: self._evict(target_bytes))
+
+    def _evict(self, target_bytes: int) -> List[str]:
+        entries = self._index.entries
+        pinned = set() if self._pinned_func is None else self._pinned_func()
+        if self._policy == 'lru':
+            sort_key = lambda h: entries[h][1]
+        else:
+            sort_key = lambda h: (entries[h][2], entries[h][1])
+        candidates = sorted((h for h in entries if h not in pinned), key=sort_key)
+        removed = []
+        for json_hash in candidates:
+            if self._index.total_bytes <= target_bytes:
+                break
+            try:
+                self.remove(json_hash)
+            except FileNotFoundError:
+                pass
+            removed.append(json_hash)
+        return removed
+
+    def index(self):
+        return list(self._index.entries)
+
+    def size(self, json_hash: str) -> int:
+        entry = self._index.entries.get(json_hash, None)
+        if entry is None:
+            return super().size(json_hash)
+        return entry[0]
+
+    def remove(self, json_hash: str) -> None:
+        with self._lock:
+            self._index.forget(json_hash)
+            super().remove(json_hash)
+
+    def find_reachable_objects(self, node_hashes: Iterable[str],
+                               max_bytes: Optional[int]=None) -> Set[str]:
+        """Return cached objects reachable from nodes without fetching others
+
+        Nodes are visited breadth-first in the given order until the
+        reachable objects take up `max_bytes`.
+        """
+        reachable = set()
+        num_bytes = 0
+        pending = list(node_hashes)
+        while len(pending) > 0:
+            next_pending = []
+            for node_hash in pending:
+                if node_hash in reachable or node_hash not in self._index.entries:
+                    continue
+                try:
+                    with open(self._directory / node_hash, 'rb') as f:
+                        node_dict = orjson.loads(f.read())
+                    node = JsonGraphNode(**node_dict)
+                except Exception:
+                    # removed concurrently or not a node
+                    continue
+                node_objects = [node_hash, node.get_document_hash(), node.get_ext_patch_hash()]
+                for json_hash in node_objects:
+                    entry = self._index.entries.get(json_hash, None)
+                    if entry is not None and json_hash not in reachable:
+                        reachable.add(json_hash)
+                        num_bytes += entry[0]
+                if max_bytes is not None and num_bytes >= max_bytes:
+                    return reachable
+                next_pending.extend(node.get_source_hashes())
+            pending = next_pending
+        return reachable
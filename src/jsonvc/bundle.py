@@ -0,0 +1,281 @@
+import struct
+import zlib
+from typing import BinaryIO, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+import orjson
+from .storage import JsonStorageProvider
+from .replication import group_nodes_by_level
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+BUNDLE_MAGIC = b'JVCBNDL'
+BUNDLE_VERSION = 1
+# magic, format version, compression codec
+_FILE_HEADER = struct.Struct('>7sBB')
+# length of the hash, length of the object
+_RECORD_HEADER = struct.Struct('>HI')
+_LENGTH = struct.Struct('>I')
+CODEC_IDS = {'none': 0, 'zlib': 1, 'zstd': 2}
+CODEC_NAMES = {v: k for k, v in CODEC_IDS.items()}
+BATCH_SIZE = 64
+READ_SIZE = 64 * 1024
+
+
+class InvalidBundleError(ValueError):
+    """A bundle is malformed, truncated or contains objects not matching their hash"""
+    pass
+
+
+class BundleInfo(NamedTuple):
+    heads: List[str]
+    prerequisites: List[str]
+    num_objects: int
+
+
+class _ZlibWriter:
+
+    def __init__(self, fileobj: BinaryIO, level: Optional[int]):
+        self._fileobj = fileobj
+        level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+        self._compressor = zlib.compressobj(level)
+
+    def write(self, data: bytes) -> None:
+        self._fileobj.write(self._compressor.compress(data))
+
+    def close(self) -> None:
+        self._fileobj.write(self._compressor.flush())
+
+
+class _ZlibReader:
+
+    def __init__(self, fileobj: BinaryIO):
+        self._fileobj = fileobj
+        self._decompressor = zlib.decompressobj()
+        self._buffer = b''
+
+    def read(self, size: int) -> bytes:
+        while len(self._buffer) < size and not self._decompressor.eof:
+            data = self._decompressor.unconsumed_tail
+            if len(data) == 0:
+                data = self._fileobj.read(READ_SIZE)
+                if len(data) == 0:
+                    break
+            # bound the output to keep memory use independent of the ratio
+            max_length = max(size - len(self._buffer), READ_SIZE)
+            self._buffer += self._decompressor.decompress(data, max_length)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class _PlainWriter:
+
+    def __init__(self, fileobj: BinaryIO):
+        self.write = fileobj.write
+
+    def close(self) -> None:
+        pass
+
+
+def _check_codec(compression: str) -> None:
+    if compression not in CODEC_IDS:
+        raise ValueError(f'compression must be one of ({", ".join(CODEC_IDS)})')
+    if compression == 'zstd' and zstandard is None:
+        raise ImportError(
+            'zstd compression requires the `zstandard` package---'
+            'install it with `pip install zstandard`'
+        )
+
+
+def _open_writer(fileobj: BinaryIO, compression: str, level: Optional[int]):
+    if compression == 'zlib':
+        return _ZlibWriter(fileobj, level)
+    if compression == 'zstd':
+        kwargs = {'level': 3 if level is None else level}
+        return zstandard.ZstdCompressor(**kwargs).stream_writer(fileobj, closefd=False)
+    return _PlainWriter(fileobj)
+
+
+def _open_reader(fileobj: BinaryIO, compression: str):
+    if compression == 'zlib':
+        return _ZlibReader(fileobj)
+    if compression == 'zstd':
+        return zstandard.ZstdDecompressor().stream_reader(fileobj, closefd=False)
+    return fileobj
+
+
+def _read_exactly(reader, size: int) -> bytes:
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = reader.read(remaining)
+        if len(chunk) == 0:
+            raise InvalidBundleError('The bundle is truncated')
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i+size]
+
+
+def _find_nodes(storage: JsonStorageProvider, node_hashes: Iterable[str],
+                excluded: Set[str]=frozenset()) -> Dict[str, dict]:
+    """Return the nodes reachable from `node_hashes` without their content
+
+    Only the references of the nodes are kept, so that memory use
+    depends on the number of nodes but not on the size of objects.
+    """
+    found = dict()
+    pending = [h for h in dict.fromkeys(node_hashes) if h not in excluded]
+    while len(pending) > 0:
+        next_pending = dict()
+        for chunk in _chunks(pending, BATCH_SIZE):
+            for node_hash, node_dict in zip(chunk, storage.load_many(chunk)):
+                source_hashes = node_dict.get('sourceHashes', None) or []
+                found[node_hash] = {
+                    'sourceHashes': source_hashes,
+                    'objectHashes': [
+                        h for h in (node_dict['documentHash'], node_dict['extJsonPatchHash'])
+                        if h is not None
+                    ],
+                }
+                for source_hash in source_hashes:
+                    if source_hash not in found and source_hash not in excluded:
+                        next_pending[source_hash] = None
+        pending = list(next_pending)
+    return found
+
+
+def write_bundle(storage: JsonStorageProvider, fileobj: BinaryIO,
+                 head_node_hashes: List[str], base_node_hashes: List[str]=(),
+                 compression: str='zlib', level: Optional[int]=None) -> int:
+    """Write the objects reachable from the heads to a bundle file
+
+    Objects reachable from the base nodes are left out; the base nodes
+    must be present in the storage the bundle is unpacked into. Nodes
+    follow their sources, patches and documents in the bundle, so an
+    interrupted unbundling leaves only complete histories behind.
+    Returns the number of objects written.
+    """
+    _check_codec(compression)
+    base_nodes = _find_nodes(storage, base_node_hashes)
+    implied = set(base_nodes)
+    for node in base_nodes.values():
+        implied.update(node['objectHashes'])
+    nodes = _find_nodes(storage, head_node_hashes, set(base_nodes))
+    node_sources = {h: n['sourceHashes'] for h, n in nodes.items()}
+    header = {
+        'heads': list(head_node_hashes),
+        'prerequisites': [h for h in dict.fromkeys(base_node_hashes) if h in base_nodes],
+    }
+
+    fileobj.write(_FILE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, CODEC_IDS[compression]))
+    writer = _open_writer(fileobj, compression, level)
+    header_bytes = orjson.dumps(header)
+    writer.write(_LENGTH.pack(len(header_bytes)) + header_bytes)
+    written = set(implied)
+
+    def write_objects(json_hashes):
+        for chunk in _chunks(json_hashes, BATCH_SIZE):
+            for json_hash, json_dict in zip(chunk, storage.load_many(chunk)):
+                hash_bytes = json_hash.encode('ascii')
+                data = orjson.dumps(json_dict, option=orjson.OPT_SORT_KEYS)
+                writer.write(_RECORD_HEADER.pack(len(hash_bytes), len(data)) + hash_bytes + data)
+            written.update(chunk)
+
+    for level_hashes in group_nodes_by_level(node_sources):
+        for chunk in _chunks(level_hashes, BATCH_SIZE):
+            object_hashes = dict()
+            for node_hash in chunk:
+                for json_hash in nodes[node_hash]['objectHashes']:
+                    if json_hash not in written:
+                        object_hashes[json_hash] = None
+            write_objects(list(object_hashes))
+            write_objects(chunk)
+    # an empty record marks the end, so that truncation is detected
+    writer.write(_RECORD_HEADER.pack(0, 0))
+    writer.close()
+    return len(written) - len(implied)
+
+
+def _read_header(fileobj: BinaryIO) -> Tuple[object, dict]:
+    file_header = fileobj.read(_FILE_HEADER.size)
+    if len(file_header) < _FILE_HEADER.size:
+        raise InvalidBundleError('Not a jsonvc bundle')
+    magic, version, codec_id = _FILE_HEADER.unpack(file_header)
+    if magic != BUNDLE_MAGIC:
+        raise InvalidBundleError('Not a jsonvc bundle')
+    if version != BUNDLE_VERSION:
+        raise InvalidBundleError(f'Unsupported bundle version {version}')
+    if codec_id not in CODEC_NAMES:
+        raise InvalidBundleError(f'Unknown compression codec {codec_id}')
+    _check_codec(CODEC_NAMES[codec_id])
+    reader = _open_reader(fileobj, CODEC_NAMES[codec_id])
+    header_length, = _LENGTH.unpack(_read_exactly(reader, _LENGTH.size))
+    header = orjson.loads(_read_exactly(reader, header_length))
+    return reader, header
+
+
+def iter_bundle_objects(reader):
+    """Yield the hashes and objects of a bundle after its header"""
+    while True:
+        hash_length, data_length = _RECORD_HEADER.unpack(
+            _read_exactly(reader, _RECORD_HEADER.size)
+        )
+        if hash_length == 0:
+            return
+        json_hash = _read_exactly(reader, hash_length).decode('ascii')
+        yield json_hash, orjson.loads(_read_exactly(reader, data_length))
+
+
+def read_bundle(storage: JsonStorageProvider, fileobj: BinaryIO,
+                batch_size: int=BATCH_SIZE) -> BundleInfo:
+    """Verify the objects of a bundle and store them
+
+    Objects are stored in batches of up to `batch_size` as they are
+    read. As storages may store the objects of a batch in parallel, a
+    node only joins a batch without documents, patches or source nodes
+    of it, so that an interrupted unbundling leaves no node stored
+    without its history. An object whose hash in the storage differs
+    from the one recorded in the bundle raises `InvalidBundleError`
+    before it is stored.
+    """
+    reader, header = _read_header(fileobj)
+    prerequisites = header.get('prerequisites', [])
+    for node_hash, exists in zip(prerequisites, storage.exists_many(prerequisites)):
+        if not exists:
+            raise InvalidBundleError(f'The bundle requires the history of node {node_hash}')
+    num_objects = 0
+    batch = []
+    batch_node_hashes = set()
+    for json_hash, json_dict in iter_bundle_objects(reader):
+        computed_hash = storage.compute_hash(json_dict)
+        if computed_hash != json_hash:
+            raise InvalidBundleError(
+                f'Object {json_hash} of the bundle has hash {computed_hash} in the storage'
+            )
+        # documents looking like nodes only cause an earlier flush
+        is_node = isinstance(json_dict, dict) and 'documentHash' in json_dict \
+            and 'extJsonPatchHash' in json_dict
+        if is_node:
+            source_hashes = json_dict.get('sourceHashes', None) or []
+            depends_on_batch = len(batch_node_hashes) < len(batch) \
+                or any(h in batch_node_hashes for h in source_hashes)
+        else:
+            depends_on_batch = False
+        if len(batch) >= batch_size or depends_on_batch:
+            storage.store_many(batch)
+            num_objects += len(batch)
+            batch = []
+            batch_node_hashes = set()
+        batch.append(json_dict)
+        if is_node:
+            batch_node_hashes.add(json_hash)
+    storage.store_many(batch)
+    num_objects += len(batch)
+    return BundleInfo(header['heads'], prerequisites, num_objects)
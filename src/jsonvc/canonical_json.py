@@ -0,0 +1,171 @@
+"""Incremental encoding of the canonical JSON representation
+
+The canonical representation, on which hashes are computed, is the
+output of `orjson.dumps` with `OPT_SORT_KEYS`. Encoding a document in
+one go needs memory for the whole output. The encoder here produces
+the same bytes in chunks, so that a hash can be computed and a file
+written while the document is encoded, and memory use does not grow
+with the size of the document.
+
+Containers are walked in Python, but runs of scalars and small
+containers, as are typical for records, are encoded by one
+`orjson.dumps` call each to keep the encoding fast.
+"""
+from typing import BinaryIO, Iterator, Optional
+import orjson
+
+
+CHUNK_SIZE = 64 * 1024
+# containers nested deeper are rejected by orjson
+MAX_DEPTH = 254
+# number of values encoded by one call of orjson
+BATCH_WEIGHT = 4096
+_CONTAINER_TYPES = (dict, list, tuple)
+_SCALAR_TYPES = frozenset((str, int, float, bool, type(None)))
+
+
+def _dumps(value) -> bytes:
+    return orjson.dumps(value, option=orjson.OPT_SORT_KEYS)
+
+
+def _get_weight(value, depth: int, limit: int) -> Optional[int]:
+    """Return the number of values in a value at a given depth
+
+    Returns None for containers with more than `limit` values or
+    nested too deep, which are encoded piecewise.
+    """
+    if type(value) in _SCALAR_TYPES or not isinstance(value, _CONTAINER_TYPES):
+        return 1 if limit > 0 else None
+    weight = 1 + len(value)
+    if weight > limit or depth > MAX_DEPTH:
+        return None
+    for v in (value.values() if isinstance(value, dict) else value):
+        if type(v) not in _SCALAR_TYPES and isinstance(v, _CONTAINER_TYPES):
+            v_weight = _get_weight(v, depth + 1, limit - weight)
+            if v_weight is None:
+                return None
+            weight += v_weight
+    return weight
+
+
+def _check_depth(depth: int) -> None:
+    if depth > MAX_DEPTH:
+        raise orjson.JSONEncodeError('Recursion limit reached')
+
+
+def _encode(value, depth: int) -> Iterator[bytes]:
+    if not isinstance(value, _CONTAINER_TYPES) or len(value) == 0:
+        _check_depth(depth)
+        yield _dumps(value)
+    elif isinstance(value, dict):
+        yield from _encode_object(value, depth)
+    else:
+        yield from _encode_array(value, depth)
+
+
+def _encode_array(value, depth: int) -> Iterator[bytes]:
+    _check_depth(depth)
+    yield b'['
+    separator = b''
+    start = 0
+    weight = 0
+    for i, item in enumerate(value):
+        item_weight = _get_weight(item, depth + 1, BATCH_WEIGHT - weight)
+        if item_weight is not None:
+            weight += item_weight
+            continue
+        if i > start:
+            yield separator + _dumps(value[start:i])[1:-1]
+            separator = b','
+        if weight > 0:
+            item_weight = _get_weight(item, depth + 1, BATCH_WEIGHT)
+        if item_weight is not None:
+            start = i
+            weight = item_weight
+        else:
+            yield separator
+            separator = b','
+            yield from _encode(item, depth + 1)
+            start = i + 1
+            weight = 0
+    if len(value) > start:
+        yield separator + _dumps(value[start:])[1:-1]
+    yield b']'
+
+
+def _encode_object(value: dict, depth: int) -> Iterator[bytes]:
+    _check_depth(depth)
+    for key in value:
+        if not isinstance(key, str):
+            raise orjson.JSONEncodeError('Dict key must be str')
+    keys = sorted(value)
+    yield b'{'
+    separator = b''
+    start = 0
+    weight = 0
+
+    def encode_batch(stop):
+        return _dumps({k: value[k] for k in keys[start:stop]})[1:-1]
+
+    for i, key in enumerate(keys):
+        item_weight = _get_weight(value[key], depth + 1, BATCH_WEIGHT - weight)
+        if item_weight is not None:
+            weight += item_weight
+            continue
+        if i > start:
+            yield separator + encode_batch(i)
+            separator = b','
+        if weight > 0:
+            item_weight = _get_weight(value[key], depth + 1, BATCH_WEIGHT)
+        if item_weight is not None:
+            start = i
+            weight = item_weight
+        else:
+            yield separator + _dumps(key) + b':'
+            separator = b','
+            yield from _encode(value[key], depth + 1)
+            start = i + 1
+            weight = 0
+    if len(keys) > start:
+        yield separator + encode_batch(len(keys))
+    yield b'}'
+
+
+def iter_canonical_json(json_dict, chunk_size: int=CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield the canonical JSON bytes of a document in chunks
+
+    The concatenated chunks are identical to the output of
+    `orjson.dumps(json_dict, option=orjson.OPT_SORT_KEYS)`, and the same
+    errors are raised for values orjson cannot encode. All chunks but
+    the last one are at least `chunk_size` bytes long.
+    """
+    pieces = []
+    size = 0
+    for piece in _encode(json_dict, 1):
+        pieces.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield b''.join(pieces)
+            pieces = []
+            size = 0
+    if len(pieces) > 0:
+        yield b''.join(pieces)
+
+
+def dump_canonical_json(json_dict, fileobj: Optional[BinaryIO]=None,
+                        algo: str='sha256') -> str:
+    """Hash the canonical JSON bytes of a document while encoding it
+
+    If `fileobj` is given, the bytes are written to it at the same time.
+    Returns the hash identifier for `algo`, one of
+    `checksum.HASH_ALGORITHMS`, which is equal to the hash computed
+    by `compute_json_hash`.
+    """
+    # the checksum module imports this one
+    from .checksum import HASH_ALGORITHMS, format_hash
+    hash_obj = HASH_ALGORITHMS[algo][1]()
+    for chunk in iter_canonical_json(json_dict):
+        hash_obj.update(chunk)
+        if fileobj is not None:
+            fileobj.write(chunk)
+    return format_hash(hash_obj.digest(), algo)
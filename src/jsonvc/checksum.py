@@ -1,6 +1,7 @@
-from typing import Callable, Optional
+from typing import Callable, Optional, Union
 import orjson
 import hashlib
+from .canonical_json import dump_canonical_json
 
 
 def is_hexadecimal(numstr: str) -> bool:
@@ -12,8 +13,101 @@ def is_hexadecimal(numstr: str) -> bool:
         return False
 
 
+# multihash code, constructor and digest size of the supported algorithms
+HASH_ALGORITHMS = {
+    'sha256': (0x12, hashlib.sha256, 32),
+    'sha512': (0x13, hashlib.sha512, 64),
+    'sha3-256': (0x16, hashlib.sha3_256, 32),
+    'sha3-512': (0x14, hashlib.sha3_512, 64),
+    'blake2b-256': (0xb220, lambda data=b'': hashlib.blake2b(data, digest_size=32), 32),
+    'blake2b-512': (0xb240, hashlib.blake2b, 64),
+    'blake2s-256': (0xb260, hashlib.blake2s, 32),
+}
+DEFAULT_HASH_ALGORITHM = 'sha256'
+_ALGORITHMS_BY_CODE = {code: algo for algo, (code, _, _) in HASH_ALGORITHMS.items()}
+
+
+def _encode_varint(number: int) -> bytes:
+    encoded = bytearray()
+    while number >= 0x80:
+        encoded.append(number & 0x7f | 0x80)
+        number >>= 7
+    encoded.append(number)
+    return bytes(encoded)
+
+
+def _decode_varint(data: bytes, pos: int):
+    number = 0
+    shift = 0
+    while pos < len(data) and shift < 63:
+        byte = data[pos]
+        number |= (byte & 0x7f) << shift
+        pos += 1
+        if byte < 0x80:
+            return number, pos
+        shift += 7
+    raise ValueError('Invalid varint')
+
+
+def check_hash_algorithm(algo: str) -> None:
+    if algo not in HASH_ALGORITHMS:
+        raise ValueError(f'hash algorithm must be one of ({", ".join(HASH_ALGORITHMS)})')
+
+
+def format_hash(digest: bytes, algo: str=DEFAULT_HASH_ALGORITHM) -> str:
+    """Return the identifier of a digest
+
+    SHA-256 digests are plain hexadecimal strings, as they have always
+    been. Other digests are hex-encoded multihashes, which start with
+    the code of the algorithm and the digest size, so that objects
+    hashed with different algorithms can be told apart.
+    """
+    if algo == 'sha256':
+        return digest.hex()
+    code = HASH_ALGORITHMS[algo][0]
+    return (_encode_varint(code) + _encode_varint(len(digest)) + digest).hex()
+
+
+def get_hash_algorithm(json_hash: str) -> str:
+    """Return the algorithm of a hash identifier
+
+    Raises `ValueError` for identifiers not produced by `format_hash`.
+    """
+    if len(json_hash) == 64 and is_hexadecimal(json_hash):
+        return 'sha256'
+    try:
+        data = bytes.fromhex(json_hash)
+    except ValueError:
+        raise ValueError(f'Hash `{json_hash}` is not hexadecimal')
+    code, pos = _decode_varint(data, 0)
+    size, pos = _decode_varint(data, pos)
+    algo = _ALGORITHMS_BY_CODE.get(code, None)
+    if algo is None or algo == 'sha256' or size != HASH_ALGORITHMS[algo][2] \
+            or len(data) - pos != size:
+        raise ValueError(f'Hash `{json_hash}` is not a supported multihash')
+    return algo
+
+
+def get_hash_header_length(json_hash: str) -> int:
+    """Return the number of characters before the digest in a hash identifier"""
+    algo = get_hash_algorithm(json_hash)
+    return len(json_hash) - 2 * HASH_ALGORITHMS[algo][2]
+
+
+def shorten_hash(json_hash: str, num_chars: int=10) -> str:
+    """Abbreviate a hash identifier, keeping its algorithm prefix"""
+    try:
+        return json_hash[:get_hash_header_length(json_hash) + num_chars]
+    except ValueError:
+        return json_hash[:num_chars]
+
+
 def is_hash_wellformed(numstr: str) -> bool:
-    return is_hexadecimal(numstr) and len(numstr) == 64
+    try:
+        get_hash_algorithm(numstr)
+    except ValueError:
+        return False
+    return True
 
 
 def is_hash_prefix_wellformed(numstr: str) -> bool:
@@ -25,17 +119,58 @@ def get_unique_json_repr(json_dict: dict) -> str:
     return orjson.dumps(json_dict, option=orjson.OPT_SORT_KEYS).decode('utf-8')
 
 
-def compute_hash(data: str, algo='sha256') -> str:
+def compute_bytes_hash(data: bytes, algo: str=DEFAULT_HASH_ALGORITHM) -> str:
+    """Compute the hash identifier of bytes"""
+    return format_hash(HASH_ALGORITHMS[algo][1](data).digest(), algo)
+
+
+def compute_hash(data: str, algo=DEFAULT_HASH_ALGORITHM) -> str:
     """Compute a cryptographic hash of a string"""
-    algo_map = {'sha256': hashlib.sha256}
-    return algo_map[algo](data.encode('utf8')).hexdigest()
+    return compute_bytes_hash(data.encode('utf8'), algo)
 
 
-def compute_json_hash(json_dict: dict, algo='sha256') -> str:
-    """Compute a cryptographic hash for a JSON dictionary"""
-    json_repr = get_unique_json_repr(json_dict)
-    return compute_hash(json_repr, algo)
+def compute_json_hash(json_dict: dict, algo=DEFAULT_HASH_ALGORITHM, streaming: bool=False) -> str:
+    """Compute a cryptographic hash for a JSON dictionary
+
+    With `streaming`, the canonical representation is hashed while it
+    is encoded instead of being built in memory first, which is slower
+    but keeps memory use low for huge documents.
+    """
+    if streaming:
+        return dump_canonical_json(json_dict, algo=algo)
+    return compute_bytes_hash(orjson.dumps(json_dict, option=orjson.OPT_SORT_KEYS), algo)
+
+
+def verify_json_hash(json_dict: dict, json_hash: str) -> bool:
+    """Check a JSON object against a hash computed with any supported algorithm"""
+    try:
+        algo = get_hash_algorithm(json_hash)
+    except ValueError:
+        return False
+    return compute_json_hash(json_dict, algo) == json_hash
 
 
 def normalize_json_dict(json_dict: dict) -> dict:
     return orjson.loads(get_unique_json_repr(json_dict))
+
+
+def pack_hash(json_hash: str) -> Union[bytes, str]:
+    """Return the binary form of a lowercase hexadecimal hash
+
+    Hashes in other formats, e.g. IPFS CIDs, are returned unchanged.
+    """
+    if len(json_hash) % 2 == 0:
+        try:
+            packed = bytes.fromhex(json_hash)
+        except ValueError:
+            return json_hash
+        if packed.hex() == json_hash:
+            return packed
+    return json_hash
+
+
+def unpack_hash(packed_hash: Union[bytes, str]) -> str:
+    """Inverse of `pack_hash`"""
+    if isinstance(packed_hash, bytes):
+        return packed_hash.hex()
+    return packed_hash
@@ -1,12 +1,39 @@
 import os
 import sys
+import io
+import hashlib
 import orjson
+import traceback
+import subprocess
+from contextlib import redirect_stdout, redirect_stderr
 from pathlib import Path
 import argparse
-from .checksum import get_unique_json_repr
-from .storage import LocalJsonStorageProvider
+from .storage import (
+    JsonObjectIndex,
+    LocalJsonStorageProvider,
+    CachedJsonStorageProvider,
+    MemoryJsonStorageProvider,
+)
 from .ipfs_storage import IpfsJsonStorageProvider
+from .ipfs_cid import matches_file_cid
+from .bounded_cache import CACHE_POLICIES, BoundedDirectoryJsonStorageProvider
+from .tiered_storage import (
+    DirectoryJsonStorageProvider,
+    TieredJsonStorageProvider,
+    WriteBackQueue,
+)
+from .sqlite_storage import SqliteJsonStorageProvider
 from .version_control import JsonFileVersionControl
+from .commit_graph import CommitGraph
+from .checksum import HASH_ALGORITHMS, shorten_hash
+from .journal import JournaledStateFile
+from .file_utils import write_file_atomic
+from .batch import run_batch
+from .garbage_collection import collect_garbage
+from .replication import Replicator
+from .bundle import CODEC_IDS as BUNDLE_CODECS, write_bundle, read_bundle
+from .status import get_file_status
+from . import daemon
 from .custom_exceptions import (
     DocAlreadyTrackedError,
     SeveralNodesWithDocError,
@@ -17,6 +44,27 @@ from platformdirs import user_config_dir
 APP_NAME = 'jsonvc'
 CONFIG_FILENAME = 'config.json'
 CACHE_FILENAME = 'cache.json'
+CACHE_JOURNAL_FILENAME = 'cache.journal'
+PATH_INDEX_FILENAME = 'pathindex.json'
+PATH_INDEX_JOURNAL_FILENAME = 'pathindex.journal'
+COMMIT_GRAPH_FILENAME = 'commit-graph.bin'
+# document hashes depend on the storage backend
+# the recorded hashes depend on the backend and the hash algorithm
+FILE_INDEX_FILENAME = 'fileindex-{backend}-{algorithm}.json'
+FILE_INDEX_JOURNAL_FILENAME = 'fileindex-{backend}-{algorithm}.journal'
+# hashes of objects synchronized between storages with different hashes
+SYNC_HASH_MAP_FILENAME = 'syncmap-{src}-{dst}.json'
+# subdirectory of the IPFS cache directory with objects not yet uploaded
+WRITE_BACK_DIRNAME = 'write-back'
+# objects of the histories of the most recently tracked files are not
+# evicted from the IPFS cache unless they take up half of its size
+PINNED_RECENT_NODES = 50
+BYTE_SIZE_SUFFIXES = {'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+# commands that are forwarded to a running daemon
+DAEMON_COMMANDS = (
+    'track', 'istracked', 'update', 'replace', 'showassoc',
+    'showlog', 'showdoc', 'showdiff', 'discover', 'blame',
+)
 
 
 def get_config_dir():
@@ -40,8 +88,7 @@ def read_config_file():
 
 def write_config_file(config_dict):
     config_path = get_config_filepath()
-    with open(config_path, 'wb') as f:
-        f.write(orjson.dumps(config_dict, option=orjson.OPT_INDENT_2))
+    write_file_atomic(config_path, orjson.dumps(config_dict, option=orjson.OPT_INDENT_2))
 
 
 def update_config_file(config_update):
@@ -55,29 +102,96 @@ def get_cache_filepath():
     return os.path.join(config_dir, CACHE_FILENAME)
 
 
-def read_cache_file():
-    cache_path = get_cache_filepath()
-    if not os.path.isfile(cache_path):
-        return {
-            'known_nodes': {},
-            'known_docs': {},
-        }
+def get_cache_journal_filepath():
+    config_dir = get_config_dir()
+    return os.path.join(config_dir, CACHE_JOURNAL_FILENAME)
+
+
+def get_daemon_socket_filepath():
+    config_dir = get_config_dir()
+    return os.path.join(config_dir, daemon.DAEMON_SOCKET_FILENAME)
+
+
+def get_commit_graph_filepath():
+    config_dir = get_config_dir()
+    return os.path.join(config_dir, COMMIT_GRAPH_FILENAME)
+
+
+def _get_storage_spec_id(spec):
+    backend, _, path = spec.partition(':')
+    if not path:
+        return backend
+    path_digest = hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest()
+    return f'{backend}_{path_digest[:12]}'
+
+
+def get_sync_hash_map_filepath(src_spec, dst_spec):
+    filename = SYNC_HASH_MAP_FILENAME.format(
+        src=_get_storage_spec_id(src_spec), dst=_get_storage_spec_id(dst_spec)
+    )
+    return os.path.join(get_config_dir(), filename)
+
+
+def get_cache_state_file():
+    return JournaledStateFile(
+        get_cache_filepath(), get_cache_journal_filepath()
+    )
+
+
+def get_path_index_state_file():
+    config_dir = get_config_dir()
+    return JournaledStateFile(
+        os.path.join(config_dir, PATH_INDEX_FILENAME),
+        os.path.join(config_dir, PATH_INDEX_JOURNAL_FILENAME),
+    )
+
+
+def get_file_index_state_file():
+    config_dir = get_config_dir()
+    config = read_config_file()
+    backend = config.get('storage-backend', 'local')
+    algorithm = config.get('hash-algorithm', 'sha256')
+    return JournaledStateFile(
+        os.path.join(config_dir, FILE_INDEX_FILENAME.format(backend=backend, algorithm=algorithm)),
+        os.path.join(config_dir, FILE_INDEX_JOURNAL_FILENAME.format(backend=backend, algorithm=algorithm)),
+    )
+
+
+def attach_commit_graph(filevc):
+    commit_graph_path = get_commit_graph_filepath()
+    if os.path.isfile(commit_graph_path):
+        filevc.get_cache().attach_commit_graph(CommitGraph(commit_graph_path))
+
+
+def load_cache(filevc):
+    attach_commit_graph(filevc)
+    get_cache_state_file().load(filevc.get_cache())
+    get_file_index_state_file().load(filevc.get_file_index())
+
+
+def load_path_index(filevc, path_index_state_file=None):
+    if path_index_state_file is not None:
+        # kept loaded by the daemon, so only changes by others are read
+        path_index_state_file.refresh(filevc.get_path_index())
     else:
-        with open(cache_path, 'r') as f:
-            return orjson.loads(f.read())
+        get_path_index_state_file().load(filevc.get_path_index())
+
 
+def save_cache(filevc):
+    get_cache_state_file().save(filevc.get_cache())
+    # new entries can be appended without loading the path index
+    get_path_index_state_file().save(filevc.get_path_index())
 
-def write_cache_file(cache_dict):
-    cache_path = get_cache_filepath()
-    jsonstr = get_unique_json_repr(cache_dict)
-    with open(cache_path, 'w') as f:
-        f.write(jsonstr)
+
+def save_file_index(filevc):
+    # also called after read-only commands, which may hash files
+    get_file_index_state_file().save(filevc.get_file_index())
 
 
 def action_track(filename, message, filevc):
     filename = Path(filename)
     node_hash = filevc.track(filename, message)
-    write_cache_file(filevc.get_cache().to_dict())
+    save_cache(filevc)
     print(f'Now tracking file {filename.name}.')
     print(f'Associated node hash: {node_hash}')
     sys.exit(0)
@@ -101,7 +215,7 @@ def action_istracked(filename, filevc):
 def action_update(old_objref, new_objref, message, force, filevc):
     try:
         json_hash = filevc.update(old_objref, new_objref, message, force)
-        write_cache_file(filevc.get_cache().to_dict())
+        save_cache(filevc)
     except DocAlreadyTrackedError:
         print(
             'The new document is already in the system.\n'
@@ -123,7 +237,7 @@ def action_update(old_objref, new_objref, message, force, filevc):
 def action_replace(target_file, update_file, message, force, targethash, filevc):
     try:
         filevc.replace(target_file, update_file, message, force, targethash)
-        write_cache_file(filevc.get_cache().to_dict())
+        save_cache(filevc)
     except DocAlreadyTrackedError:
         print(
             f'The JSON document in {update_file.name} is already in the system.\n'
@@ -148,16 +262,21 @@ def action_showassoc(objref, full_hash, filevc):
     print('The referencd JSON document is associated with the following nodes:')
     messages = filevc.get_messages(objref)
     for h, m in messages.items():
-        sh = h if full_hash else h[:10]
+        sh = h if full_hash else shorten_hash(h)
         print(f'{sh}: {m}')
 
 
-def action_showlog(objref, full_hash, filevc):
+def action_showlog(objref, full_hash, path, filevc, path_index_state_file=None):
     try:
-        log_info = filevc.get_linear_history(objref)
+        if path is None:
+            log_info = filevc.get_linear_history(objref)
+        else:
+            load_path_index(filevc, path_index_state_file)
+            log_info = filevc.get_path_history(objref, path)
+            save_cache(filevc)
         for node in log_info:
             h = node.get_hash()
-            short_hash = h if full_hash else h[:10]
+            short_hash = h if full_hash else shorten_hash(h)
             message = node.get_meta()['message']
             print(f'{short_hash}: {message}')
 
@@ -173,6 +292,16 @@ def action_showlog(objref, full_hash, filevc):
     sys.exit(0)
 
 
+def action_blame(objref, path, full_hash, filevc, path_index_state_file=None):
+    load_path_index(filevc, path_index_state_file)
+    blame_map = filevc.blame(objref, path)
+    save_cache(filevc)
+    for pointer, node_hash in blame_map.items():
+        short_hash = node_hash if full_hash else shorten_hash(node_hash)
+        print(f'{short_hash} {pointer}')
+    sys.exit(0)
+
+
 def action_showdoc(short_hash, json_dumps_args, filevc):
     print(filevc.get_doc(short_hash, json_dumps_args))
     sys.exit(0)
@@ -185,12 +314,239 @@ def action_showdiff(old_short_hash, new_short_hash, json_dumps_args, filevc):
 
 def action_discover(node_hashes, filevc):
     discovered_nodes = filevc.get_cache().discover_nodes(node_hashes)
-    write_cache_file(filevc.get_cache().to_dict())
+    save_cache(filevc)
     print('Discovered nodes:')
     print('\n'.join(discovered_nodes))
     sys.exit(0)
 
 
+def action_batch(filevc):
+    def write_func(result_bytes):
+        sys.stdout.buffer.write(result_bytes)
+        sys.stdout.buffer.flush()
+
+    try:
+        num_failed = run_batch(filevc, sys.stdin.buffer, write_func)
+    finally:
+        save_cache(filevc)
+    sys.exit(0 if num_failed == 0 else 1)
+
+
+def action_status(paths, num_workers, filevc):
+    for file_status in get_file_status(filevc, paths, num_workers):
+        line = f'{file_status.state:10} {file_status.path}'
+        if file_status.state == 'invalid':
+            line += f'  ({file_status.error})'
+        elif file_status.ancestor_hash is not None:
+            line += f'  ({shorten_hash(file_status.ancestor_hash)})'
+        elif len(file_status.node_hashes) > 1:
+            line += f'  ({len(file_status.node_hashes)} nodes)'
+        print(line, flush=True)
+    sys.exit(0)
+
+
+def action_gc(roots, grace_period, dry_run, filevc):
+    # a daemon would keep the removed nodes and objects in memory
+    # and write the nodes back into the cache file
+    if not dry_run and daemon.is_daemon_supported() \
+            and daemon.is_daemon_running(get_daemon_socket_filepath()):
+        print('Please stop the running daemon with `jsonvc daemon stop` first')
+        sys.exit(1)
+    store = filevc.get_storage_provider()
+    if isinstance(store, TieredJsonStorageProvider):
+        # the directory tier caches the remote tier
+        index = next(
+            (t for t in store.get_tiers() if isinstance(t, DirectoryJsonStorageProvider)),
+            None
+        )
+    elif isinstance(store, IpfsJsonStorageProvider):
+        index = store.get_cache_index()
+    elif isinstance(store, JsonObjectIndex):
+        index = store
+    else:
+        index = None
+    if index is None:
+        print('The configured storage backend does not support garbage collection')
+        sys.exit(1)
+    cache = filevc.get_cache()
+    if roots:
+        root_node_hashes = [filevc.get_node_hash(r) for r in roots]
+    else:
+        root_node_hashes = cache.get_node_hashes()
+    removed = collect_garbage(store, index, root_node_hashes, grace_period, dry_run)
+    if dry_run:
+        print(f'{len(removed)} unreachable objects would be removed:')
+        print('\n'.join(removed))
+        sys.exit(0)
+    # with a remote storage, only local copies are removed and the
+    # nodes remain reachable in the storage
+    if roots and index is store:
+        cache_state_file = get_cache_state_file()
+        cache_state_file.load(cache)
+        # removed nodes may be part of the commit graph, which is read-only
+        has_commit_graph = cache.get_commit_graph() is not None
+        cache.detach_commit_graph()
+        cache.remove_nodes(removed)
+        cache_state_file.write(cache)
+        if has_commit_graph:
+            os.remove(get_commit_graph_filepath())
+    print(f'Removed {len(removed)} unreachable objects')
+    sys.exit(0)
+
+
+def action_rebuildbloom(false_positive_rate, store):
+    if not isinstance(store, LocalJsonStorageProvider):
+        print('Bloom filters are only supported by the local storage backend')
+        sys.exit(1)
+    if false_positive_rate is None:
+        false_positive_rate = read_config_file().get('local-bloom-filter-fpr', 'none')
+        if false_positive_rate == 'none':
+            print('Please set the `local-bloom-filter-fpr` variable in the configuration first')
+            sys.exit(1)
+    bloom_filter = store.rebuild_bloom_filter(false_positive_rate)
+    print(
+        f'Rebuilt Bloom filter with {len(bloom_filter)} objects '
+        f'and capacity {bloom_filter.get_capacity()}'
+    )
+    sys.exit(0)
+
+
+def action_flush(filevc):
+    store = filevc.get_storage_provider()
+    if not isinstance(store, TieredJsonStorageProvider):
+        print('The configured storage backend does not use a write-back queue')
+        sys.exit(0)
+    num_pending = store.flush()
+    if num_pending > 0:
+        print(f'{num_pending} objects could not be uploaded yet, please retry later')
+        sys.exit(1)
+    print('All objects uploaded')
+    sys.exit(0)
+
+
+def action_sync(src_spec, dst_spec, roots):
+    src = _setup_storage_provider_from_spec(src_spec)
+    dst = _setup_storage_provider_from_spec(dst_spec)
+    hash_map_path = get_sync_hash_map_filepath(src_spec, dst_spec)
+    hash_map = dict()
+    if os.path.isfile(hash_map_path):
+        with open(hash_map_path, 'rb') as f:
+            hash_map = orjson.loads(f.read())
+    replicator = Replicator(src, dst, hash_map)
+    try:
+        result = replicator.sync(roots)
+    finally:
+        # the hashes of the objects transferred so far allow to resume
+        if len(hash_map) > 0:
+            write_file_atomic(hash_map_path, orjson.dumps(hash_map))
+    print(f'Transferred {result.num_objects} objects, including {result.num_nodes} nodes')
+    for root_hash, dst_hash in result.root_hashes.items():
+        if dst_hash != root_hash:
+            print(f'{root_hash} -> {dst_hash}')
+    if isinstance(dst, TieredJsonStorageProvider) and dst.flush() > 0:
+        print('Some objects could not be uploaded yet, please run `jsonvc flush` later')
+        sys.exit(1)
+    sys.exit(0)
+
+
+def action_bundle_create(filename, heads, base, compression, filevc):
+    head_hashes = [filevc.get_node_hash(h) for h in heads]
+    base_hashes = [filevc.get_node_hash(h) for h in base]
+    with open(filename, 'wb') as f:
+        num_objects = write_bundle(
+            filevc.get_storage_provider(), f, head_hashes, base_hashes, compression
+        )
+    print(f'Wrote {num_objects} objects to {filename}')
+    sys.exit(0)
+
+
+def action_bundle_unbundle(filename, filevc):
+    with open(filename, 'rb') as f:
+        info = read_bundle(filevc.get_storage_provider(), f)
+    filevc.get_cache().discover_nodes(info.heads)
+    save_cache(filevc)
+    print(f'Stored {info.num_objects} objects, heads:')
+    print('\n'.join(info.heads))
+    sys.exit(0)
+
+
+def action_commitgraph(filevc):
+    cache = filevc.get_cache()
+    cache_state_file = get_cache_state_file()
+    cache_state_file.load(cache)
+    cache.write_commit_graph(get_commit_graph_filepath())
+    cache_state_file.write(cache)
+    num_nodes = len(cache.get_commit_graph())
+    print(f'Wrote commit graph with {num_nodes} nodes')
+    sys.exit(0)
+
+
+def action_traindict(dict_size, max_samples, store):
+    if not isinstance(store, LocalJsonStorageProvider):
+        print('Compression dictionaries are only supported by the local storage backend')
+        sys.exit(1)
+    compression = read_config_file().get('local-compression', 'none')
+    if compression == 'none':
+        print('Please set the `local-compression` variable in the configuration first')
+        sys.exit(1)
+    dict_id = store.train_dictionary(dict_size, max_samples, compression)
+    print(f'Trained {compression} dictionary {dict_id:08x}; it will be used for new objects')
+    sys.exit(0)
+
+
+def action_daemon_start():
+    if not daemon.is_daemon_supported():
+        print('The daemon requires support for Unix domain sockets')
+        sys.exit(1)
+    store = CachedJsonStorageProvider(_setup_storage_provider())
+    filevc = JsonFileVersionControl(store, _get_stream_min_size())
+    write_back_queue = _get_write_back_queue(filevc)
+    if write_back_queue is not None:
+        write_back_queue.start()
+    attach_commit_graph(filevc)
+    cache_state_file = get_cache_state_file()
+    cache_state_file.load(filevc.get_cache())
+    get_file_index_state_file().load(filevc.get_file_index())
+    path_index_state_file = get_path_index_state_file()
+    path_index_state_file.load(filevc.get_path_index())
+    setup_cache_pinning(filevc)
+    parser = _prepare_parser()
+    handle_func = lambda request: _handle_daemon_request(
+        request, parser, filevc, cache_state_file, path_index_state_file
+    )
+    socket_path = get_daemon_socket_filepath()
+    server = daemon.JsonVcDaemonServer(socket_path, handle_func)
+    print(f'jsonvc daemon listening on {socket_path}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        cache_state_file.compact(filevc.get_cache())
+        if write_back_queue is not None:
+            write_back_queue.stop()
+    print('jsonvc daemon stopped')
+    sys.exit(0)
+
+
+def action_daemon_stop():
+    response = daemon.send_request(get_daemon_socket_filepath(), {'type': 'shutdown'})
+    if response is None:
+        print('No jsonvc daemon is running')
+        sys.exit(1)
+    print('Requested the jsonvc daemon to stop')
+    sys.exit(0)
+
+
+def action_daemon_status():
+    if daemon.is_daemon_running(get_daemon_socket_filepath()):
+        print(f'A jsonvc daemon is listening on {get_daemon_socket_filepath()}')
+        sys.exit(0)
+    print('No jsonvc daemon is running')
+    sys.exit(1)
+
+
 def action_config_showdir():
     print(get_config_dir())
     sys.exit(0)
@@ -210,18 +566,81 @@ def action_config_set(key, value):
         'ipfs-rpc-url',
         'ipfs-rpc-url-upload',
         'ipfs-cache-dir',
+        'local-compression',
+        'local-compression-level',
+        'hash-algorithm',
+        'local-bloom-filter-fpr',
+        'sqlite-storage-path',
+        'ipfs-write-back',
+        'ipfs-cache-max-bytes',
+        'ipfs-cache-policy',
+        'ipfs-cache-verify',
+        'stream-hash-min-bytes',
     )
     if key not in allowed_keys:
         print(f'key must be in ({", ".join(allowed_keys)})')
         sys.exit(1)
     if key == 'storage-backend':
-        allowed_values = ('local', 'ipfs')
+        allowed_values = ('local', 'ipfs', 'sqlite')
         if value not in allowed_values:
             print(f'value must be in ({", ".join(allowed_values)})')
             sys.exit(1)
+    if key in ('ipfs-write-back', 'ipfs-cache-verify'):
+        allowed_values = ('on', 'off')
+        if value not in allowed_values:
+            print(f'value must be in ({", ".join(allowed_values)})')
+            sys.exit(1)
+    if key == 'ipfs-cache-policy':
+        if value not in CACHE_POLICIES:
+            print(f'value must be in ({", ".join(CACHE_POLICIES)})')
+            sys.exit(1)
+    if key in ('ipfs-cache-max-bytes', 'stream-hash-min-bytes') and value != 'none':
+        value = _parse_byte_size(value)
+        if value is None:
+            print('value must be `none` or a positive number of bytes, optionally with suffix K, M, G or T')
+            sys.exit(1)
+    if key == 'local-compression':
+        allowed_values = ('none', 'zlib', 'zstd')
+        if value not in allowed_values:
+            print(f'value must be in ({", ".join(allowed_values)})')
+            sys.exit(1)
+    if key == 'hash-algorithm':
+        if value not in HASH_ALGORITHMS:
+            print(f'value must be in ({", ".join(HASH_ALGORITHMS)})')
+            sys.exit(1)
+    if key == 'local-compression-level':
+        try:
+            value = int(value)
+        except ValueError:
+            print('value must be an integer')
+            sys.exit(1)
+    if key == 'local-bloom-filter-fpr' and value != 'none':
+        try:
+            value = float(value)
+        except ValueError:
+            value = None
+        if value is None or not 0 < value < 1:
+            print('value must be `none` or a number between 0 and 1')
+            sys.exit(1)
     update_config_file({key: value})
 
 
+def _get_stream_min_size():
+    stream_min_size = read_config_file().get('stream-hash-min-bytes', 'none')
+    return None if stream_min_size == 'none' else stream_min_size
+
+
+def _parse_byte_size(value):
+    factor = BYTE_SIZE_SUFFIXES.get(value[-1:].upper(), None)
+    if factor is not None:
+        value = value[:-1]
+    try:
+        num_bytes = int(float(value) * (1 if factor is None else factor))
+    except ValueError:
+        return None
+    return num_bytes if num_bytes > 0 else None
+
+
 def _add_json_dumps_args(parser):
     parser.add_argument('--indent', action='store_true', help='Enable indent for JSON output formatting')
 
@@ -233,6 +652,7 @@ def _add_message_arg(parser):
 def _prepare_parser():
     parser = argparse.ArgumentParser(description="Command line tool for tracking JSON files")
     parser.add_argument('-d', '--debug', action='store_true', help='Enable developer debug output')
+    parser.add_argument('--no-daemon', action='store_true', help='Do not forward the command to a running daemon')
 
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
 
@@ -266,6 +686,12 @@ def _prepare_parser():
     showlog_parser = subparsers.add_parser('showlog', help='Show history of a file')
     showlog_parser.add_argument('--full-hash', action='store_true', help='Show full hash in output')
     showlog_parser.add_argument('objref', type=str, help='JSON document whose history is desired')
+    showlog_parser.add_argument('--path', type=str, help='Only show nodes modifying the value at this JSON Pointer')
+
+    blame_parser = subparsers.add_parser('blame', help='Show the node that last modified each value of a JSON document')
+    blame_parser.add_argument('objref', type=str, help='JSON document reference')
+    blame_parser.add_argument('path', type=str, nargs='?', default='', help='JSON Pointer to restrict the output to')
+    blame_parser.add_argument('--full-hash', action='store_true', help='Show full hash in output')
 
     showdoc_parser = subparsers.add_parser('showdoc', help='Print json object on stdout')
     showdoc_parser.add_argument('objref', type=str, help='JSON document reference')
@@ -279,7 +705,38 @@ def _prepare_parser():
     discover_parser = subparsers.add_parser('discover', help='Discover tracking nodes starting from seed nodes')
     discover_parser.add_argument('node_hashes', nargs='+', help='List with seed node hashes')
 
+    status_parser = subparsers.add_parser('status', help='Show which JSON files are unchanged, modified or untracked')
+    status_parser.add_argument('paths', nargs='*', default=['.'], help='Files and directories to inspect (default: current directory)')
+    status_parser.add_argument('--jobs', type=int, help='Number of processes for hashing files (default: number of CPUs)')
+
+    gc_parser = subparsers.add_parser('gc', help='Remove stored objects not reachable from tracked nodes')
+    gc_parser.add_argument('--roots', nargs='+', help='Keep only objects reachable from these nodes (default: all cached nodes)')
+    gc_parser.add_argument('--grace-period', type=float, default=3600, help='Keep objects stored less than this many seconds ago')
+    gc_parser.add_argument('--dry-run', action='store_true', help='Only list the objects that would be removed')
+
+    rebuildbloom_parser = subparsers.add_parser('rebuildbloom', help='Rebuild the Bloom filter over the stored objects (local only)')
+    rebuildbloom_parser.add_argument('--fpr', type=float, help='False positive rate (default: configuration value)')
+
+    flush_parser = subparsers.add_parser('flush', help='Upload the objects in the write-back queue now (IPFS only)')
+    flush_parser.add_argument('--provide', action='store_true', help='Provide uploaded files to peers')
+
+    sync_parser = subparsers.add_parser('sync', help='Copy the histories of nodes to another storage')
+    sync_parser.add_argument('src', type=str, help='The source storage: local[:PATH], sqlite[:PATH] or ipfs')
+    sync_parser.add_argument('dst', type=str, help='The destination storage: local[:PATH], sqlite[:PATH] or ipfs')
+    sync_parser.add_argument('--roots', nargs='+', required=True, help='Hashes of the nodes whose histories are copied')
+
+    subparsers.add_parser('commitgraph', help='Move the cached node graph into a memory-mapped binary file')
+
+    traindict_parser = subparsers.add_parser('traindict', help='Train a compression dictionary from stored objects (local only)')
+    traindict_parser.add_argument('--size', type=int, default=64*1024, help='Dictionary size in bytes')
+    traindict_parser.add_argument('--samples', type=int, default=2000, help='Maximum number of sampled objects')
+
+    batch_parser = subparsers.add_parser('batch', help='Execute JSON-lines operations read from stdin')
+    batch_parser.add_argument('--provide', action='store_true', help='Provide files to peers (IPFS only)')
+
     _prepare_config_subparser(subparsers)
+    _prepare_daemon_subparser(subparsers)
+    _prepare_bundle_subparser(subparsers)
     return parser
 
 
@@ -293,8 +750,28 @@ def _prepare_config_subparser(subparsers):
     set_parser.add_argument('value', help='value')
 
 
-def _setup_local_storage_provider(config):
-    if 'JSON_STORAGE_PATH' not in os.environ:
+def _prepare_daemon_subparser(subparsers):
+    daemon_parser = subparsers.add_parser('daemon', help='Management of the resident jsonvc server')
+    subparsers = daemon_parser.add_subparsers(dest='daemon_command', help='Available commands')
+    subparsers.add_parser('start', help='Run the daemon in the foreground (restart it after configuration changes)')
+    subparsers.add_parser('stop', help='Stop the running daemon')
+    subparsers.add_parser('status', help='Show if a daemon is running')
+
+
+def _prepare_bundle_subparser(subparsers):
+    bundle_parser = subparsers.add_parser('bundle', help='Move histories as a single file')
+    subparsers = bundle_parser.add_subparsers(dest='bundle_command', help='Available commands')
+    create_parser = subparsers.add_parser('create', help='Write the histories of nodes to a bundle file')
+    create_parser.add_argument('filename', type=str, help='The bundle file to write')
+    create_parser.add_argument('--heads', nargs='+', required=True, help='The nodes whose histories are bundled')
+    create_parser.add_argument('--base', nargs='+', default=[], help='Leave out the histories of these nodes, which the recipient must have')
+    create_parser.add_argument('--compression', choices=list(BUNDLE_CODECS), default='zlib', help='Compression of the bundle')
+    unbundle_parser = subparsers.add_parser('unbundle', help='Verify and store the objects of a bundle file')
+    unbundle_parser.add_argument('filename', type=str, help='The bundle file to read')
+
+
+def _setup_local_storage_provider(config, storage_path=None):
+    if storage_path is None and 'JSON_STORAGE_PATH' not in os.environ:
         storage_path = config.get('local-storage-path', None)
         if storage_path is None:
             print(
@@ -303,7 +780,7 @@ def _setup_local_storage_provider(config):
                 '`local-storage-path` variable in the configuration'
             )
             sys.exit(1)
-    else:
+    elif storage_path is None:
         storage_path = os.environ['JSON_STORAGE_PATH']
 
     storage_path = Path(storage_path)
@@ -315,7 +792,27 @@ def _setup_local_storage_provider(config):
             'set the `local-storage-path` variable in the configuration'
         )
         sys.exit(1)
-    return LocalJsonStorageProvider(storage_path)
+    compression = config.get('local-compression', 'none')
+    compression = None if compression == 'none' else compression
+    compression_level = config.get('local-compression-level', None)
+    bloom_filter_fpr = config.get('local-bloom-filter-fpr', 'none')
+    bloom_filter_fpr = None if bloom_filter_fpr == 'none' else bloom_filter_fpr
+    hash_algorithm = config.get('hash-algorithm', 'sha256')
+    return LocalJsonStorageProvider(
+        storage_path, compression, compression_level, bloom_filter_fpr, hash_algorithm
+    )
+
+
+def _setup_sqlite_storage_provider(config):
+    storage_path = config.get('sqlite-storage-path', None)
+    if storage_path is None:
+        print('Please set variable `sqlite-storage-path` in configuration')
+        sys.exit(1)
+    if not os.path.isdir(os.path.dirname(os.path.abspath(storage_path))):
+        print(f'The directory of the database file `{storage_path}` does not exist')
+        sys.exit(1)
+    hash_algorithm = config.get('hash-algorithm', 'sha256')
+    return SqliteJsonStorageProvider(storage_path, hash_algorithm=hash_algorithm)
 
 
 def _setup_ipfs_storage_provider(config):
@@ -328,10 +825,36 @@ def _setup_ipfs_storage_provider(config):
     if var_missing:
         sys.exit(1)
     ipfs_rpc_url_upload = config.get('ipfs-rpc-url-upload', None)
-    return IpfsJsonStorageProvider(
-        *(config[v] for v in req_vars),
+    # several comma-separated gateways are used with hedged requests
+    gateway_url = config['ipfs-gateway-url']
+    if ',' in gateway_url:
+        gateway_url = [u.strip() for u in gateway_url.split(',') if u.strip()]
+    cache_max_bytes = config.get('ipfs-cache-max-bytes', 'none')
+    cache_max_bytes = None if cache_max_bytes == 'none' else cache_max_bytes
+    cache_policy = config.get('ipfs-cache-policy', 'lru')
+    cache_verify = config.get('ipfs-cache-verify', 'off') == 'on'
+    if config.get('ipfs-write-back', 'off') == 'off':
+        return IpfsJsonStorageProvider(
+            config['ipfs-cache-dir'], gateway_url, config['ipfs-rpc-url'],
+            rpc_api_url_upload=ipfs_rpc_url_upload, cache_max_bytes=cache_max_bytes,
+            cache_policy=cache_policy, cache_verify=cache_verify
+        )
+    # the cache directory becomes a tier of its own
+    cache_dir = Path(config['ipfs-cache-dir'])
+    remote = IpfsJsonStorageProvider(
+        None, gateway_url, config['ipfs-rpc-url'],
         rpc_api_url_upload=ipfs_rpc_url_upload
     )
+    tiers = [
+        MemoryJsonStorageProvider(remote.compute_hash, max_objects=10000),
+        BoundedDirectoryJsonStorageProvider(
+            cache_dir, remote.compute_hash, cache_max_bytes, cache_policy,
+            verify_func=matches_file_cid if cache_verify else None
+        ),
+        remote,
+    ]
+    queue = WriteBackQueue(cache_dir / WRITE_BACK_DIRNAME, remote)
+    return TieredJsonStorageProvider(tiers, queue)
 
 
 def _setup_storage_provider():
@@ -340,6 +863,28 @@ def _setup_storage_provider():
         return _setup_local_storage_provider(config)
     elif config['storage-backend'] == 'ipfs':
         return _setup_ipfs_storage_provider(config)
+    elif config['storage-backend'] == 'sqlite':
+        return _setup_sqlite_storage_provider(config)
+
+
+def _setup_storage_provider_from_spec(spec):
+    """Set up a storage from a backend name, optionally with a path
+
+    `local` and `sqlite` may be followed by a colon and the path of the
+    storage, which defaults to the one in the configuration.
+    """
+    config = read_config_file()
+    backend, _, path = spec.partition(':')
+    if backend == 'local':
+        return _setup_local_storage_provider(config, path or None)
+    elif backend == 'sqlite':
+        if path:
+            config['sqlite-storage-path'] = path
+        return _setup_sqlite_storage_provider(config)
+    elif backend == 'ipfs' and not path:
+        return _setup_ipfs_storage_provider(config)
+    print(f'Invalid storage `{spec}`, use `local[:PATH]`, `sqlite[:PATH]` or `ipfs`')
+    sys.exit(1)
 
 
 def _perform_config_action(args):
@@ -354,11 +899,91 @@ def _perform_config_action(args):
     return
 
 
-def _perform_regular_action(args, filevc):
+def _perform_daemon_action(args):
+    if args.daemon_command == 'start':
+        action_daemon_start()
+    elif args.daemon_command == 'stop':
+        action_daemon_stop()
+    elif args.daemon_command == 'status':
+        action_daemon_status()
+    else:
+        print('Unknown daemon command. Use --help for usage')
+    return
+
+
+def _get_ipfs_storage_provider(filevc):
+    storeprov = filevc.get_storage_provider()
+    if isinstance(storeprov, CachedJsonStorageProvider):
+        storeprov = storeprov.get_backend()
+    if isinstance(storeprov, TieredJsonStorageProvider):
+        storeprov = storeprov.get_tiers()[-1]
+    if isinstance(storeprov, IpfsJsonStorageProvider):
+        return storeprov
+    return None
+
+
+def _get_bounded_cache(filevc):
+    storeprov = filevc.get_storage_provider()
+    if isinstance(storeprov, CachedJsonStorageProvider):
+        storeprov = storeprov.get_backend()
+    if isinstance(storeprov, TieredJsonStorageProvider):
+        return next(
+            (t for t in storeprov.get_tiers() if isinstance(t, BoundedDirectoryJsonStorageProvider)),
+            None
+        )
+    if isinstance(storeprov, IpfsJsonStorageProvider):
+        return storeprov.get_cache()
+    return None
+
+
+def setup_cache_pinning(filevc):
+    """Keep the histories of recently tracked files in the IPFS cache"""
+    cache = _get_bounded_cache(filevc)
+    if cache is None or cache.get_max_bytes() is None:
+        return
+    file_index = filevc.get_file_index()
+    cache.set_pinned_func(lambda: cache.find_reachable_objects(
+        file_index.get_recent_tracked_nodes(PINNED_RECENT_NODES),
+        cache.get_max_bytes() // 2
+    ))
+
+
+def save_cache_index(filevc):
+    cache = _get_bounded_cache(filevc)
+    if cache is not None:
+        cache.save_index()
+
+
+def _get_write_back_queue(filevc):
+    storeprov = filevc.get_storage_provider()
+    if isinstance(storeprov, CachedJsonStorageProvider):
+        storeprov = storeprov.get_backend()
+    if isinstance(storeprov, TieredJsonStorageProvider):
+        return storeprov.get_write_back_queue()
+    return None
+
+
+def _start_background_flush(args, filevc):
+    """Upload queued objects in a detached process after the command"""
+    write_back_queue = _get_write_back_queue(filevc)
+    if args.command == 'flush' or write_back_queue is None:
+        return
+    if len(write_back_queue.get_pending()) == 0:
+        return
+    argv = [sys.executable, '-m', 'jsonvc.cmd', '--no-daemon', 'flush']
+    if getattr(args, 'provide', False):
+        argv.append('--provide')
+    subprocess.Popen(
+        argv, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL, start_new_session=True
+    )
+
+
+def _perform_regular_action(args, filevc, path_index_state_file=None):
     activate_provie = lambda: None
     if hasattr(args, 'provide') and args.provide:
-        storeprov = filevc.get_storage_provider()
-        if isinstance(storeprov, IpfsJsonStorageProvider):
+        storeprov = _get_ipfs_storage_provider(filevc)
+        if storeprov is not None:
             storeprov.enable_provide()
 
     if args.command == 'track':
@@ -372,7 +997,9 @@ def _perform_regular_action(args, filevc):
     elif args.command == 'showassoc':
         action_showassoc(args.objref, args.full_hash, filevc)
     elif args.command == 'showlog':
-        action_showlog(args.objref, args.full_hash, filevc)
+        action_showlog(args.objref, args.full_hash, args.path, filevc, path_index_state_file)
+    elif args.command == 'blame':
+        action_blame(args.objref, args.path, args.full_hash, filevc, path_index_state_file)
     elif args.command == 'showdoc':
         json_dumps_args = {'indent': args.indent}
         action_showdoc(args.objref, json_dumps_args, filevc)
@@ -383,20 +1010,112 @@ def _perform_regular_action(args, filevc):
         )
     elif args.command == 'discover':
         action_discover(args.node_hashes, filevc)
+    elif args.command == 'batch':
+        action_batch(filevc)
+    elif args.command == 'status':
+        action_status(args.paths, args.jobs, filevc)
+    elif args.command == 'gc':
+        action_gc(args.roots, args.grace_period, args.dry_run, filevc)
+    elif args.command == 'rebuildbloom':
+        action_rebuildbloom(args.fpr, filevc.get_storage_provider())
+    elif args.command == 'flush':
+        action_flush(filevc)
+    elif args.command == 'bundle':
+        if args.bundle_command == 'create':
+            action_bundle_create(args.filename, args.heads, args.base, args.compression, filevc)
+        elif args.bundle_command == 'unbundle':
+            action_bundle_unbundle(args.filename, filevc)
+        else:
+            print('Unknown bundle command. Use --help for usage')
+    elif args.command == 'sync':
+        action_sync(args.src, args.dst, args.roots)
+    elif args.command == 'commitgraph':
+        action_commitgraph(filevc)
+    elif args.command == 'traindict':
+        action_traindict(args.size, args.samples, filevc.get_storage_provider())
     else:
         print('Unknown command. Use --help for usage.')
 
 
+def _handle_daemon_request(request, parser, filevc, cache_state_file, path_index_state_file):
+    if request.get('storage_path_env') != os.environ.get('JSON_STORAGE_PATH'):
+        # the client expects another storage location than the daemon serves
+        return {'status': 'rejected'}
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    exit_code = 0
+    debug = False
+    daemon_cwd = os.getcwd()
+    with redirect_stdout(stdout), redirect_stderr(stderr):
+        try:
+            os.chdir(request['cwd'])
+            args = parser.parse_args(request['argv'])
+            debug = args.debug
+            cache_state_file.refresh(filevc.get_cache())
+            _perform_regular_action(args, filevc, path_index_state_file)
+        except SystemExit as exc:
+            if exc.code is None:
+                exit_code = 0
+            elif isinstance(exc.code, int):
+                exit_code = exc.code
+            else:
+                print(exc.code, file=sys.stderr)
+                exit_code = 1
+        except Exception as exc:
+            if debug:
+                traceback.print_exc()
+            print(str(exc))
+            exit_code = 1
+        finally:
+            os.chdir(daemon_cwd)
+            save_file_index(filevc)
+            save_cache_index(filevc)
+            storeprov = _get_ipfs_storage_provider(filevc)
+            if storeprov is not None:
+                storeprov.disable_provide()
+    return {
+        'status': 'ok',
+        'stdout': stdout.getvalue(),
+        'stderr': stderr.getvalue(),
+        'exit_code': exit_code,
+    }
+
+
+def _forward_to_daemon(args):
+    if args.no_daemon or args.command not in DAEMON_COMMANDS:
+        return
+    request = {
+        'type': 'command',
+        'argv': sys.argv[1:],
+        'cwd': os.getcwd(),
+        'storage_path_env': os.environ.get('JSON_STORAGE_PATH'),
+    }
+    response = daemon.send_request(get_daemon_socket_filepath(), request)
+    if response is None or response['status'] != 'ok':
+        return
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    sys.exit(response['exit_code'])
+
+
 def _perform_action(args):
     if args.command == 'config':
         return _perform_config_action(args)
+    if args.command == 'daemon':
+        return _perform_daemon_action(args)
+    _forward_to_daemon(args)
 
-    cache_dict = read_cache_file()
     store = _setup_storage_provider()
-    filevc = JsonFileVersionControl(store)
-    filevc.get_cache().from_dict(cache_dict)
+    filevc = JsonFileVersionControl(store, _get_stream_min_size())
+    load_cache(filevc)
+    setup_cache_pinning(filevc)
 
-    _perform_regular_action(args, filevc)
+    try:
+        _perform_regular_action(args, filevc)
+    finally:
+        save_file_index(filevc)
+        save_cache_index(filevc)
+        _start_background_flush(args, filevc)
 
 
 def main():
@@ -0,0 +1,268 @@
+import sys
+import mmap
+import struct
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from .file_utils import write_file_atomic
+
+
+COMMIT_GRAPH_MAGIC = b'JVCGRAPH'
+COMMIT_GRAPH_VERSION = 1
+HASH_WIDTH = 32
+# magic, version, byte order, hash width, nodes, parent entries, documents
+_HEADER = struct.Struct('<8sIBxxxIIII')
+_BYTEORDER_IDS = {'little': 0, 'big': 1}
+
+
+def encode_hash(json_hash: str) -> Optional[bytes]:
+    """Convert a hash to its binary form if it fits into the graph"""
+    if len(json_hash) != 2 * HASH_WIDTH:
+        return None
+    try:
+        return bytes.fromhex(json_hash)
+    except ValueError:
+        return None
+
+
+def _pad(data: bytes) -> bytes:
+    return data + b'\0' * (-len(data) % 8)
+
+
+def write_commit_graph(filepath: Path, known_nodes: Dict[str, Set[str]],
+                       node_docs: Dict[str, str]) -> Set[str]:
+    """Write a binary snapshot of the node graph
+
+    `known_nodes` maps node hashes to the hashes of their source nodes
+    and `node_docs` maps node hashes to their document hashes. Nodes
+    are only included if their own hash, their document hash and all
+    their source nodes can be represented in the snapshot. Returns
+    the hashes of the included nodes.
+    """
+    # include nodes only after all their source nodes, visiting
+    # each node once in topological order
+    children = {}
+    num_pending_parents = {}
+    ready = []
+    for node_hash, parents in known_nodes.items():
+        num_pending_parents[node_hash] = len(parents)
+        if len(parents) == 0:
+            ready.append(node_hash)
+        for parent in parents:
+            children.setdefault(parent, []).append(node_hash)
+    included = {}
+    while len(ready) > 0:
+        node_hash = ready.pop()
+        doc_hash = node_docs.get(node_hash, None)
+        if encode_hash(node_hash) is None or doc_hash is None \
+                or encode_hash(doc_hash) is None:
+            # and thereby all its descendants
+            continue
+        parents = known_nodes[node_hash]
+        included[node_hash] = 1 + max((included[p] for p in parents), default=0)
+        for child in children.get(node_hash, ()):
+            num_pending_parents[child] -= 1
+            if num_pending_parents[child] == 0:
+                ready.append(child)
+
+    node_hashes = sorted(included)
+    node_ids = {h: i for i, h in enumerate(node_hashes)}
+    doc_hashes = sorted({node_docs[h] for h in node_hashes})
+    doc_ids = {h: i for i, h in enumerate(doc_hashes)}
+
+    parent_offsets = array('i', [0])
+    parent_ids = array('i')
+    generations = array('i')
+    node_doc_ids = array('i')
+    doc_nodes = [[] for _ in doc_hashes]
+    for node_id, node_hash in enumerate(node_hashes):
+        parent_ids.extend(sorted(node_ids[p] for p in known_nodes[node_hash]))
+        parent_offsets.append(len(parent_ids))
+        generations.append(included[node_hash])
+        doc_id = doc_ids[node_docs[node_hash]]
+        node_doc_ids.append(doc_id)
+        doc_nodes[doc_id].append(node_id)
+    doc_node_offsets = array('i', [0])
+    doc_node_ids = array('i')
+    for node_id_list in doc_nodes:
+        doc_node_ids.extend(node_id_list)
+        doc_node_offsets.append(len(doc_node_ids))
+
+    header = _HEADER.pack(
+        COMMIT_GRAPH_MAGIC, COMMIT_GRAPH_VERSION, _BYTEORDER_IDS[sys.byteorder],
+        HASH_WIDTH, len(node_hashes), len(parent_ids), len(doc_hashes)
+    )
+    sections = [
+        header,
+        b''.join(bytes.fromhex(h) for h in node_hashes),
+        parent_offsets.tobytes(),
+        parent_ids.tobytes(),
+        generations.tobytes(),
+        node_doc_ids.tobytes(),
+        b''.join(bytes.fromhex(h) for h in doc_hashes),
+        doc_node_offsets.tobytes(),
+        doc_node_ids.tobytes(),
+    ]
+    write_file_atomic(filepath, b''.join(_pad(s) for s in sections))
+    return set(node_hashes)
+
+
+class _HashTable:
+    """Sorted fixed-width binary hashes in a buffer, searchable by bisection"""
+
+    def __init__(self, buf: memoryview, count: int):
+        self._buf = buf
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> bytes:
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return bytes(self._buf[i*HASH_WIDTH:(i+1)*HASH_WIDTH])
+
+    def find(self, hash_bytes: bytes) -> Optional[int]:
+        i = bisect_left(self, hash_bytes)
+        if i < self._count and self[i] == hash_bytes:
+            return i
+        return None
+
+    def find_prefix_range(self, hex_prefix: str) -> Tuple[int, int]:
+        low = bytes.fromhex(hex_prefix.ljust(2 * HASH_WIDTH, '0'))
+        high = bytes.fromhex(hex_prefix.ljust(2 * HASH_WIDTH, 'f'))
+        start = bisect_left(self, low)
+        end = bisect_left(self, high)
+        if end < self._count and self[end] == high:
+            end += 1
+        return start, end
+
+
+class CommitGraph:
+    """Read-only memory-mapped snapshot of the node graph
+
+    Nodes and documents are identified internally by their position
+    in the sorted hash tables. Since the file is mapped and not read,
+    opening a snapshot takes constant time and the pages are shared
+    by all processes using it.
+    """
+
+    def __init__(self, filepath: Path):
+        with open(filepath, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mmap)
+        (magic, version, byteorder, hash_width, num_nodes,
+         num_parent_entries, num_docs) = _HEADER.unpack_from(buf)
+        if magic != COMMIT_GRAPH_MAGIC or version != COMMIT_GRAPH_VERSION:
+            raise ValueError(f'{filepath} is not a commit graph file of version {COMMIT_GRAPH_VERSION}')
+        if byteorder != _BYTEORDER_IDS[sys.byteorder] or hash_width != HASH_WIDTH:
+            raise ValueError(f'{filepath} was written on an incompatible platform')
+        self._num_nodes = num_nodes
+        self._views = [buf]
+        offset = len(_pad(b'\0' * _HEADER.size))
+
+        def take(size):
+            nonlocal offset
+            section = buf[offset:offset+size]
+            offset += size + (-size % 8)
+            self._views.append(section)
+            return section
+
+        self._node_hashes = _HashTable(take(num_nodes * HASH_WIDTH), num_nodes)
+        self._parent_offsets = take(4 * (num_nodes + 1)).cast('i')
+        self._parent_ids = take(4 * num_parent_entries).cast('i')
+        self._generations = take(4 * num_nodes).cast('i')
+        self._node_doc_ids = take(4 * num_nodes).cast('i')
+        self._doc_hashes = _HashTable(take(num_docs * HASH_WIDTH), num_docs)
+        self._doc_node_offsets = take(4 * (num_docs + 1)).cast('i')
+        self._doc_node_ids = take(4 * num_nodes).cast('i')
+
+    def __len__(self) -> int:
+        return self._num_nodes
+
+    def find_node_id(self, node_hash: str) -> Optional[int]:
+        hash_bytes = encode_hash(node_hash)
+        if hash_bytes is None:
+            return None
+        return self._node_hashes.find(hash_bytes)
+
+    def get_node_hash(self, node_id: int) -> str:
+        return self._node_hashes[node_id].hex()
+
+    def get_parent_ids(self, node_id: int) -> List[int]:
+        start = self._parent_offsets[node_id]
+        end = self._parent_offsets[node_id + 1]
+        return self._parent_ids[start:end].tolist()
+
+    def get_generation(self, node_id: int) -> int:
+        return self._generations[node_id]
+
+    def get_doc_hash(self, node_id: int) -> str:
+        return self._doc_hashes[self._node_doc_ids[node_id]].hex()
+
+    def find_doc_node_ids(self, doc_hash: str) -> List[int]:
+        hash_bytes = encode_hash(doc_hash)
+        doc_id = None if hash_bytes is None else self._doc_hashes.find(hash_bytes)
+        if doc_id is None:
+            return []
+        start = self._doc_node_offsets[doc_id]
+        end = self._doc_node_offsets[doc_id + 1]
+        return self._doc_node_ids[start:end].tolist()
+
+    def find_node_ids_by_prefix(self, hex_prefix: str) -> range:
+        if len(hex_prefix) > 2 * HASH_WIDTH:
+            return range(0)
+        try:
+            start, end = self._node_hashes.find_prefix_range(hex_prefix.lower())
+        except ValueError:
+            return range(0)
+        return range(start, end)
+
+    def iter_node_hashes(self) -> Iterator[str]:
+        for node_id in range(self._num_nodes):
+            yield self.get_node_hash(node_id)
+
+    def iter_doc_hashes(self) -> Iterator[str]:
+        for doc_id in range(len(self._doc_hashes)):
+            yield self._doc_hashes[doc_id].hex()
+
+    def get_linear_history_ids(self, node_id: int) -> List[int]:
+        """Follow single source nodes back to a root, newest first
+
+        The walk stops at the first node with several source nodes,
+        which is the last element of the returned list.
+        """
+        history = [node_id]
+        parent_ids = self.get_parent_ids(node_id)
+        while len(parent_ids) == 1:
+            history.append(parent_ids[0])
+            parent_ids = self.get_parent_ids(parent_ids[0])
+        return history
+
+    def is_ancestor(self, ancestor_id: int, node_id: int) -> bool:
+        """Check if `ancestor_id` is reachable from `node_id` via source nodes"""
+        target_generation = self._generations[ancestor_id]
+        visited = set()
+        pending = [node_id]
+        while len(pending) > 0:
+            cur_id = pending.pop()
+            if cur_id == ancestor_id:
+                return True
+            # generations strictly decrease along source edges
+            if cur_id in visited or self._generations[cur_id] <= target_generation:
+                continue
+            visited.add(cur_id)
+            pending.extend(self.get_parent_ids(cur_id))
+        return False
+
+    def close(self) -> None:
+        views = [
+            self._parent_offsets, self._parent_ids, self._generations,
+            self._node_doc_ids, self._doc_node_offsets, self._doc_node_ids,
+        ]
+        for view in views + self._views[::-1]:
+            view.release()
+        self._node_hashes = None
+        self._doc_hashes = None
+        self._mmap.close()
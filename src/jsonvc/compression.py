@@ -0,0 +1,129 @@
+import re
+import zlib
+import struct
+import hashlib
+from collections import Counter
+from typing import Callable, Iterable, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Compressed objects start with a byte sequence that can never
+# start a JSON document, so they can be told apart from the
+# uncompressed objects written by earlier versions.
+COMPRESSION_MAGIC = b'\x89JVC'
+_HEADER = struct.Struct('>4sBI')
+CODEC_IDS = {'zlib': 1, 'zstd': 2}
+CODEC_NAMES = {v: k for k, v in CODEC_IDS.items()}
+# deflate can only refer back 32 KiB, so larger dictionaries are useless
+ZLIB_MAX_DICT_SIZE = 32 * 1024
+
+
+def check_codec_available(codec: str) -> None:
+    if codec not in CODEC_IDS:
+        raise ValueError(f'compression must be one of ({", ".join(CODEC_IDS)})')
+    if codec == 'zstd' and zstandard is None:
+        raise ImportError(
+            'zstd compression requires the `zstandard` package---'
+            'install it with `pip install zstandard`'
+        )
+
+
+def is_compressed(data: bytes) -> bool:
+    return data[:len(COMPRESSION_MAGIC)] == COMPRESSION_MAGIC
+
+
+def compute_dictionary_id(dictionary: bytes) -> int:
+    """Derive the 32-bit identifier recorded in compressed objects"""
+    dict_id = int.from_bytes(hashlib.sha256(dictionary).digest()[:4], 'big')
+    # zero is reserved for objects compressed without dictionary
+    return dict_id if dict_id != 0 else 1
+
+
+def compress(data: bytes, codec: str, level: Optional[int]=None,
+             dictionary: Optional[bytes]=None) -> bytes:
+    """Compress bytes and prepend the header identifying codec and dictionary"""
+    check_codec_available(codec)
+    dict_id = compute_dictionary_id(dictionary) if dictionary else 0
+    if codec == 'zlib':
+        level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+        if dictionary:
+            compressor = zlib.compressobj(level, zdict=dictionary[-ZLIB_MAX_DICT_SIZE:])
+        else:
+            compressor = zlib.compressobj(level)
+        payload = compressor.compress(data) + compressor.flush()
+    else:
+        kwargs = {'level': 3 if level is None else level}
+        if dictionary:
+            kwargs['dict_data'] = zstandard.ZstdCompressionDict(dictionary)
+        payload = zstandard.ZstdCompressor(**kwargs).compress(data)
+    header = _HEADER.pack(COMPRESSION_MAGIC, CODEC_IDS[codec], dict_id)
+    return header + payload
+
+
+def decompress(data: bytes, load_dictionary: Optional[Callable[[int], bytes]]=None) -> bytes:
+    """Decompress bytes produced by `compress`
+
+    `load_dictionary` is invoked with the dictionary identifier if
+    the data was compressed with a dictionary.
+    """
+    magic, codec_id, dict_id = _HEADER.unpack_from(data)
+    if magic != COMPRESSION_MAGIC:
+        raise ValueError('data has not been compressed by jsonvc')
+    if codec_id not in CODEC_NAMES:
+        raise ValueError(f'unknown compression codec {codec_id}')
+    codec = CODEC_NAMES[codec_id]
+    check_codec_available(codec)
+    dictionary = None
+    if dict_id != 0:
+        if load_dictionary is None:
+            raise ValueError('data was compressed with a dictionary but none was provided')
+        dictionary = load_dictionary(dict_id)
+    payload = memoryview(data)[_HEADER.size:]
+    if codec == 'zlib':
+        if dictionary:
+            decompressor = zlib.decompressobj(zdict=dictionary[-ZLIB_MAX_DICT_SIZE:])
+        else:
+            decompressor = zlib.decompressobj()
+        return decompressor.decompress(payload) + decompressor.flush()
+    kwargs = {}
+    if dictionary:
+        kwargs['dict_data'] = zstandard.ZstdCompressionDict(dictionary)
+    return zstandard.ZstdDecompressor(**kwargs).decompress(payload)
+
+
+_FRAGMENT_REGEX = re.compile(rb'"(?:[^"\\]|\\.)*"(?::[\[{]*)?|[\]}],[\[{]*')
+
+
+def train_dictionary(samples: Iterable[bytes], dict_size: int, codec: str) -> bytes:
+    """Train a dictionary from canonical JSON samples
+
+    With zstd, the dictionary trainer of zstandard is used. For zlib,
+    a preset dictionary is assembled from the JSON fragments (keys with
+    their colon and short strings) that save the most bytes, with the
+    most valuable fragments placed at the end where deflate finds them
+    at the shortest distance.
+    """
+    check_codec_available(codec)
+    samples = list(samples)
+    if codec == 'zstd':
+        return zstandard.train_dictionary(dict_size, samples).as_bytes()
+    dict_size = min(dict_size, ZLIB_MAX_DICT_SIZE)
+    counter = Counter()
+    for sample in samples:
+        counter.update(f for f in _FRAGMENT_REGEX.findall(sample) if len(f) <= 64)
+    scored = sorted(
+        ((len(f) * (c - 1), f) for f, c in counter.items() if c > 1),
+        reverse=True
+    )
+    fragments = []
+    total_size = 0
+    for _, fragment in scored:
+        if total_size + len(fragment) > dict_size:
+            continue
+        fragments.append(fragment)
+        total_size += len(fragment)
+    return b''.join(fragments[::-1])
@@ -0,0 +1,90 @@
+import os
+import socket
+import socketserver
+import threading
+import orjson
+from pathlib import Path
+from typing import Callable, Optional
+
+
+DAEMON_SOCKET_FILENAME = 'daemon.sock'
+
+
+def is_daemon_supported() -> bool:
+    return hasattr(socket, 'AF_UNIX')
+
+
+def send_request(socket_path: Path, request: dict,
+                 timeout: Optional[float]=None) -> Optional[dict]:
+    """Send a request to a running daemon and return its response
+
+    Returns `None` if no daemon is listening on `socket_path`.
+    """
+    if not is_daemon_supported():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(str(socket_path))
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    with sock:
+        sock.sendall(orjson.dumps(request) + b'\n')
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError('The jsonvc daemon closed the connection without response')
+    return orjson.loads(line)
+
+
+def is_daemon_running(socket_path: Path) -> bool:
+    response = send_request(socket_path, {'type': 'ping'}, timeout=5)
+    return response is not None
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    timeout = 60
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        request = orjson.loads(line)
+        if request.get('type') == 'ping':
+            response = {'status': 'ok'}
+        elif request.get('type') == 'shutdown':
+            response = {'status': 'ok'}
+            # shutdown blocks until serve_forever returns and
+            # must therefore be called from another thread
+            threading.Thread(target=self.server.shutdown).start()
+        else:
+            response = self.server.handle_func(request)
+        self.wfile.write(orjson.dumps(response) + b'\n')
+
+
+class JsonVcDaemonServer(socketserver.UnixStreamServer):
+    """Serve jsonvc requests over a Unix socket
+
+    Requests are handled one after the other by `handle_func`, which
+    receives the request dictionary and returns the response dictionary.
+    Serializing the requests guarantees that write operations never
+    interleave.
+    """
+
+    def __init__(self, socket_path: Path, handle_func: Callable[[dict], dict]):
+        self.handle_func = handle_func
+        self.socket_path = Path(socket_path)
+        if self.socket_path.exists():
+            if is_daemon_running(self.socket_path):
+                raise RuntimeError(f'A jsonvc daemon is already listening on {self.socket_path}')
+            # stale socket of a daemon that did not shut down properly
+            os.remove(self.socket_path)
+        super().__init__(str(self.socket_path), _RequestHandler)
+        os.chmod(self.socket_path, 0o600)
+
+    def server_close(self):
+        super().server_close()
+        if self.socket_path.exists():
+            os.remove(self.socket_path)
@@ -0,0 +1,115 @@
+import os
+import time
+from pathlib import Path
+from typing import List, Optional
+
+
+# Modifications within this period after the modification time of
+# a file recorded in an entry may not change the modification time,
+# depending on the timestamp granularity of the file system.
+RACY_PERIOD_NS = 2 * 10**9
+
+
+class JsonFileIndex:
+    """Map working files to the hashes of their documents via `stat` data
+
+    An entry records the size, modification time and inode of a file
+    together with the hash of its document and the time the file was
+    read. The entry is only used if the `stat` data of the file still
+    match. Like the git index, entries of files that were modified too
+    shortly before they were read are not trusted ("racily clean"),
+    because a subsequent modification within the timestamp granularity
+    of the file system would go unnoticed. Such files are read again
+    until an entry recorded later becomes trustworthy.
+
+    In addition, the index remembers the node a file was last seen
+    tracked as, which remains the reference of the file after it has
+    been modified.
+    """
+
+    def __init__(self) -> None:
+        self._entries = dict()
+        self._tracked_nodes = dict()
+        self._dirty_paths = set()
+        self._dirty_tracked_paths = set()
+
+    def to_dict(self):
+        return {
+            'entries': dict(self._entries),
+            'tracked_nodes': dict(self._tracked_nodes),
+        }
+
+    def from_dict(self, index_dict, update=True):
+        if not update:
+            self._entries = dict()
+            self._tracked_nodes = dict()
+        # keep the most recently recorded entries
+        for path, entry in index_dict['entries'].items():
+            cur_entry = self._entries.get(path, None)
+            if cur_entry is None or cur_entry[3] < entry[3]:
+                self._entries[path] = list(entry)
+        for path, entry in index_dict.get('tracked_nodes', {}).items():
+            cur_entry = self._tracked_nodes.get(path, None)
+            if cur_entry is None or cur_entry[1] < entry[1]:
+                self._tracked_nodes[path] = list(entry)
+
+    def pop_delta(self) -> Optional[dict]:
+        """Return entries recorded since the last call in `to_dict` format"""
+        if len(self._dirty_paths) == 0 and len(self._dirty_tracked_paths) == 0:
+            return None
+        delta = {
+            'entries': {p: self._entries[p] for p in self._dirty_paths},
+            'tracked_nodes': {p: self._tracked_nodes[p] for p in self._dirty_tracked_paths},
+        }
+        self._dirty_paths = set()
+        self._dirty_tracked_paths = set()
+        return delta
+
+    @staticmethod
+    def _get_key(filepath: Path) -> str:
+        return os.path.abspath(filepath)
+
+    def lookup(self, filepath: Path, stat_result: os.stat_result) -> Optional[str]:
+        """Return the document hash of an unchanged file or None"""
+        entry = self._entries.get(self._get_key(filepath), None)
+        if entry is None:
+            return None
+        size, mtime_ns, inode, read_ns, doc_hash = entry
+        if size != stat_result.st_size or mtime_ns != stat_result.st_mtime_ns \
+                or inode != stat_result.st_ino:
+            return None
+        if read_ns - mtime_ns < RACY_PERIOD_NS:
+            return None
+        return doc_hash
+
+    def record(self, filepath: Path, stat_result: os.stat_result,
+               doc_hash: str, read_ns: int) -> None:
+        """Register the document hash of a file
+
+        `stat_result` must be obtained before the file is read at
+        time `read_ns` (nanoseconds since epoch).
+        """
+        key = self._get_key(filepath)
+        self._entries[key] = [
+            stat_result.st_size, stat_result.st_mtime_ns,
+            stat_result.st_ino, read_ns, doc_hash
+        ]
+        self._dirty_paths.add(key)
+
+    def get_tracked_node(self, filepath: Path) -> Optional[str]:
+        """Return the node the file was last seen tracked as or None"""
+        entry = self._tracked_nodes.get(self._get_key(filepath), None)
+        return None if entry is None else entry[0]
+
+    def set_tracked_node(self, filepath: Path, node_hash: str) -> None:
+        key = self._get_key(filepath)
+        entry = self._tracked_nodes.get(key, None)
+        if entry is not None and entry[0] == node_hash:
+            return
+        self._tracked_nodes[key] = [node_hash, time.time_ns()]
+        self._dirty_tracked_paths.add(key)
+
+    def get_recent_tracked_nodes(self, count: int) -> List[str]:
+        """Return the nodes files were most recently seen tracked as"""
+        entries = sorted(self._tracked_nodes.values(), key=lambda e: e[1], reverse=True)
+        return [node_hash for node_hash, _ in entries[:count]]
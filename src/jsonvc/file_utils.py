@@ -0,0 +1,108 @@
+import os
+import mmap
+import time
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+TEMP_FILE_PREFIX = '.tmp-'
+# smaller files are read into memory, as mapping them costs more
+MMAP_THRESHOLD = 1024 * 1024
+
+
+def _get_default_file_mode() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# mkstemp creates files only readable by the owner
+_DEFAULT_FILE_MODE = _get_default_file_mode()
+
+
+def is_temp_filename(filename: str) -> bool:
+    return Path(filename).name.startswith(TEMP_FILE_PREFIX)
+
+
+def write_file_atomic(filepath: Path, data: bytes, fsync: bool=False) -> None:
+    """Write a file so that readers see either nothing or the complete content
+
+    The data is written to a temporary file in the same directory,
+    which is then renamed to its final name.
+    """
+    filepath = Path(filepath)
+    fd, temp_path = tempfile.mkstemp(dir=filepath.parent, prefix=TEMP_FILE_PREFIX)
+    try:
+        os.chmod(temp_path, _DEFAULT_FILE_MODE)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, filepath)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+@contextmanager
+def mapped_file(filepath: Path):
+    """Provide the content of a file as a read-only bytes-like object
+
+    Files of at least `MMAP_THRESHOLD` bytes are memory-mapped, so that
+    their content is not copied into the heap. The object must not be
+    used after leaving the context.
+    """
+    with open(filepath, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        # empty files cannot be mapped
+        if size < MMAP_THRESHOLD or size == 0:
+            yield f.read()
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                yield view
+            finally:
+                # a mapping cannot be closed while exported
+                view.release()
+
+
+@contextmanager
+def locked_file(lock_path: Path, shared: bool=False):
+    """Hold an exclusive lock on `lock_path` across processes
+
+    With `shared`, the lock can be held by several processes at once,
+    but not together with an exclusive lock. On Windows, where files
+    cannot be locked in shared mode, the lock is always exclusive.
+    """
+    with open(lock_path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ten seconds
+                    time.sleep(0.1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,69 @@
+import time
+from typing import Iterable, List, Optional, Set
+from .json.models import JsonGraphNode
+from .storage import JsonStorageProvider, JsonObjectIndex
+
+
+def find_reachable_objects(storage: JsonStorageProvider,
+                           root_node_hashes: Iterable[str]) -> Set[str]:
+    """Return hashes of all nodes, patches and documents reachable from the roots
+
+    The graph is traversed along node -> patch, node -> document and
+    node -> source node edges. The source documents of a patch are
+    not visited separately because `JsonTrackGraph.create_node`
+    guarantees that they are the documents of the source nodes.
+    Nodes missing in the storage are skipped.
+    """
+    reachable = set()
+    pending = set(root_node_hashes)
+    # the nodes are loaded one generation at a time
+    while len(pending) > 0:
+        node_hashes = list(pending)
+        exist_flags = storage.exists_many(node_hashes)
+        node_hashes = [h for h, exists in zip(node_hashes, exist_flags) if exists]
+        reachable.update(node_hashes)
+        pending = set()
+        for node_dict in storage.load_many(node_hashes):
+            node = JsonGraphNode(hash_func=storage.compute_hash, **node_dict)
+            reachable.add(node.get_document_hash())
+            patch_hash = node.get_ext_patch_hash()
+            if patch_hash is not None:
+                reachable.add(patch_hash)
+            pending.update(node.get_source_hashes())
+        pending.difference_update(reachable)
+    return reachable
+
+
+def find_unreachable_objects(index: JsonObjectIndex, reachable: Set[str],
+                             grace_period: Optional[float]=None) -> List[str]:
+    """Return hashes of indexed objects that are not reachable
+
+    Objects stored less than `grace_period` seconds ago are excluded
+    to not interfere with concurrent writers whose nodes are not yet
+    registered anywhere.
+    """
+    unreachable = [h for h in index.index() if h not in reachable]
+    if grace_period is not None:
+        threshold = time.time() - grace_period
+        unreachable = [h for h in unreachable if index.mtime(h) < threshold]
+    return unreachable
+
+
+def collect_garbage(storage: JsonStorageProvider, index: JsonObjectIndex,
+                    root_node_hashes: Iterable[str], grace_period: Optional[float]=None,
+                    dry_run: bool=False) -> List[str]:
+    """Delete all objects in `index` not reachable from the root nodes
+
+    Returns the hashes of the deleted objects (or the objects that
+    would be deleted if `dry_run` is true).
+    """
+    reachable = find_reachable_objects(storage, root_node_hashes)
+    unreachable = find_unreachable_objects(index, reachable, grace_period)
+    if not dry_run:
+        for json_hash in unreachable:
+            try:
+                index.remove(json_hash)
+            except FileNotFoundError:
+                # removed concurrently by another process
+                pass
+    return unreachable
@@ -0,0 +1,288 @@
+import base64
+import hashlib
+from typing import List, NamedTuple, Optional, Tuple
+
+
+# multicodec and multihash codes
+CODEC_DAG_PB = 0x70
+CODEC_RAW = 0x55
+MULTIHASH_SHA2_256 = 0x12
+SHA2_256_LENGTH = 32
+# UnixFS node types
+UNIXFS_RAW = 0
+UNIXFS_FILE = 2
+
+_BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+_BASE58_INDEX = {c: i for i, c in enumerate(_BASE58_ALPHABET)}
+
+
+class InvalidBlockError(ValueError):
+    """A block does not match its content identifier or cannot be decoded"""
+    pass
+
+
+class Cid(NamedTuple):
+    version: int
+    codec: int
+    multihash: bytes
+
+    def get_digest(self) -> Tuple[int, bytes]:
+        """Return the multihash code and the digest"""
+        code, pos = decode_varint(self.multihash, 0)
+        length, pos = decode_varint(self.multihash, pos)
+        return code, self.multihash[pos:pos+length]
+
+    def to_bytes(self) -> bytes:
+        if self.version == 0:
+            return self.multihash
+        return encode_varint(1) + encode_varint(self.codec) + self.multihash
+
+    def __str__(self) -> str:
+        if self.version == 0:
+            return base58_encode(self.multihash)
+        encoded = base64.b32encode(self.to_bytes()).decode('ascii')
+        return 'b' + encoded.lower().rstrip('=')
+
+
+def encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def decode_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """Return the value and the position after it"""
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise InvalidBlockError('Truncated varint')
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def base58_encode(data: bytes) -> str:
+    num = int.from_bytes(data, 'big')
+    chars = []
+    while num > 0:
+        num, rem = divmod(num, 58)
+        chars.append(_BASE58_ALPHABET[rem])
+    num_zeros = len(data) - len(data.lstrip(b'\x00'))
+    return '1' * num_zeros + ''.join(reversed(chars))
+
+
+def base58_decode(text: str) -> bytes:
+    num = 0
+    for char in text:
+        if char not in _BASE58_INDEX:
+            raise ValueError(f'Invalid base58 character {char!r}')
+        num = num * 58 + _BASE58_INDEX[char]
+    num_zeros = len(text) - len(text.lstrip('1'))
+    body = num.to_bytes((num.bit_length() + 7) // 8, 'big')
+    return b'\x00' * num_zeros + body
+
+
+def parse_cid(cid: str) -> Cid:
+    """Parse a CIDv0 or a base32 encoded CIDv1"""
+    if len(cid) == 46 and cid.startswith('Qm'):
+        return Cid(0, CODEC_DAG_PB, base58_decode(cid))
+    if not cid.startswith('b'):
+        raise ValueError(f'Unsupported CID encoding: {cid}')
+    encoded = cid[1:].upper()
+    data = base64.b32decode(encoded + '=' * (-len(encoded) % 8))
+    return cid_from_bytes(data)
+
+
+def cid_from_bytes(data: bytes) -> Cid:
+    if data[:2] == bytes([MULTIHASH_SHA2_256, SHA2_256_LENGTH]):
+        return Cid(0, CODEC_DAG_PB, data)
+    version, pos = decode_varint(data, 0)
+    if version != 1:
+        raise ValueError(f'Unsupported CID version {version}')
+    codec, pos = decode_varint(data, pos)
+    return Cid(1, codec, data[pos:])
+
+
+def compute_block_cid(block: bytes, codec: int=CODEC_DAG_PB, version: int=0) -> Cid:
+    digest = hashlib.sha256(block).digest()
+    multihash = bytes([MULTIHASH_SHA2_256, SHA2_256_LENGTH]) + digest
+    return Cid(version, codec, multihash)
+
+
+def verify_block(cid: Cid, block: bytes) -> None:
+    code, digest = cid.get_digest()
+    if code != MULTIHASH_SHA2_256:
+        raise InvalidBlockError(f'Unsupported multihash function 0x{code:x}')
+    if hashlib.sha256(block).digest() != digest:
+        raise InvalidBlockError(f'Block does not match CID {cid}')
+
+
+def _iter_fields(data: bytes):
+    pos = 0
+    while pos < len(data):
+        key, pos = decode_varint(data, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = decode_varint(data, pos)
+        elif wire_type == 2:
+            length, pos = decode_varint(data, pos)
+            value = data[pos:pos+length]
+            if len(value) != length:
+                raise InvalidBlockError('Truncated protobuf field')
+            pos += length
+        else:
+            raise InvalidBlockError(f'Unsupported protobuf wire type {wire_type}')
+        yield field, value
+
+
+def _encode_bytes_field(field: int, value: bytes) -> bytes:
+    return encode_varint(field << 3 | 2) + encode_varint(len(value)) + value
+
+
+def _encode_varint_field(field: int, value: int) -> bytes:
+    return encode_varint(field << 3) + encode_varint(value)
+
+
+class DagPbLink(NamedTuple):
+    cid: Cid
+    name: str
+    tsize: Optional[int]
+
+
+def decode_dag_pb(block: bytes) -> Tuple[List[DagPbLink], Optional[bytes]]:
+    """Return the links and the data of a dag-pb node"""
+    links = []
+    data = None
+    for field, value in _iter_fields(block):
+        if field == 1:
+            data = value
+        elif field == 2:
+            link_fields = dict(_iter_fields(value))
+            links.append(DagPbLink(
+                cid_from_bytes(link_fields[1]),
+                link_fields.get(2, b'').decode('utf-8'),
+                link_fields.get(3, None),
+            ))
+    return links, data
+
+
+def encode_dag_pb(links: List[DagPbLink], data: Optional[bytes]) -> bytes:
+    # links precede the data in the canonical form
+    out = bytearray()
+    for link in links:
+        link_bytes = _encode_bytes_field(1, link.cid.to_bytes())
+        link_bytes += _encode_bytes_field(2, link.name.encode('utf-8'))
+        if link.tsize is not None:
+            link_bytes += _encode_varint_field(3, link.tsize)
+        out += _encode_bytes_field(2, link_bytes)
+    if data is not None:
+        out += _encode_bytes_field(1, data)
+    return bytes(out)
+
+
+def decode_unixfs_data(data: bytes) -> Tuple[int, bytes]:
+    """Return the type and the inline content of UnixFS metadata"""
+    node_type = None
+    content = b''
+    for field, value in _iter_fields(data):
+        if field == 1:
+            node_type = value
+        elif field == 2:
+            content = value
+    return node_type, content
+
+
+def encode_unixfs_file_leaf(content: bytes) -> bytes:
+    """Encode a file of a single chunk as dag-pb node like `ipfs add`"""
+    unixfs = _encode_varint_field(1, UNIXFS_FILE)
+    if len(content) > 0:
+        unixfs += _encode_bytes_field(2, content)
+    unixfs += _encode_varint_field(3, len(content))
+    return encode_dag_pb([], unixfs)
+
+
+def get_block_content(cid: Cid, block: bytes) -> Tuple[bytes, List[Cid]]:
+    """Return the file content of a verified block and the CIDs of its children"""
+    if cid.codec == CODEC_RAW:
+        return block, []
+    if cid.codec != CODEC_DAG_PB:
+        raise InvalidBlockError(f'Unsupported codec 0x{cid.codec:x}')
+    links, data = decode_dag_pb(block)
+    content = b''
+    if data is not None:
+        node_type, content = decode_unixfs_data(data)
+        if node_type not in (UNIXFS_RAW, UNIXFS_FILE):
+            raise InvalidBlockError(f'UnixFS node of type {node_type} is not a file')
+    return content, [link.cid for link in links]
+
+
+# defaults of `ipfs add`
+CHUNK_SIZE = 256 * 1024
+MAX_LINKS = 174
+
+
+def _encode_unixfs_file_parent(filesize: int, blocksizes: List[int]) -> bytes:
+    unixfs = _encode_varint_field(1, UNIXFS_FILE)
+    unixfs += _encode_varint_field(3, filesize)
+    for blocksize in blocksizes:
+        unixfs += _encode_varint_field(4, blocksize)
+    return unixfs
+
+
+def iter_unixfs_file_blocks(content: bytes):
+    """Yield the blocks of a file as `ipfs add` with default options, root last
+
+    Files are split into chunks of `CHUNK_SIZE` bytes stored in dag-pb
+    leaves, which are linked by a balanced tree of nodes with up to
+    `MAX_LINKS` children.
+    """
+    # each level holds (cid, block size plus size of descendants, content size)
+    level = []
+    for start in range(0, max(len(content), 1), CHUNK_SIZE):
+        chunk = content[start:start+CHUNK_SIZE]
+        block = encode_unixfs_file_leaf(chunk)
+        yield compute_block_cid(block), block
+        level.append((compute_block_cid(block), len(block), len(chunk)))
+    while len(level) > 1:
+        parents = []
+        for i in range(0, len(level), MAX_LINKS):
+            children = level[i:i+MAX_LINKS]
+            links = [DagPbLink(cid, '', tsize) for cid, tsize, _ in children]
+            filesize = sum(size for _, _, size in children)
+            data = _encode_unixfs_file_parent(filesize, [size for _, _, size in children])
+            block = encode_dag_pb(links, data)
+            cid = compute_block_cid(block)
+            yield cid, block
+            parents.append((cid, len(block) + sum(t for _, t, _ in children), filesize))
+        level = parents
+
+
+def compute_unixfs_file_cid(content: bytes) -> Cid:
+    """Return the CIDv0 `ipfs add` assigns to a file with this content"""
+    for cid, _ in iter_unixfs_file_blocks(content):
+        pass
+    return cid
+
+
+def matches_file_cid(cid_str: str, content: bytes) -> bool:
+    """Check file content against a CID as assigned by `ipfs add`
+
+    Other kinds of CIDs cannot be reproduced and are accepted.
+    """
+    try:
+        cid = parse_cid(cid_str)
+    except ValueError:
+        return True
+    if cid.version != 0:
+        return True
+    return compute_unixfs_file_cid(content) == cid
@@ -0,0 +1,228 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, List, Optional
+import orjson
+import requests
+from .ipfs_cid import (
+    parse_cid,
+    verify_block,
+    get_block_content,
+)
+
+
+RAW_BLOCK_MEDIA_TYPE = 'application/vnd.ipld.raw'
+
+
+class GatewayUnavailableError(Exception):
+    """No gateway delivered a valid response"""
+    pass
+
+
+class _ContentNotFound(Exception):
+    pass
+
+
+class GatewayHealth:
+    """Latency statistics and circuit breaker state of a gateway
+
+    The circuit opens after `failure_threshold` consecutive failures
+    and the gateway is only tried again `open_duration` seconds later.
+    """
+
+    def __init__(self, url: str, failure_threshold: int=3,
+                 open_duration: float=30.0, window: int=64):
+        self.url = url
+        self._failure_threshold = failure_threshold
+        self._open_duration = open_duration
+        self._latencies = deque(maxlen=window)
+        self._consecutive_failures = 0
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+            self._consecutive_failures = 0
+            self._open_until = 0.0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= self._failure_threshold:
+                self._open_until = time.monotonic() + self._open_duration
+
+    def is_available(self) -> bool:
+        return time.monotonic() >= self._open_until
+
+    def get_num_samples(self) -> int:
+        return len(self._latencies)
+
+    def get_latency_quantile(self, quantile: float) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) == 0:
+            return None
+        return latencies[min(int(quantile * len(latencies)), len(latencies) - 1)]
+
+
+class IpfsGatewayPool:
+    """Fetch blocks from several gateways with hedged requests
+
+    Requests go to the available gateway with the lowest median latency
+    first; gateways without measurements are tried before the others.
+    If no response arrived after the 95th latency percentile of that
+    gateway (`default_hedge_delay` until `min_samples` latencies are
+    known), the next gateway is asked as well, and so on. The first
+    response matching the CID wins. Blocks are requested in the raw
+    format of the trustless gateway specification, so that they can be
+    verified against their CID whatever the gateway.
+    """
+
+    def __init__(self, gateway_urls: List[str], hedge_delay: Optional[float]=None,
+                 default_hedge_delay: float=0.5, min_hedge_delay: float=0.02,
+                 min_samples: int=5, failure_threshold: int=3,
+                 open_duration: float=30.0, timeout: float=60.0,
+                 max_workers: int=16):
+        if len(gateway_urls) == 0:
+            raise ValueError('At least one gateway URL is required')
+        self._health = [
+            GatewayHealth(url.rstrip('/'), failure_threshold, open_duration)
+            for url in gateway_urls
+        ]
+        self._hedge_delay = hedge_delay
+        self._default_hedge_delay = default_hedge_delay
+        self._min_hedge_delay = min_hedge_delay
+        self._min_samples = min_samples
+        self._timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._thread_local = threading.local()
+
+    def get_gateway_health(self) -> List[GatewayHealth]:
+        return list(self._health)
+
+    def _get_session(self) -> requests.Session:
+        session = getattr(self._thread_local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self._thread_local.session = session
+        return session
+
+    def _rank_gateways(self) -> List[GatewayHealth]:
+        def sort_key(health):
+            median = health.get_latency_quantile(0.5)
+            return (0.0 if median is None else median)
+        available = [h for h in self._health if h.is_available()]
+        if len(available) == 0:
+            # let all gateways try to recover rather than failing outright
+            available = list(self._health)
+        return sorted(available, key=sort_key)
+
+    def _get_hedge_delay(self, health: GatewayHealth) -> float:
+        if self._hedge_delay is not None:
+            return self._hedge_delay
+        if health.get_num_samples() < self._min_samples:
+            return self._default_hedge_delay
+        return max(health.get_latency_quantile(0.95), self._min_hedge_delay)
+
+    def _attempt(self, health: GatewayHealth, func: Callable):
+        start = time.monotonic()
+        try:
+            result = func(health.url)
+        except _ContentNotFound:
+            # the gateway works, only the content is missing
+            health.record_success(time.monotonic() - start)
+            raise
+        except Exception:
+            health.record_failure()
+            raise
+        health.record_success(time.monotonic() - start)
+        return result
+
+    def _hedge(self, func: Callable, description: str):
+        ranked = self._rank_gateways()
+        futures = dict()
+        errors = []
+        num_not_found = 0
+        next_idx = 0
+        while True:
+            # hedge after the delay or right after a failed request
+            if next_idx < len(ranked):
+                health = ranked[next_idx]
+                next_idx += 1
+                futures[self._executor.submit(self._attempt, health, func)] = health
+                delay = self._get_hedge_delay(health)
+            if len(futures) == 0:
+                break
+            timeout = delay if next_idx < len(ranked) else None
+            done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                health = futures.pop(future)
+                try:
+                    return future.result()
+                except _ContentNotFound:
+                    num_not_found += 1
+                except Exception as exc:
+                    errors.append(f'{health.url}: {type(exc).__name__}: {exc}')
+        if num_not_found > 0:
+            raise _ContentNotFound(description)
+        raise GatewayUnavailableError(
+            f'No gateway delivered {description}: ' + '; '.join(errors)
+        )
+
+    def _fetch_block(self, cid_str: str) -> bytes:
+        cid = parse_cid(cid_str)
+
+        def fetch(url):
+            response = self._get_session().get(
+                f'{url}/ipfs/{cid_str}', params={'format': 'raw'},
+                headers={'Accept': RAW_BLOCK_MEDIA_TYPE}, timeout=self._timeout
+            )
+            if response.status_code in (404, 410):
+                raise _ContentNotFound(cid_str)
+            if response.status_code != 200:
+                raise Exception(f'HTTP {response.status_code}')
+            block = response.content
+            verify_block(cid, block)
+            return block
+
+        return self._hedge(fetch, f'block {cid_str}')
+
+    def fetch_file(self, cid_str: str) -> bytes:
+        """Return the verified content of a UnixFS file or raw block"""
+        try:
+            pending = [parse_cid(cid_str)]
+            chunks = []
+            while len(pending) > 0:
+                cid = pending.pop()
+                content, child_cids = get_block_content(cid, self._fetch_block(str(cid)))
+                chunks.append(content)
+                # depth-first in link order
+                pending.extend(reversed(child_cids))
+        except _ContentNotFound:
+            raise GatewayUnavailableError(f'No gateway has the content of CID {cid_str}')
+        return b''.join(chunks)
+
+    def load_json_object(self, cid_str: str) -> dict:
+        return orjson.loads(self.fetch_file(cid_str))
+
+    def exists(self, cid_str: str) -> bool:
+        def head(url):
+            response = self._get_session().head(
+                f'{url}/ipfs/{cid_str}', params={'format': 'raw'},
+                headers={'Accept': RAW_BLOCK_MEDIA_TYPE}, timeout=self._timeout
+            )
+            if response.status_code == 200:
+                return True
+            if response.status_code in (404, 410, 504):
+                raise _ContentNotFound(cid_str)
+            raise Exception(f'HTTP {response.status_code}')
+
+        try:
+            return self._hedge(head, f'existence of {cid_str}')
+        except _ContentNotFound:
+            return False
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
@@ -1,24 +1,62 @@
+import threading
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+import requests
 from . import ipfs_storage_utils as ipfs_jsu
+from .bounded_cache import BoundedDirectoryJsonStorageProvider
+from .ipfs_cid import matches_file_cid
+from .ipfs_gateways import IpfsGatewayPool
 from .storage import (
     JsonStorageProvider,
     JsonObjectIndex,
 )
 from pathlib import Path
-from typing import Optional
+from typing import Callable, List, Optional, Union
 
 
 class IpfsJsonStorageProvider(JsonStorageProvider):
+    """Store JSON objects on IPFS
 
-    def __init__(self, cache_dir: Path, gateway_url: str, rpc_api_url: str, rpc_api_url_upload: Optional[str]=None):
-        self._cache_dir = Path(cache_dir)
-        self._gateway_url = gateway_url
+    Objects are cached in `cache_dir` unless it is None, e.g. if the
+    provider is the remote tier of a `TieredJsonStorageProvider`.
+    The cache is limited to `cache_max_bytes` by evicting objects
+    according to `cache_policy` (see `BoundedDirectoryJsonStorageProvider`).
+    With `cache_verify`, objects read from the cache are checked
+    against their CID, which is computed locally for CIDv0.
+    If `gateway_url` is a list, objects are read via an `IpfsGatewayPool`
+    with hedged requests to these gateways and verified against their CID.
+    Batch operations send up to `BATCH_THREADS` requests concurrently,
+    each thread reusing its connections to the gateway. `store_many`
+    uploads up to `UPLOAD_BATCH_SIZE` objects per request and provides
+    them with another single request.
+    """
+
+    BATCH_THREADS = 16
+    UPLOAD_BATCH_SIZE = 256
+
+    def __init__(self, cache_dir: Optional[Path], gateway_url: Union[str, List[str]],
+                 rpc_api_url: str, rpc_api_url_upload: Optional[str]=None,
+                 cache_max_bytes: Optional[int]=None, cache_policy: str='lru',
+                 cache_verify: bool=False):
+        self._gateway_pool = None
+        if isinstance(gateway_url, str):
+            self._gateway_url = gateway_url
+        else:
+            self._gateway_url = None
+            self._gateway_pool = IpfsGatewayPool(gateway_url)
         self._rpc_api_url = rpc_api_url
         self._rpc_api_url_upload = (
             rpc_api_url if rpc_api_url_upload is None else rpc_api_url_upload
         )
-        self._cache_dir = Path(cache_dir)
+        self._cache = None
+        if cache_dir is not None:
+            self._cache = BoundedDirectoryJsonStorageProvider(
+                Path(cache_dir), self.compute_hash, cache_max_bytes, cache_policy,
+                verify_func=matches_file_cid if cache_verify else None
+            )
         self._provide = False
+        self._executor = None
+        self._thread_local = threading.local()
 
     def enable_provide(self):
         self._provide = True
@@ -26,25 +64,94 @@ class IpfsJsonStorageProvider(JsonStorageProvider):
     def disable_provide(self):
         self._provide = False
 
+    def _get_session(self) -> requests.Session:
+        # sessions are not guaranteed to be thread-safe
+        session = getattr(self._thread_local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self._thread_local.session = session
+        return session
+
+    def _map(self, func: Callable, items: list) -> list:
+        if len(items) < 2:
+            return [func(item) for item in items]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.BATCH_THREADS)
+        return list(self._executor.map(func, items))
+
+    def get_gateway_pool(self) -> Optional[IpfsGatewayPool]:
+        return self._gateway_pool
+
+    def _load_remote(self, json_hash: str) -> dict:
+        if self._gateway_pool is not None:
+            return self._gateway_pool.load_json_object(json_hash)
+        return ipfs_jsu.load_json_object(json_hash, self._gateway_url, self._get_session())
+
     def load(self, json_hash: str) -> dict:
-        if ipfs_jsu.exists_local_json_file(self._cache_dir, json_hash):
-            return ipfs_jsu.load_local_json_file(self._cache_dir, json_hash)
-        json_dict = ipfs_jsu.load_json_object(json_hash, self._gateway_url)
-        ipfs_jsu.store_local_json_file(selff._cache_dir, json_hash, json_dict)
+        if self._cache is None:
+            return self._load_remote(json_hash)
+        if self._cache.exists(json_hash):
+            try:
+                return self._cache.load(json_hash)
+            except FileNotFoundError:
+                # evicted or corrupt
+                pass
+        json_dict = self._load_remote(json_hash)
+        self._cache.store_under_hash(json_hash, json_dict)
         return json_dict
 
+    def load_many(self, json_hashes: List[str]) -> List[dict]:
+        return self._map(self.load, list(json_hashes))
+
     def store(self, json_dict: dict) -> str:
         json_hash = ipfs_jsu.store_json_object(json_dict, self._rpc_api_url_upload)
-        ipfs_jsu.store_local_json_file(self._cache_dir, json_hash, json_dict)
+        if self._cache is not None:
+            self._cache.store_under_hash(json_hash, json_dict)
         if self._provide:
             if not ipfs_jsu.provide_cid(json_hash, self._rpc_api_url_upload):
                 raise Exception(f'failed to provide CID to IPFS network---public access may be limited')
         return json_hash
 
+    def _store_batch(self, json_dicts: List[dict]) -> List[str]:
+        session = self._get_session()
+        json_hashes = ipfs_jsu.store_json_objects(json_dicts, self._rpc_api_url_upload, session)
+        if self._cache is not None:
+            for json_hash, json_dict in zip(json_hashes, json_dicts):
+                self._cache.store_under_hash(json_hash, json_dict)
+        if self._provide:
+            if not ipfs_jsu.provide_cids(json_hashes, self._rpc_api_url_upload, session):
+                raise Exception(f'failed to provide CIDs to IPFS network---public access may be limited')
+        return json_hashes
+
+    def store_many(self, json_dicts: List[dict]) -> List[str]:
+        json_dicts = list(json_dicts)
+        if len(json_dicts) < 2:
+            return [self.store(json_dict) for json_dict in json_dicts]
+        batches = [
+            json_dicts[i:i+self.UPLOAD_BATCH_SIZE]
+            for i in range(0, len(json_dicts), self.UPLOAD_BATCH_SIZE)
+        ]
+        return [h for json_hashes in self._map(self._store_batch, batches) for h in json_hashes]
+
     def exists(self, json_hash: str) -> bool:
-        return ipfs_jsu.exists_json_object(json_hash, self._gateway_url)
+        if self._cache is not None and self._cache.exists(json_hash):
+            return True
+        if self._gateway_pool is not None:
+            return self._gateway_pool.exists(json_hash)
+        return ipfs_jsu.exists_json_object(json_hash, self._gateway_url, self._get_session())
+
+    def exists_many(self, json_hashes: List[str]) -> List[bool]:
+        return self._map(self.exists, list(json_hashes))
+
+    def get_cache(self) -> Optional[BoundedDirectoryJsonStorageProvider]:
+        return self._cache
+
+    def get_cache_index(self) -> Optional[JsonObjectIndex]:
+        """Return an index of the objects in the local cache directory"""
+        return self._cache
 
     def compute_hash(self, json_dict: dict) -> str:
         # TODO: A bit awkward to invoke an RPC endpoint to obtain the content identifier.
         #       It would be better to accomplish this locally.
         return ipfs_jsu.compute_hash(json_dict, self._rpc_api_url)
+
@@ -1,8 +1,11 @@
+import os
 from pathlib import Path
 import orjson
 import requests
 import tempfile
+from typing import List
 from .checksum import get_unique_json_repr
+from .file_utils import write_file_atomic, is_temp_filename, mapped_file
 from io import BytesIO
 
 
@@ -11,32 +14,38 @@ def exists_local_json_file(filedir: Path, filename: str) -> bool:
     return filepath.is_file()
 
 
+def list_local_json_files(filedir: Path) -> list:
+    return [
+        e.name for e in os.scandir(filedir)
+        if e.is_file() and not is_temp_filename(e.name)
+    ]
+
+
 def load_local_json_file(filedir: Path, filename: str) -> dict:
     filepath = Path(filedir) / filename
-    with open(filepath, 'r') as f:
-        json_dict = orjson.loads(f.read())
+    with mapped_file(filepath) as data:
+        json_dict = orjson.loads(data)
     return json_dict
 
 
 def store_local_json_file(filedir: Path, filename: str, json_dict: dict):
     jsonstr = get_unique_json_repr(json_dict)
     filepath = Path(filedir) / filename
-    with open(filepath, 'w') as f:
-        f.write(jsonstr)
+    write_file_atomic(filepath, jsonstr.encode('utf-8'))
 
 
-def exists_json_object(json_hash: str, gateway_url: str) -> bool:
+def exists_json_object(json_hash: str, gateway_url: str, session=requests) -> bool:
     url = gateway_url.rstrip('/') + '/ipfs/' + json_hash
-    response = requests.head(url, allow_redirects=True)
+    response = session.head(url, allow_redirects=True)
     return response.status_code == 200
 
 
-def load_json_object(json_hash: str, gateway_url:str) -> dict:
+def load_json_object(json_hash: str, gateway_url:str, session=requests) -> dict:
     url = gateway_url.rstrip('/') + '/ipfs/' + json_hash
-    response = requests.get(url, stream=False)
+    response = session.get(url, stream=False)
     if response.status_code != 200:
         raise Exception(f'failed to fetch CID {json_hash}: HTTP {response.status_code}')
-    return response.text
+    return orjson.loads(response.content)
 
 
 def _store_json_object(json_dict: dict, rpc_api_url: str, only_hash: bool=False) -> str:
@@ -64,7 +73,44 @@ def compute_hash(json_dict: dict, rpc_api_url: str):
     return _store_json_object(json_dict, rpc_api_url, only_hash=True)
 
 
+def store_json_objects(json_dicts: List[dict], rpc_api_url: str, session=requests) -> List[str]:
+    """Upload several JSON objects with a single request
+
+    Every object is a file of the multipart request, so the CIDs
+    are the same as if the objects were uploaded one by one.
+    """
+    if len(json_dicts) == 0:
+        return []
+    files = []
+    for i, json_dict in enumerate(json_dicts):
+        json_bytes = get_unique_json_repr(json_dict).encode('utf-8')
+        files.append(('file', (str(i), BytesIO(json_bytes))))
+    ipfs_add_url = rpc_api_url.rstrip('/') + '/v0/add'
+    response = session.post(ipfs_add_url, files=files)
+    if response.status_code != 200:
+        raise Exception(f'Upload failed: HTTP {response.status_code} - {response.text}')
+    # one JSON object per line and file, identified by the file name
+    hashes = dict()
+    for line in response.content.splitlines():
+        if line.strip():
+            entry = orjson.loads(line)
+            hashes[entry['Name']] = entry['Hash']
+    try:
+        return [hashes[str(i)] for i in range(len(json_dicts))]
+    except KeyError:
+        raise Exception(f'Upload failed: incomplete response - {response.text}')
+
+
 def provide_cid(cid: str, rpc_api_url):
     ipfs_provide_url = rpc_api_url.rstrip('/') + '/v0/routing/provide'
     resp = requests.post(ipfs_provide_url, params={'arg': cid})
     return resp.status_code == 200
+
+
+def provide_cids(cids: List[str], rpc_api_url: str, session=requests) -> bool:
+    """Announce several CIDs to the network with a single request"""
+    if len(cids) == 0:
+        return True
+    ipfs_provide_url = rpc_api_url.rstrip('/') + '/v0/routing/provide'
+    resp = session.post(ipfs_provide_url, params=[('arg', cid) for cid in cids])
+    return resp.status_code == 200
@@ -0,0 +1,148 @@
+import os
+import orjson
+from pathlib import Path
+from typing import Callable, Optional
+from .checksum import get_unique_json_repr
+from .file_utils import locked_file, write_file_atomic
+
+
+class JournaledStateFile:
+    """Persist a state object as a base file plus an append-only journal.
+
+    The state object must provide `to_dict`, `from_dict` and `pop_delta`.
+    Every call to `save` appends the entries registered since the last
+    save as one JSON line to the journal, so the cost of persisting is
+    proportional to the change and not to the size of the state. Once
+    the journal outgrows the base file, both are compacted into a new
+    base file.
+
+    All file operations are serialized across processes by a lock file.
+    Because `from_dict` merges entries, the changes of concurrent
+    writers are never lost: each writer only appends its own entries
+    and compaction first merges everything persisted by others.
+    """
+
+    def __init__(self, filepath: Path, journal_filepath: Path,
+                 lock_filepath: Optional[Path]=None,
+                 min_compact_size: int=1024**2) -> None:
+        self._filepath = Path(filepath)
+        self._journal_filepath = Path(journal_filepath)
+        if lock_filepath is None:
+            lock_filepath = self._filepath.with_name(self._filepath.name + '.lock')
+        self._lock_filepath = Path(lock_filepath)
+        self._min_compact_size = min_compact_size
+        self._base_stat = None
+        self._journal_offset = 0
+
+    def _stat_base(self):
+        try:
+            st = self._filepath.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _read_journal(self, state, offset: int=0) -> int:
+        try:
+            with open(self._journal_filepath, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # incomplete trailing entry of an interrupted write
+                        break
+                    offset += len(line)
+                    try:
+                        delta = orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        continue
+                    state.from_dict(delta, update=True)
+        except FileNotFoundError:
+            return 0
+        return offset
+
+    def _load(self, state) -> None:
+        self._base_stat = self._stat_base()
+        if self._base_stat is not None:
+            with open(self._filepath, 'rb') as f:
+                state.from_dict(orjson.loads(f.read()), update=True)
+        self._journal_offset = self._read_journal(state)
+
+    def _refresh(self, state) -> None:
+        if self._stat_base() != self._base_stat:
+            self._load(state)
+        else:
+            self._journal_offset = self._read_journal(state, self._journal_offset)
+
+    def _write(self, state) -> None:
+        state.pop_delta()
+        jsonstr = get_unique_json_repr(state.to_dict())
+        write_file_atomic(self._filepath, jsonstr.encode('utf-8'))
+        if self._journal_filepath.is_file():
+            os.remove(self._journal_filepath)
+        self._base_stat = self._stat_base()
+        self._journal_offset = 0
+
+    def _should_compact(self) -> bool:
+        try:
+            journal_size = self._journal_filepath.stat().st_size
+        except FileNotFoundError:
+            return False
+        base_stat = self._stat_base()
+        base_size = base_stat[1] if base_stat is not None else 0
+        return journal_size > max(self._min_compact_size, base_size)
+
+    def load(self, state) -> None:
+        """Populate `state` from the base file and the journal"""
+        with locked_file(self._lock_filepath):
+            self._load(state)
+
+    def refresh(self, state) -> None:
+        """Merge changes persisted by other writers since the last load"""
+        with locked_file(self._lock_filepath):
+            self._refresh(state)
+
+    def _append(self, state, delta: dict) -> None:
+        with open(self._journal_filepath, 'ab') as f:
+            f.write(orjson.dumps(delta) + b'\n')
+        if self._should_compact():
+            self._refresh(state)
+            self._write(state)
+
+    def save(self, state) -> None:
+        """Append pending changes of `state` and compact if worthwhile"""
+        delta = state.pop_delta()
+        if delta is None:
+            return
+        with locked_file(self._lock_filepath):
+            self._append(state, delta)
+
+    def update(self, state, func: Callable):
+        """Merge persisted changes, call `func` and save the changes
+
+        The lock is held throughout, so that `func` acts on the changes
+        of all writers and none of them interferes until it is saved.
+        Returns the result of `func`.
+        """
+        with locked_file(self._lock_filepath):
+            self._refresh(state)
+            result = func()
+            delta = state.pop_delta()
+            if delta is not None:
+                self._append(state, delta)
+        return result
+
+    def compact(self, state) -> None:
+        """Merge persisted changes, then write the complete state"""
+        with locked_file(self._lock_filepath):
+            self._refresh(state)
+            self._write(state)
+
+    def write(self, state) -> None:
+        """Write the complete state to the base file and clear the journal
+
+        Unlike `compact`, entries missing in `state` are dropped, which
+        is needed to persist removals. Only journal entries appended
+        since the last load are merged beforehand.
+        """
+        with locked_file(self._lock_filepath):
+            self._journal_offset = self._read_journal(state, self._journal_offset)
+            self._write(state)
@@ -42,9 +42,9 @@ class ExtJsonPatch:
     def get_source_hashes(self) -> list:
         return list(self._datamodel.sourceHashes.values())
 
-    def apply(self, load_json_func: Callable):
+    def apply(self, load_json_func: Callable, load_many_json_func: Optional[Callable]=None):
         json_dict = self.model_dump()
-        return apply_ext_patch(json_dict, load_json_func)
+        return apply_ext_patch(json_dict, load_json_func, load_many_json_func)
 
     def model_dump(self) -> dict:
         return self._datamodel.model_dump()
@@ -0,0 +1,403 @@
+"""Event-based parsing of JSON files too large to be loaded
+
+`iter_json_events` walks the tokens of a JSON text and yields events
+instead of building the document, similar to a SAX parser. Used on a
+memory-mapped file, memory use does not grow with the size of the file,
+only with the nesting depth and the largest scalar.
+
+The parser is written in Python and is much slower than `orjson.loads`,
+so it is meant for files which cannot be loaded at all. On top of it,
+`compute_json_file_hash` hashes the canonical representation of a file
+and `load_json_pointer` loads a single value of a file.
+
+Events are pairs of a name and a value:
+
+- `('start_map', None)`, `('map_key', key)`, `('end_map', None)`
+- `('start_array', None)`, `('end_array', None)`
+- `('scalar', value)` for strings, numbers, booleans and null
+"""
+import re
+from pathlib import Path
+from typing import Iterator, Tuple
+import orjson
+import jsonpointer
+from .checksum import DEFAULT_HASH_ALGORITHM, HASH_ALGORITHMS, format_hash
+from .canonical_json import CHUNK_SIZE, MAX_DEPTH
+from .file_utils import mapped_file
+
+
+# containers nested deeper are rejected by orjson.loads
+MAX_PARSE_DEPTH = 1024
+# smaller objects are sorted in memory when hashing
+BUFFER_SIZE = 64 * 1024
+
+_TOKEN = re.compile(
+    rb'[ \t\n\r]*(?:'
+    rb'([\[\]{},:])'
+    rb'|("[^"\\]*(?:\\.[^"\\]*)*")'
+    rb'|(-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?|true|false|null)'
+    rb')',
+    re.DOTALL
+)
+_WHITESPACE = re.compile(rb'[ \t\n\r]*')
+_PUNCTUATION, _STRING, _LITERAL = 1, 2, 3
+
+# parser states
+_VALUE, _VALUE_OR_END, _KEY, _KEY_OR_END, _COLON, _COMMA_OR_END, _DONE = range(7)
+_NO_KEY = object()
+
+
+def _error(msg: str, pos: int) -> orjson.JSONDecodeError:
+    # the document is not passed, as it may not fit into memory as a str
+    return orjson.JSONDecodeError(msg, '', pos)
+
+
+def _decode_token(token: bytes, pos: int):
+    try:
+        return orjson.loads(token)
+    except orjson.JSONDecodeError as e:
+        raise _error(e.msg, pos + e.pos)
+
+
+class _EventParser:
+    """Iterator over the parsing events of a JSON text
+
+    After each event, `start` is the offset of its token and `end`
+    the offset after it. With `single_value`, parsing starts at `pos`
+    and stops after the first value, leaving the rest unchecked.
+    """
+
+    def __init__(self, data, pos: int=0, single_value: bool=False):
+        self._data = data
+        self._stack = []
+        self._state = _VALUE
+        self._single_value = single_value
+        self.start = pos
+        self.end = pos
+
+    def __iter__(self):
+        return self
+
+    def skip_container(self, end: int) -> None:
+        """Continue after the container opened by the last event, which ends at `end`"""
+        self._stack.pop()
+        self.end = end
+        self._state = _COMMA_OR_END if len(self._stack) > 0 else _DONE
+
+    def __next__(self) -> Tuple[str, object]:
+        data = self._data
+        stack = self._stack
+        state = self._state
+        pos = self.end
+        while True:
+            if state == _DONE and self._single_value:
+                raise StopIteration
+            m = _TOKEN.match(data, pos)
+            if m is None:
+                pos = _WHITESPACE.match(data, pos).end()
+                if state == _DONE and pos == len(data):
+                    raise StopIteration
+                if pos == len(data):
+                    raise _error('unexpected end of data', pos)
+                raise _error('unexpected character', pos)
+            kind = m.lastindex
+            token = m.group(kind)
+            start = m.start(kind)
+            pos = m.end()
+            if state == _VALUE or state == _VALUE_OR_END:
+                if kind != _PUNCTUATION:
+                    event = 'scalar', _decode_token(token, start)
+                elif token == b'{' or token == b'[':
+                    if len(stack) >= MAX_PARSE_DEPTH:
+                        raise _error('recursion depth exceeded', start)
+                    is_map = token == b'{'
+                    stack.append(is_map)
+                    self._state = _KEY_OR_END if is_map else _VALUE_OR_END
+                    self.start = start
+                    self.end = pos
+                    return ('start_map', None) if is_map else ('start_array', None)
+                elif token == b']' and state == _VALUE_OR_END:
+                    stack.pop()
+                    event = 'end_array', None
+                else:
+                    raise _error('expected value', start)
+            elif state == _KEY or state == _KEY_OR_END:
+                if kind == _STRING:
+                    self._state = _COLON
+                    self.start = start
+                    self.end = pos
+                    return 'map_key', _decode_token(token, start)
+                if token == b'}' and state == _KEY_OR_END:
+                    stack.pop()
+                    event = 'end_map', None
+                else:
+                    raise _error('expected key', start)
+            elif state == _COLON:
+                if token != b':':
+                    raise _error('expected colon', start)
+                state = _VALUE
+                continue
+            elif state == _COMMA_OR_END:
+                if token == b',':
+                    state = _KEY if stack[-1] else _VALUE
+                    continue
+                if token != (b'}' if stack[-1] else b']'):
+                    raise _error('expected comma or end of container', start)
+                event = ('end_map', None) if stack.pop() else ('end_array', None)
+            else:
+                raise _error('trailing characters', start)
+            # a value has been completed
+            self._state = _COMMA_OR_END if len(stack) > 0 else _DONE
+            self.start = start
+            self.end = pos
+            return event
+
+
+def iter_json_events(data) -> Iterator[Tuple[str, object]]:
+    """Return an iterator over the parsing events of a JSON text
+
+    `data` is any bytes-like object, e.g. the one provided by
+    `file_utils.mapped_file`. Scalars and keys are decoded by orjson,
+    and texts rejected by `orjson.loads` raise `orjson.JSONDecodeError`,
+    possibly after some events have been yielded.
+    """
+    return _EventParser(data)
+
+
+def _find_large_maps(data) -> dict:
+    """Find the objects of at least `BUFFER_SIZE` bytes
+
+    Returns a dict mapping the offsets of these objects to their end
+    offsets and, for objects whose keys are not sorted, their keys
+    in sorted order with the offsets of their values. Objects with
+    duplicate keys count as unsorted.
+    """
+    large_maps = dict()
+    # offset, previous key, whether keys are sorted, value offsets
+    open_maps = []
+    parser = _EventParser(data)
+    pending_key = _NO_KEY
+    for event, value in parser:
+        if pending_key is not _NO_KEY:
+            # like orjson.loads, the last one of duplicate keys wins
+            open_maps[-1][3][pending_key] = parser.start
+            pending_key = _NO_KEY
+        if event == 'map_key':
+            current = open_maps[-1]
+            if current[1] is not _NO_KEY and not value > current[1]:
+                current[2] = False
+            current[1] = value
+            pending_key = value
+        elif event == 'start_map':
+            open_maps.append([parser.start, _NO_KEY, True, dict()])
+        elif event == 'end_map':
+            start, _, is_sorted, members = open_maps.pop()
+            if parser.end - start >= BUFFER_SIZE:
+                large_maps[start] = (parser.end, None if is_sorted else sorted(members.items()))
+    return large_maps
+
+
+class _CanonicalEncoder:
+    """Encode a parsed JSON text as canonical JSON
+
+    Large objects and all arrays are passed through as they are parsed,
+    except that the members of large objects with unsorted keys are
+    parsed again from their offsets in sorted order. Small objects are
+    encoded in memory and sorted, which needs at most `BUFFER_SIZE`
+    bytes for each level of nesting.
+    """
+
+    def __init__(self, data, large_maps: dict, write):
+        self._data = data
+        self._large_maps = large_maps
+        self._write = write
+
+    def encode(self) -> None:
+        parser = _EventParser(self._data)
+        self._encode(parser, *next(parser), self._write, 1)
+
+    def _encode(self, parser, event, value, write, depth: int) -> None:
+        if event == 'scalar':
+            write(orjson.dumps(value))
+            return
+        if depth > MAX_DEPTH:
+            raise orjson.JSONEncodeError('Recursion limit reached')
+        if event == 'start_array':
+            write(b'[')
+            separator = b''
+            for event, value in parser:
+                if event == 'end_array':
+                    break
+                write(separator)
+                separator = b','
+                self._encode(parser, event, value, write, depth + 1)
+            write(b']')
+            return
+        large_map = self._large_maps.get(parser.start, None)
+        if large_map is None:
+            self._encode_small_map(parser, write, depth)
+            return
+        end, members = large_map
+        if members is None:
+            write(b'{')
+            separator = b''
+            for event, key in parser:
+                if event == 'end_map':
+                    break
+                write(separator + orjson.dumps(key) + b':')
+                separator = b','
+                self._encode(parser, *next(parser), write, depth + 1)
+            write(b'}')
+            return
+        write(b'{')
+        separator = b''
+        for key, value_pos in members:
+            write(separator + orjson.dumps(key) + b':')
+            separator = b','
+            value_parser = _EventParser(self._data, value_pos, single_value=True)
+            self._encode(value_parser, *next(value_parser), write, depth + 1)
+        write(b'}')
+        parser.skip_container(end)
+
+    def _encode_small_map(self, parser, write, depth: int) -> None:
+        members = dict()
+        for event, key in parser:
+            if event == 'end_map':
+                break
+            # like orjson.loads, the last one of duplicate keys wins
+            # (the output of orjson.dumps is copied, as it is overallocated)
+            encoded = members[key] = bytearray()
+            self._encode(parser, *next(parser), encoded.extend, depth + 1)
+        write(b'{')
+        separator = b''
+        for key in sorted(members):
+            write(separator + orjson.dumps(key) + b':')
+            separator = b','
+            write(members[key])
+        write(b'}')
+
+
+def compute_json_file_hash(filepath: Path, algo: str=DEFAULT_HASH_ALGORITHM) -> str:
+    """Compute the hash of a JSON file without loading it
+
+    The hash is equal to `compute_json_hash(load_json_file(filepath), algo)`.
+    The file is parsed twice: first to find the large objects and the
+    keys of those not sorted, then to hash its canonical representation.
+    Memory use grows with the number of keys of large unsorted objects,
+    but not with the size of the file.
+    """
+    with mapped_file(Path(filepath)) as data:
+        large_maps = _find_large_maps(data)
+        hash_obj = HASH_ALGORITHMS[algo][1]()
+        buffer = bytearray()
+
+        def write(piece):
+            buffer.extend(piece)
+            if len(buffer) >= CHUNK_SIZE:
+                hash_obj.update(buffer)
+                buffer.clear()
+
+        _CanonicalEncoder(data, large_maps, write).encode()
+        hash_obj.update(buffer)
+    return format_hash(hash_obj.digest(), algo)
+
+
+def _build_value(events, event, value):
+    """Build the value whose first event has been consumed"""
+    if event == 'scalar':
+        return value
+    root = dict() if event == 'start_map' else []
+    containers = [root]
+    key = None
+    for event, value in events:
+        if event == 'map_key':
+            key = value
+            continue
+        if event == 'end_map' or event == 'end_array':
+            containers.pop()
+            if len(containers) == 0:
+                return root
+            continue
+        if event == 'scalar':
+            child = value
+        else:
+            child = dict() if event == 'start_map' else []
+        parent = containers[-1]
+        if isinstance(parent, dict):
+            parent[key] = child
+        else:
+            parent.append(child)
+        if event != 'scalar':
+            containers.append(child)
+
+
+def _skip_value(events, event) -> None:
+    """Skip the value whose first event has been consumed"""
+    if event == 'scalar':
+        return
+    depth = 1
+    for event, _ in events:
+        if event == 'start_map' or event == 'start_array':
+            depth += 1
+        elif event == 'end_map' or event == 'end_array':
+            depth -= 1
+            if depth == 0:
+                return
+
+
+_NOT_FOUND = object()
+
+
+def _resolve(events, event, value, parts: list):
+    """Return the value at `parts` below the value whose first event has been consumed
+
+    The value is consumed completely, also after the target.
+    """
+    if len(parts) == 0:
+        return _build_value(events, event, value)
+    result = _NOT_FOUND
+    if event == 'start_map':
+        for event, key in events:
+            if event == 'end_map':
+                break
+            if key == parts[0]:
+                # like orjson.loads, the last one of duplicate keys wins
+                result = _resolve(events, *next(events), parts[1:])
+            else:
+                _skip_value(events, next(events)[0])
+    elif event == 'start_array':
+        index = parts[0]
+        if re.fullmatch(r'0|[1-9][0-9]*', index) is None:
+            index = -1
+        else:
+            index = int(index)
+        for i, (event, value) in enumerate(events):
+            if event == 'end_array':
+                break
+            if i == index:
+                result = _resolve(events, event, value, parts[1:])
+            else:
+                _skip_value(events, event)
+    else:
+        _skip_value(events, event)
+    return result
+
+
+def load_json_pointer(filepath: Path, pointer: str):
+    """Load the value at a JSON Pointer from a JSON file without loading the file
+
+    Only the addressed value is built in memory. The whole file is
+    parsed nonetheless, so that invalid files are rejected and the
+    result is the same as resolving the pointer on the loaded file.
+    Raises `jsonpointer.JsonPointerException` if there is no value.
+    """
+    parts = jsonpointer.JsonPointer(pointer).parts
+    with mapped_file(Path(filepath)) as data:
+        events = iter_json_events(data)
+        result = _resolve(events, *next(events), parts)
+        # rejects trailing characters
+        for _ in events:
+            pass
+    if result is _NOT_FOUND:
+        raise jsonpointer.JsonPointerException(f'No value at pointer {pointer!r}')
+    return result
@@ -1,7 +1,7 @@
 import jsonpatch
 import orjson
 from copy import deepcopy
-from typing import Callable
+from typing import Callable, Optional
 from .json.base_models import ExtJsonPatchBase
 
 
@@ -29,7 +29,8 @@ def apply_patch(json_dict: dict, json_patch: list, inplace=False) -> dict:
     return patch.apply(json_dict, in_place=inplace)
 
 
-def apply_ext_patch(ext_json_patch: dict, retrieve_func: Callable) -> dict:
+def apply_ext_patch(ext_json_patch: dict, retrieve_func: Callable,
+                    retrieve_many_func: Optional[Callable]=None) -> dict:
     """Apply an extended JSON patch with multiple sources
 
     Expects `ext_json_patch` to contain fields `sources`, `target` and
@@ -56,14 +57,19 @@ def apply_ext_patch(ext_json_patch: dict, retrieve_func: Callable) -> dict:
 
     The function returns the JSON dictionary associated with the
     `target` key after the application of the JSON patch.
+    If given, `retrieve_many_func` retrieves all sources at once.
     """
     ExtJsonPatchBase.model_validate(ext_json_patch)
     source_hashes  = ext_json_patch['sourceHashes']
     target = ext_json_patch['target']
     json_patch = ext_json_patch['operations']
-    sources_dict = {
-        source_alias: retrieve_func(json_hash)
-        for source_alias, json_hash in source_hashes.items()
-    }
+    if retrieve_many_func is not None:
+        sources = retrieve_many_func(list(source_hashes.values()))
+        sources_dict = dict(zip(source_hashes, sources))
+    else:
+        sources_dict = {
+            source_alias: retrieve_func(json_hash)
+            for source_alias, json_hash in source_hashes.items()
+        }
     patch_update = apply_patch(sources_dict, json_patch) 
     return patch_update[target]
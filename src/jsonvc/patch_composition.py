@@ -0,0 +1,470 @@
+from copy import deepcopy
+from typing import Any, Callable, List, Optional
+import jsonpatch
+import jsonpointer
+
+
+class PatchCompositionError(ValueError):
+    """Patches cannot be composed without knowing the document they apply to"""
+    pass
+
+
+# resolves a path, given as list of tokens, in the document the
+# first patch applies to and returns the value found there
+BaseResolver = Callable[[List[str]], Any]
+
+
+def _parse_pointer(pointer: str) -> List[str]:
+    return jsonpointer.JsonPointer(pointer).parts
+
+
+def _format_pointer(tokens: List[str]) -> str:
+    return jsonpointer.JsonPointer.from_parts(tokens).path
+
+
+def _parse_index(token: str) -> Optional[int]:
+    if token.isdigit() and (token == '0' or not token.startswith('0')):
+        return int(token)
+    return None
+
+
+class _Value:
+    """Location whose content is known
+
+    `existed` tells whether the location was present in the original
+    document (None if unknown), which decides between `add` and `replace`.
+    """
+
+    def __init__(self, value, existed: Optional[bool]):
+        self.value = value
+        self.existed = existed
+
+
+class _Removed:
+    pass
+
+
+class _BaseRange:
+    """Unmodified elements `start` to `stop` of an original array, `stop` None for all"""
+
+    def __init__(self, start: int, stop: Optional[int]):
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+
+class _BaseItem:
+    """Element of an original array, possibly replaced or modified"""
+
+    def __init__(self, index: int, change=None):
+        self.index = index
+        self.change = change
+
+
+class _Edit:
+    """Modifications of a container of the original document
+
+    The kind of the container (`object` or `array`) is only determined
+    when it matters, i.e. for operations that shift array elements.
+    For objects and containers of unknown kind, `children` holds the
+    changed members. For arrays, `items` describes the resulting array
+    as sequence of original elements and inserted values (`_Value`).
+    """
+
+    def __init__(self, base_path: List[str], kind: Optional[str]=None):
+        self.base_path = base_path
+        self.kind = kind
+        self.children = dict()
+        self.items = None
+        self.length = None
+
+
+class PatchComposer:
+    """Merge a sequence of JSON patches (RFC 6902) into one equivalent patch
+
+    The operations are recorded in a tree of changes relative to the
+    document the first patch applies to, so intermediate documents are
+    never built. Values replaced several times are only written once
+    and additions that are removed again disappear. `test` operations
+    are dropped, as the patches are assumed to apply.
+
+    Some operations cannot be composed without looking at that document,
+    e.g. shifting array elements of a container not known to be an array
+    or moving content that was never written by the patches. These are
+    resolved with `resolve_base` if given; otherwise
+    `PatchCompositionError` is raised.
+    """
+
+    def __init__(self, resolve_base: Optional[BaseResolver]=None):
+        self._resolve_base = resolve_base
+        self._root = _Edit([])
+
+    def _resolve(self, base_path: List[str]):
+        if self._resolve_base is None:
+            raise PatchCompositionError(
+                f'The patches cannot be composed without the document at `{_format_pointer(base_path)}`'
+            )
+        return self._resolve_base(base_path)
+
+    # arrays
+
+    def _make_array(self, edit: _Edit, length: Optional[int]=None) -> None:
+        """Turn an edit of unknown kind into an array edit"""
+        edit.kind = 'array'
+        indexed = dict()
+        for token, change in edit.children.items():
+            index = _parse_index(token)
+            if index is None:
+                raise PatchCompositionError(f'Invalid array index `{token}`')
+            indexed[index] = change
+        edit.children = dict()
+        edit.items = []
+        start = 0
+        for index in sorted(indexed):
+            if index > start:
+                edit.items.append(_BaseRange(start, index))
+            if isinstance(indexed[index], _Removed):
+                raise PatchCompositionError(f'Invalid removal of array element {index}')
+            edit.items.append(_BaseItem(index, indexed[index]))
+            start = index + 1
+        if length is None or start < length:
+            edit.items.append(_BaseRange(start, length))
+        edit.length = length
+
+    def _determine_kind(self, edit: _Edit, token: str) -> None:
+        if edit.kind is not None:
+            return
+        if token == '-':
+            self._make_array(edit)
+        elif _parse_index(token) is None:
+            edit.kind = 'object'
+        else:
+            base_value = self._resolve(edit.base_path)
+            if isinstance(base_value, list):
+                self._make_array(edit, len(base_value))
+            else:
+                edit.kind = 'object'
+
+    def _close_array(self, edit: _Edit) -> None:
+        """Learn the length of the original array"""
+        length = len(self._resolve(edit.base_path))
+        edit.length = length
+        last = edit.items.index(next(i for i in edit.items if isinstance(i, _BaseRange) and i.stop is None))
+        base_range = edit.items[last]
+        if base_range.start < length:
+            base_range.stop = length
+        else:
+            del edit.items[last]
+
+    def _locate(self, edit: _Edit, position: int, insert: bool=False) -> int:
+        """Return the entry of `items` at a position of the resulting array
+
+        Ranges are split so that the entry is a single element. With
+        `insert`, the position may be the end of the array and the
+        index of the entry before which to insert is returned.
+        """
+        while True:
+            offset = position
+            for i, item in enumerate(edit.items):
+                if isinstance(item, _BaseRange) and item.stop is None:
+                    if any(not isinstance(x, _BaseRange) for x in edit.items[i+1:]):
+                        # appended values follow an unknown number of elements
+                        break
+                    return self._split(edit, i, offset)
+                size = len(item) if isinstance(item, _BaseRange) else 1
+                if offset < size:
+                    return self._split(edit, i, offset) if isinstance(item, _BaseRange) else i
+                offset -= size
+            else:
+                if insert and offset == 0:
+                    return len(edit.items)
+                raise PatchCompositionError(f'Array index {position} is out of range')
+            self._close_array(edit)
+
+    @staticmethod
+    def _split(edit: _Edit, i: int, offset: int) -> int:
+        item = edit.items[i]
+        index = item.start + offset
+        pieces = []
+        if offset > 0:
+            pieces.append(_BaseRange(item.start, index))
+        pieces.append(_BaseItem(index))
+        if item.stop is None or index + 1 < item.stop:
+            pieces.append(_BaseRange(index + 1, item.stop))
+        edit.items[i:i+1] = pieces
+        return i + len(pieces) - (2 if item.stop is None or index + 1 < item.stop else 1)
+
+    # operations
+
+    def _get_child(self, edit: _Edit, token: str):
+        """Return the change of a member of a container, None if unchanged"""
+        if edit.kind == 'array':
+            if token == '-':
+                raise PatchCompositionError('`-` does not refer to an existing element')
+            index = _parse_index(token)
+            if index is None:
+                raise PatchCompositionError(f'Invalid array index `{token}`')
+            item = edit.items[self._locate(edit, index)]
+            return item if isinstance(item, _Value) else item.change
+        return edit.children.get(token, None)
+
+    def _set_child(self, edit: _Edit, token: str, change) -> None:
+        if edit.kind == 'array':
+            i = self._locate(edit, _parse_index(token))
+            if isinstance(edit.items[i], _Value):
+                edit.items[i] = change
+            else:
+                edit.items[i].change = change
+        else:
+            edit.children[token] = change
+
+    def _descend(self, edit: _Edit, token: str):
+        change = self._get_child(edit, token)
+        if change is None:
+            base_token = token
+            if edit.kind == 'array':
+                base_token = str(edit.items[self._locate(edit, _parse_index(token))].index)
+            change = _Edit(edit.base_path + [base_token])
+            self._set_child(edit, token, change)
+        elif isinstance(change, _Removed):
+            raise PatchCompositionError(f'Path below removed member `{token}`')
+        return change
+
+    def _add(self, edit: _Edit, token: str, value) -> None:
+        self._determine_kind(edit, token)
+        if edit.kind == 'array':
+            if token == '-':
+                edit.items.append(_Value(value, False))
+                return
+            position = _parse_index(token)
+            if position is None:
+                raise PatchCompositionError(f'Invalid array index `{token}`')
+            edit.items.insert(self._locate(edit, position, insert=True), _Value(value, False))
+            return
+        change = edit.children.get(token, None)
+        if isinstance(change, _Removed):
+            existed = True
+        elif isinstance(change, _Value):
+            existed = change.existed
+        elif isinstance(change, _Edit):
+            existed = True
+        else:
+            existed = None
+        edit.children[token] = _Value(value, existed)
+
+    def _replace(self, edit: _Edit, token: str, value) -> None:
+        if edit.kind == 'array':
+            self._set_child(edit, token, _Value(value, True))
+            return
+        change = edit.children.get(token, None)
+        if isinstance(change, _Removed):
+            raise PatchCompositionError(f'Replacing removed member `{token}`')
+        existed = change.existed if isinstance(change, _Value) else True
+        edit.children[token] = _Value(value, existed)
+
+    def _remove(self, edit: _Edit, token: str) -> None:
+        self._determine_kind(edit, token)
+        if edit.kind == 'array':
+            position = _parse_index(token)
+            if position is None:
+                raise PatchCompositionError(f'Invalid array index `{token}`')
+            del edit.items[self._locate(edit, position)]
+            return
+        change = edit.children.get(token, None)
+        if isinstance(change, _Removed):
+            raise PatchCompositionError(f'Removing removed member `{token}`')
+        if isinstance(change, _Value) and change.existed is None:
+            base_value = self._resolve(edit.base_path)
+            change.existed = isinstance(base_value, dict) and token in base_value
+        if isinstance(change, _Value) and not change.existed:
+            del edit.children[token]
+        else:
+            edit.children[token] = _Removed()
+
+    def _get_value(self, tokens: List[str]):
+        """Return a copy of the value at a path of the current document"""
+        change = self._root
+        for i, token in enumerate(tokens):
+            if isinstance(change, _Value):
+                return deepcopy(jsonpointer.resolve_pointer(change.value, _format_pointer(tokens[i:])))
+            if isinstance(change, _Edit) and change.kind is None and token != '-' \
+                    and _parse_index(token) is not None and token not in change.children:
+                self._determine_kind(change, token)
+            child = self._get_child(change, token)
+            if child is None:
+                # unchanged content of the original document
+                if change.kind == 'array':
+                    token = str(change.items[self._locate(change, _parse_index(token))].index)
+                return deepcopy(self._resolve(change.base_path + [token] + tokens[i+1:]))
+            if isinstance(child, _Removed):
+                raise PatchCompositionError(f'Path `{_format_pointer(tokens)}` was removed')
+            change = child
+        if isinstance(change, _Value):
+            return deepcopy(change.value)
+        # original content with changes, built from the original document
+        value = deepcopy(self._resolve(change.base_path))
+        patch = []
+        self._emit(change, [], patch)
+        return jsonpatch.apply_patch(value, deepcopy(patch))
+
+    def _apply_to_value(self, change: _Value, tokens: List[str], operation: dict) -> None:
+        operation = dict(operation, path=_format_pointer(tokens))
+        change.value = jsonpatch.apply_patch(change.value, [operation])
+
+    def _apply_at(self, tokens: List[str], operation: dict) -> None:
+        op = operation['op']
+        if len(tokens) == 0:
+            if op == 'remove':
+                raise PatchCompositionError('The document cannot be removed')
+            self._root = _Value(deepcopy(operation['value']), True)
+            return
+        change = self._root
+        for i, token in enumerate(tokens[:-1]):
+            if isinstance(change, _Value):
+                self._apply_to_value(change, tokens[i:], operation)
+                return
+            change = self._descend(change, token)
+            if isinstance(change, _BaseItem):
+                raise PatchCompositionError('Invalid path')
+        if isinstance(change, _Value):
+            self._apply_to_value(change, tokens[-1:], operation)
+            return
+        token = tokens[-1]
+        if op == 'add':
+            self._add(change, token, deepcopy(operation['value']))
+        elif op == 'replace':
+            self._replace(change, token, deepcopy(operation['value']))
+        else:
+            self._remove(change, token)
+
+    def apply(self, operation: dict) -> None:
+        """Record a patch operation"""
+        op = operation['op']
+        tokens = _parse_pointer(operation['path'])
+        if op == 'test':
+            return
+        if op in ('move', 'copy'):
+            from_tokens = _parse_pointer(operation['from'])
+            value = self._get_value(from_tokens)
+            if op == 'move':
+                self._apply_at(from_tokens, {'op': 'remove'})
+            self._apply_at(tokens, {'op': 'add', 'value': value})
+        elif op in ('add', 'replace', 'remove'):
+            self._apply_at(tokens, operation)
+        else:
+            raise PatchCompositionError(f'Unknown operation `{op}`')
+
+    def apply_patch(self, patch: List[dict]) -> None:
+        for operation in patch:
+            self.apply(operation)
+
+    # output
+
+    def _emit(self, change, tokens: List[str], patch: List[dict]) -> None:
+        if not isinstance(change, _Edit):
+            return
+        if change.kind == 'array':
+            self._emit_array(change, tokens, patch)
+            return
+        for token, child in change.children.items():
+            path = _format_pointer(tokens + [token])
+            if isinstance(child, _Removed):
+                patch.append({'op': 'remove', 'path': path})
+            elif isinstance(child, _Value):
+                op = 'replace' if child.existed else 'add'
+                patch.append({'op': op, 'path': path, 'value': child.value})
+            else:
+                self._emit(child, tokens + [token], patch)
+
+    def _emit_array(self, edit: _Edit, tokens: List[str], patch: List[dict]) -> None:
+        # elements left of `position` are final, the others still original
+        position = 0
+        base_index = 0
+
+        def remove_until(index):
+            nonlocal base_index
+            while base_index < index:
+                patch.append({'op': 'remove', 'path': _format_pointer(tokens + [str(position)])})
+                base_index += 1
+
+        for item in edit.items:
+            if isinstance(item, _Value):
+                token = '-' if position is None else str(position)
+                patch.append({'op': 'add', 'path': _format_pointer(tokens + [token]), 'value': item.value})
+                if position is not None:
+                    position += 1
+            elif isinstance(item, _BaseRange):
+                remove_until(item.start)
+                if item.stop is None:
+                    position = None
+                else:
+                    position += len(item)
+                    base_index = item.stop
+            else:
+                remove_until(item.index)
+                path_tokens = tokens + [str(position)]
+                if isinstance(item.change, _Value):
+                    patch.append({'op': 'replace', 'path': _format_pointer(path_tokens), 'value': item.change.value})
+                else:
+                    self._emit(item.change, path_tokens, patch)
+                position += 1
+                base_index += 1
+        if edit.length is not None and position is not None:
+            remove_until(edit.length)
+
+    def get_patch(self) -> List[dict]:
+        """Return the composed patch"""
+        if isinstance(self._root, _Value):
+            return [{'op': 'replace', 'path': '', 'value': deepcopy(self._root.value)}]
+        patch = []
+        self._emit(self._root, [], patch)
+        return deepcopy(patch)
+
+
+def compose_patches(patches: List[List[dict]],
+                    resolve_base: Optional[BaseResolver]=None) -> List[dict]:
+    """Return a patch equivalent to applying the patches one after the other"""
+    composer = PatchComposer(resolve_base)
+    for patch in patches:
+        composer.apply_patch(patch)
+    return composer.get_patch()
+
+
+def make_base_resolver(load_func: Callable[[], Any]) -> BaseResolver:
+    """Create a resolver loading the original document on first use"""
+    cache = []
+
+    def resolve(tokens):
+        if len(cache) == 0:
+            cache.append(load_func())
+        return jsonpointer.resolve_pointer(cache[0], _format_pointer(tokens))
+
+    return resolve
+
+
+def squash_ext_patches(ext_patches: List[dict],
+                       resolve_base: Optional[BaseResolver]=None) -> dict:
+    """Compact a chain of single-source extended JSON patches into one
+
+    Each patch must apply to the result of the previous one, as is the
+    case for the patches along a linear history. `resolve_base` resolves
+    paths in the extended document of the first patch, i.e. below the
+    alias of its source.
+    """
+    if len(ext_patches) == 0:
+        raise ValueError('At least one patch is required')
+    first = ext_patches[0]
+    if len(first['sourceHashes']) != 1:
+        raise PatchCompositionError('Only patches with a single source can be squashed')
+    alias = next(iter(first['sourceHashes']))
+    for ext_patch in ext_patches:
+        if list(ext_patch['sourceHashes']) != [alias] or ext_patch['target'] != alias:
+            raise PatchCompositionError('The patches do not form a chain')
+    operations = compose_patches([p['operations'] for p in ext_patches], resolve_base)
+    return {
+        'sourceHashes': dict(first['sourceHashes']),
+        'target': alias,
+        'operations': operations,
+    }
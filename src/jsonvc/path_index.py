@@ -0,0 +1,145 @@
+from typing import Iterator, List, Optional, Set, Tuple
+
+
+def split_pointer(pointer: str) -> List[str]:
+    """Split a JSON Pointer into its (still escaped) reference tokens"""
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise ValueError(f'Invalid JSON Pointer `{pointer}`')
+    return pointer.split('/')[1:]
+
+
+def get_pointer_prefixes(pointer: str) -> List[str]:
+    """Return the pointer and all its ancestors, starting with the root"""
+    tokens = split_pointer(pointer)
+    return [''.join('/' + t for t in tokens[:i]) for i in range(len(tokens) + 1)]
+
+
+def escape_pointer_token(token: str) -> str:
+    return token.replace('~', '~0').replace('/', '~1')
+
+
+def iter_leaf_pointers(json_obj, pointer: str='') -> Iterator[Tuple[str, object]]:
+    """Yield pointers and values of all scalars and empty containers"""
+    if isinstance(json_obj, dict) and len(json_obj) > 0:
+        for k, v in json_obj.items():
+            yield from iter_leaf_pointers(v, pointer + '/' + escape_pointer_token(k))
+    elif isinstance(json_obj, list) and len(json_obj) > 0:
+        for i, v in enumerate(json_obj):
+            yield from iter_leaf_pointers(v, pointer + '/' + str(i))
+    else:
+        yield pointer, json_obj
+
+
+def _is_array_position(token: str) -> bool:
+    return token == '-' or token.isdigit()
+
+
+def get_touched_pointers(ext_json_patch: dict) -> Set[str]:
+    """Extract the pointers whose values an extended JSON patch modifies
+
+    The value at a returned pointer, including everything below it,
+    may have changed. Insertions and removals of array elements shift
+    all following elements, so the array itself is returned in that
+    case. Pointers are relative to the target document.
+    """
+    prefix = '/' + ext_json_patch['target']
+    touched = set()
+    for operation in ext_json_patch['operations']:
+        op = operation['op']
+        if op == 'test':
+            continue
+        pointers = [operation['path']]
+        if op == 'move':
+            pointers.append(operation['from'])
+        for pointer in pointers:
+            if pointer != prefix and not pointer.startswith(prefix + '/'):
+                # modifies another source, which is not part of the result
+                continue
+            pointer = pointer[len(prefix):]
+            tokens = split_pointer(pointer)
+            if op in ('add', 'remove', 'move') and len(tokens) > 0 \
+                    and _is_array_position(tokens[-1]):
+                pointer = ''.join('/' + t for t in tokens[:-1])
+            touched.add(pointer)
+    return touched
+
+
+class JsonPathIndex:
+    """Inverted index from JSON Pointers to the nodes that modified them
+
+    A node modifying the value at a pointer is registered under the
+    pointer in the `replaced` entries and under the pointer and all
+    its ancestors in the `subtree` entries. Genesis nodes are registered
+    as replacing the root. The nodes that modified the value at a
+    pointer are thus found with one lookup in the `subtree` entries
+    for modifications at or below the pointer and one lookup in the
+    `replaced` entries for each of its ancestors.
+    """
+
+    def __init__(self) -> None:
+        self._subtree = dict()
+        self._replaced = dict()
+        self._indexed_nodes = set()
+        self._dirty_subtree = set()
+        self._dirty_replaced = set()
+        self._dirty_nodes = set()
+
+    def to_dict(self):
+        return {
+            'subtree': {p: sorted(v) for p, v in self._subtree.items()},
+            'replaced': {p: sorted(v) for p, v in self._replaced.items()},
+            'indexed_nodes': sorted(self._indexed_nodes),
+        }
+
+    def from_dict(self, index_dict, update=True):
+        if not update:
+            self._subtree = dict()
+            self._replaced = dict()
+            self._indexed_nodes = set()
+        for p, v in index_dict['subtree'].items():
+            self._subtree.setdefault(p, set()).update(v)
+        for p, v in index_dict['replaced'].items():
+            self._replaced.setdefault(p, set()).update(v)
+        self._indexed_nodes.update(index_dict['indexed_nodes'])
+
+    def pop_delta(self) -> Optional[dict]:
+        """Return entries registered since the last call in `to_dict` format"""
+        if len(self._dirty_nodes) == 0:
+            return None
+        delta = {
+            'subtree': {p: sorted(self._subtree[p]) for p in self._dirty_subtree},
+            'replaced': {p: sorted(self._replaced[p]) for p in self._dirty_replaced},
+            'indexed_nodes': sorted(self._dirty_nodes),
+        }
+        self._dirty_subtree = set()
+        self._dirty_replaced = set()
+        self._dirty_nodes = set()
+        return delta
+
+    def is_indexed(self, node_hash: str) -> bool:
+        return node_hash in self._indexed_nodes
+
+    def _register(self, node_hash: str, touched: Set[str]) -> None:
+        for pointer in touched:
+            for prefix in get_pointer_prefixes(pointer):
+                self._subtree.setdefault(prefix, set()).add(node_hash)
+                self._dirty_subtree.add(prefix)
+            self._replaced.setdefault(pointer, set()).add(node_hash)
+            self._dirty_replaced.add(pointer)
+        self._indexed_nodes.add(node_hash)
+        self._dirty_nodes.add(node_hash)
+
+    def add_genesis_node(self, node_hash: str) -> None:
+        self._register(node_hash, {''})
+
+    def add_node(self, node_hash: str, ext_json_patch: dict) -> None:
+        self._register(node_hash, get_touched_pointers(ext_json_patch))
+
+    def find_nodes(self, pointer: str) -> Set[str]:
+        """Return the indexed nodes that modified the value at `pointer`"""
+        node_hashes = set(self._subtree.get(pointer, ()))
+        for prefix in get_pointer_prefixes(pointer)[:-1]:
+            node_hashes.update(self._replaced.get(prefix, ()))
+        return node_hashes
@@ -0,0 +1,192 @@
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from .storage import JsonStorageProvider
+
+
+BATCH_SIZE = 256
+
+
+class SyncResult(NamedTuple):
+    # hashes of the root nodes in the destination
+    root_hashes: Dict[str, str]
+    num_nodes: int
+    num_objects: int
+
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i+size]
+
+
+def group_nodes_by_level(node_sources: Dict[str, List[str]]) -> List[List[str]]:
+    """Group nodes so that their sources are in earlier groups
+
+    `node_sources` maps node hashes to the hashes of their source nodes.
+    Sources that are not keys of `node_sources` are ignored.
+    """
+    levels = dict()
+    for node_hash in node_sources:
+        stack = [node_hash]
+        while len(stack) > 0:
+            cur_hash = stack[-1]
+            if cur_hash in levels:
+                stack.pop()
+                continue
+            sources = [h for h in node_sources[cur_hash] if h in node_sources]
+            unresolved = [h for h in sources if h not in levels]
+            if len(unresolved) > 0:
+                stack.extend(unresolved)
+                continue
+            levels[cur_hash] = 1 + max((levels[h] for h in sources), default=-1)
+            stack.pop()
+    grouped = [[] for _ in range(1 + max(levels.values(), default=-1))]
+    for node_hash, level in levels.items():
+        grouped[level].append(node_hash)
+    return grouped
+
+
+def uses_same_hashes(src: JsonStorageProvider, dst: JsonStorageProvider) -> bool:
+    probe = {'jsonvc-probe': 1}
+    return src.compute_hash(probe) == dst.compute_hash(probe)
+
+
+class Replicator:
+    """Copy the objects reachable from root nodes that a destination lacks
+
+    The graph is walked from the roots one generation of nodes at a time,
+    with a batched existence check in the destination per generation.
+    Objects are stored in the destination so that a node is only stored
+    after its patch, its document and its source nodes, hence a node
+    found in the destination stands for its whole history and is not
+    descended into. An interrupted run therefore leaves a consistent
+    destination, and running it again resumes where it stopped.
+
+    If the two storages compute different hashes, e.g. sha256 and
+    IPFS CIDs, the references in nodes and patches are rewritten. The
+    correspondence of source and destination hashes is collected in
+    `hash_map`, which should be kept between runs to recognize objects
+    transferred before; without it, everything is transferred again.
+    """
+
+    def __init__(self, src: JsonStorageProvider, dst: JsonStorageProvider,
+                 hash_map: Optional[Dict[str, str]]=None, translate: Optional[bool]=None,
+                 batch_size: int=BATCH_SIZE):
+        self._src = src
+        self._dst = dst
+        self._hash_map = dict() if hash_map is None else hash_map
+        self._translate = not uses_same_hashes(src, dst) if translate is None else translate
+        self._batch_size = batch_size
+
+    def get_hash_map(self) -> Dict[str, str]:
+        return self._hash_map
+
+    def _get_dst_hash(self, src_hash: str) -> Optional[str]:
+        if not self._translate:
+            return src_hash
+        return self._hash_map.get(src_hash, None)
+
+    def _exists_many(self, src_hashes: List[str]) -> List[bool]:
+        """Return whether the destination has the objects"""
+        dst_hashes = [self._get_dst_hash(h) for h in src_hashes]
+        known = [h for h in dst_hashes if h is not None]
+        flags = dict()
+        for chunk in _chunks(known, self._batch_size):
+            flags.update(zip(chunk, self._dst.exists_many(chunk)))
+        return [h is not None and flags[h] for h in dst_hashes]
+
+    def _load_many(self, src_hashes: List[str]) -> List[dict]:
+        json_dicts = []
+        for chunk in _chunks(src_hashes, self._batch_size):
+            json_dicts.extend(self._src.load_many(chunk))
+        return json_dicts
+
+    def find_missing_nodes(self, root_node_hashes: Iterable[str]) -> Dict[str, dict]:
+        """Return the nodes reachable from the roots the destination lacks"""
+        missing = dict()
+        pending = list(dict.fromkeys(root_node_hashes))
+        while len(pending) > 0:
+            exist_flags = self._exists_many(pending)
+            node_hashes = [h for h, exists in zip(pending, exist_flags) if not exists]
+            next_pending = dict()
+            for node_hash, node_dict in zip(node_hashes, self._load_many(node_hashes)):
+                missing[node_hash] = node_dict
+                for source_hash in node_dict.get('sourceHashes', None) or []:
+                    if source_hash not in missing:
+                        next_pending[source_hash] = None
+            pending = list(next_pending)
+        return missing
+
+    def _transfer(self, src_hashes: List[str], rewrite_func=None,
+                  loaded: Optional[Dict[str, dict]]=None) -> int:
+        """Store objects of the source in the destination, return how many"""
+        src_hashes = list(dict.fromkeys(src_hashes))
+        exist_flags = self._exists_many(src_hashes)
+        src_hashes = [h for h, exists in zip(src_hashes, exist_flags) if not exists]
+        for chunk in _chunks(src_hashes, self._batch_size):
+            if loaded is not None:
+                json_dicts = [loaded[h] for h in chunk]
+            else:
+                json_dicts = self._src.load_many(chunk)
+            if rewrite_func is not None:
+                json_dicts = [rewrite_func(d) for d in json_dicts]
+            self._store_many(chunk, json_dicts)
+        return len(src_hashes)
+
+    def _store_many(self, src_hashes: List[str], json_dicts: List[dict]) -> None:
+        dst_hashes = self._dst.store_many(json_dicts)
+        for src_hash, dst_hash in zip(src_hashes, dst_hashes):
+            if not self._translate and dst_hash != src_hash:
+                raise ValueError(f'Object {src_hash} was stored as {dst_hash}')
+            if self._translate:
+                self._hash_map[src_hash] = dst_hash
+
+    def _rewrite_patch(self, patch_dict: dict) -> dict:
+        if not self._translate:
+            return patch_dict
+        source_hashes = {
+            alias: None if h is None else self._hash_map[h]
+            for alias, h in patch_dict['sourceHashes'].items()
+        }
+        return dict(patch_dict, sourceHashes=source_hashes)
+
+    def _rewrite_node(self, node_dict: dict) -> dict:
+        if not self._translate:
+            return node_dict
+        patch_hash = node_dict['extJsonPatchHash']
+        source_hashes = node_dict.get('sourceHashes', None)
+        return dict(
+            node_dict,
+            documentHash=self._hash_map[node_dict['documentHash']],
+            extJsonPatchHash=None if patch_hash is None else self._hash_map[patch_hash],
+            sourceHashes=None if source_hashes is None else [self._hash_map[h] for h in source_hashes],
+        )
+
+    def sync(self, root_node_hashes: Iterable[str]) -> SyncResult:
+        root_node_hashes = list(root_node_hashes)
+        missing = self.find_missing_nodes(root_node_hashes)
+        patch_hashes = [
+            d['extJsonPatchHash'] for d in missing.values()
+            if d['extJsonPatchHash'] is not None
+        ]
+        doc_hashes = [d['documentHash'] for d in missing.values()]
+        patches = None
+        if self._translate:
+            # source documents of patches of nodes whose sources are not missing
+            patches = dict(zip(patch_hashes, self._load_many(patch_hashes)))
+            for patch_dict in patches.values():
+                doc_hashes.extend(h for h in patch_dict['sourceHashes'].values() if h is not None)
+        num_objects = self._transfer(doc_hashes)
+        num_objects += self._transfer(patch_hashes, self._rewrite_patch, patches)
+        node_sources = {h: d.get('sourceHashes', None) or [] for h, d in missing.items()}
+        for level in group_nodes_by_level(node_sources):
+            for chunk in _chunks(level, self._batch_size):
+                self._store_many(chunk, [self._rewrite_node(missing[h]) for h in chunk])
+        num_objects += len(missing)
+        root_hashes = {h: self._get_dst_hash(h) for h in root_node_hashes}
+        return SyncResult(root_hashes, len(missing), num_objects)
+
+
+def sync_storage(src: JsonStorageProvider, dst: JsonStorageProvider,
+                 root_node_hashes: Iterable[str],
+                 hash_map: Optional[Dict[str, str]]=None) -> SyncResult:
+    """Copy the histories of the root nodes from `src` to `dst`"""
+    return Replicator(src, dst, hash_map).sync(root_node_hashes)
@@ -0,0 +1,176 @@
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List
+import orjson
+from .storage import JsonStorageProvider, JsonObjectIndex
+from .checksum import (
+    DEFAULT_HASH_ALGORITHM,
+    check_hash_algorithm,
+    compute_bytes_hash,
+    compute_json_hash,
+    get_hash_algorithm,
+)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    stored_at REAL NOT NULL
+) WITHOUT ROWID
+"""
+# stay below the limit of host parameters of old SQLite versions
+_MAX_QUERY_PARAMS = 500
+
+
+class SqliteJsonStorageProvider(JsonStorageProvider, JsonObjectIndex):
+    """Store JSON objects as canonical JSON blobs in an SQLite database
+
+    The database is used in write-ahead logging mode, so that readers
+    do not block the writer. All objects stored within `transaction`
+    are committed atomically, which `JsonTrackGraph` uses to store the
+    document, patch and node of a new node together.
+
+    The connection may be used from several threads, e.g. by
+    `AsyncJsonStorageAdapter`. Its statements are serialized by a lock,
+    which a transaction holds until it ends, so that statements of
+    other threads do not become part of it.
+    """
+
+    def __init__(self, db_path: Path, timeout: float=30.0,
+                 hash_algorithm: str=DEFAULT_HASH_ALGORITHM):
+        check_hash_algorithm(hash_algorithm)
+        self._db_path = Path(db_path)
+        self._hash_algorithm = hash_algorithm
+        # transactions are managed explicitly
+        self._conn = sqlite3.connect(
+            str(self._db_path), timeout=timeout, isolation_level=None, check_same_thread=False
+        )
+        self._lock = threading.RLock()
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # in WAL mode, commits are durable after the next checkpoint
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(_SCHEMA)
+        self._transaction_depth = 0
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            if self._transaction_depth > 0:
+                # nested transactions are part of the outermost one
+                self._transaction_depth += 1
+                try:
+                    yield
+                finally:
+                    self._transaction_depth -= 1
+                return
+            self._conn.execute('BEGIN IMMEDIATE')
+            self._transaction_depth = 1
+            try:
+                yield
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            else:
+                self._conn.execute('COMMIT')
+            finally:
+                self._transaction_depth = 0
+
+    def _execute(self, sql: str, params=()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _decode(json_hash: str, data: bytes) -> dict:
+        # the blob is the canonical representation the hash was computed from
+        try:
+            algo = get_hash_algorithm(json_hash)
+        except ValueError:
+            raise ValueError('JSON object compromised')
+        if compute_bytes_hash(data, algo) != json_hash:
+            raise ValueError('JSON object compromised')
+        return orjson.loads(data)
+
+    def load(self, json_hash: str) -> dict:
+        return self._decode(json_hash, self._query_column('data', json_hash))
+
+    def _query_many(self, column: str, json_hashes: List[str]) -> dict:
+        unique_hashes = list(dict.fromkeys(json_hashes))
+        results = dict()
+        for i in range(0, len(unique_hashes), _MAX_QUERY_PARAMS):
+            chunk = unique_hashes[i:i+_MAX_QUERY_PARAMS]
+            placeholders = ', '.join('?' * len(chunk))
+            results.update(self._execute(
+                f'SELECT hash, {column} FROM objects WHERE hash IN ({placeholders})', chunk
+            ))
+        return results
+
+    def load_many(self, json_hashes: List[str]) -> List[dict]:
+        blobs = self._query_many('data', json_hashes)
+        json_dicts = []
+        for json_hash in json_hashes:
+            if json_hash not in blobs:
+                raise KeyError(f'No JSON object stored under hash {json_hash}')
+            json_dicts.append(self._decode(json_hash, blobs[json_hash]))
+        return json_dicts
+
+    def _encode(self, json_dict: dict):
+        data = orjson.dumps(json_dict, option=orjson.OPT_SORT_KEYS)
+        return compute_bytes_hash(data, self._hash_algorithm), data
+
+    def store(self, json_dict: dict) -> str:
+        json_hash, data = self._encode(json_dict)
+        self._execute(
+            'INSERT OR IGNORE INTO objects (hash, data, stored_at) VALUES (?, ?, ?)',
+            (json_hash, data, time.time())
+        )
+        return json_hash
+
+    def store_many(self, json_dicts: List[dict]) -> List[str]:
+        rows = [self._encode(d) for d in json_dicts]
+        stored_at = time.time()
+        with self.transaction():
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO objects (hash, data, stored_at) VALUES (?, ?, ?)',
+                ((json_hash, data, stored_at) for json_hash, data in rows)
+            )
+        return [json_hash for json_hash, _ in rows]
+
+    def exists(self, json_hash: str) -> bool:
+        rows = self._execute('SELECT 1 FROM objects WHERE hash = ?', (json_hash,))
+        return len(rows) > 0
+
+    def exists_many(self, json_hashes: List[str]) -> List[bool]:
+        found = self._query_many('1', json_hashes)
+        return [h in found for h in json_hashes]
+
+    def compute_hash(self, json_dict: dict) -> str:
+        return compute_json_hash(json_dict, self._hash_algorithm)
+
+    def get_hash_algorithm(self) -> str:
+        return self._hash_algorithm
+
+    def index(self):
+        return [row[0] for row in self._execute('SELECT hash FROM objects')]
+
+    def _query_column(self, column: str, json_hash: str):
+        rows = self._execute(f'SELECT {column} FROM objects WHERE hash = ?', (json_hash,))
+        if not rows:
+            raise KeyError(f'No JSON object stored under hash {json_hash}')
+        return rows[0][0]
+
+    def size(self, json_hash: str) -> int:
+        return self._query_column('length(data)', json_hash)
+
+    def mtime(self, json_hash: str) -> float:
+        return self._query_column('stored_at', json_hash)
+
+    def remove(self, json_hash: str) -> None:
+        self._execute('DELETE FROM objects WHERE hash = ?', (json_hash,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,126 @@
+import os
+import time
+import multiprocessing
+from functools import partial
+from pathlib import Path
+from typing import Callable, Iterator, List, NamedTuple, Optional, Set
+from .storage_utils import hash_json_file
+from .version_control import JsonFileVersionControl
+
+
+FILE_STATES = ('unchanged', 'modified', 'untracked', 'invalid')
+
+
+class FileStatus(NamedTuple):
+    """State of a working file relative to the tracked documents
+
+    `state` is one of `FILE_STATES`. `node_hashes` are the nodes with
+    the same document as the file and `ancestor_hash` is the node the
+    file was last seen tracked as, which is the nearest tracked ancestor
+    of a modified file.
+    """
+    path: str
+    state: str
+    doc_hash: Optional[str] = None
+    node_hashes: Set[str] = frozenset()
+    ancestor_hash: Optional[str] = None
+    error: Optional[str] = None
+
+
+def iter_json_files(paths: List[Path]) -> Iterator[str]:
+    """Yield the given files and the JSON files in the given directories
+
+    Hidden directories, e.g. `.git`, are skipped.
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield str(path)
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+            for filename in sorted(filenames):
+                if filename.endswith('.json'):
+                    yield os.path.join(dirpath, filename)
+
+
+def get_parallel_hash_func(filevc: JsonFileVersionControl) -> Optional[Callable]:
+    """Return the file hash function of the storage if it can run in a worker process"""
+    algo = filevc.get_hash_algorithm()
+    if algo is None:
+        return None
+    return partial(hash_json_file, algo=algo, stream_min_size=filevc.get_stream_min_size())
+
+
+def _hash_file(filepath: str, hash_func: Callable):
+    read_ns = time.time_ns()
+    try:
+        doc_hash = hash_func(filepath)
+    except Exception as exc:
+        return filepath, read_ns, None, f'{type(exc).__name__}: {exc}'
+    return filepath, read_ns, doc_hash, None
+
+
+def _hash_file_task(args):
+    return _hash_file(*args)
+
+
+def get_file_status(filevc: JsonFileVersionControl, paths: List[Path],
+                    num_workers: Optional[int]=None) -> Iterator[FileStatus]:
+    """Yield the state of all JSON files in `paths` as soon as it is known
+
+    Files whose document hash is in the file index are reported first.
+    The other files are hashed in `num_workers` processes (default:
+    number of CPUs) if the hash function of the storage allows it.
+    The file index is updated with the computed hashes.
+    """
+    file_index = filevc.get_file_index()
+    cache = filevc.get_cache()
+
+    def classify(filepath, doc_hash, error=None):
+        if doc_hash is None:
+            return FileStatus(filepath, 'invalid', error=error)
+        ancestor_hash = file_index.get_tracked_node(filepath)
+        node_hashes = filevc.find_file_node_hashes(filepath, doc_hash)
+        if len(node_hashes) > 0:
+            if len(node_hashes) == 1:
+                ancestor_hash = list(node_hashes)[0]
+                file_index.set_tracked_node(filepath, ancestor_hash)
+            return FileStatus(filepath, 'unchanged', doc_hash, node_hashes, ancestor_hash)
+        if ancestor_hash is not None and cache.has_node(ancestor_hash):
+            return FileStatus(filepath, 'modified', doc_hash, ancestor_hash=ancestor_hash)
+        return FileStatus(filepath, 'untracked', doc_hash)
+
+    pending = []
+    stat_results = {}
+    for filepath in iter_json_files(paths):
+        try:
+            stat_result = os.stat(filepath)
+        except OSError as exc:
+            yield classify(filepath, None, f'{type(exc).__name__}: {exc}')
+            continue
+        doc_hash = file_index.lookup(filepath, stat_result)
+        if doc_hash is not None:
+            yield classify(filepath, doc_hash)
+            continue
+        stat_results[filepath] = stat_result
+        pending.append(filepath)
+
+    hash_func = get_parallel_hash_func(filevc)
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    if hash_func is None or num_workers <= 1 or len(pending) < 2:
+        results = (_hash_file(f, filevc.compute_file_hash) for f in pending)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(min(num_workers, len(pending)))
+        tasks = [(f, hash_func) for f in pending]
+        results = pool.imap_unordered(_hash_file_task, tasks, chunksize=4)
+    try:
+        for filepath, read_ns, doc_hash, error in results:
+            if doc_hash is not None:
+                file_index.record(filepath, stat_results[filepath], doc_hash, read_ns)
+            yield classify(filepath, doc_hash, error)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
@@ -1,6 +1,15 @@
+import random
+import threading
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import orjson
 from . import storage_utils as jsu
+from .compression import check_codec_available, train_dictionary
+from .bloom_filter import BloomFilter, locked_bloom_filter, locked_bloom_filter_writers
 from pathlib import Path
+from typing import Callable, List, Optional
 
 
 class JsonStorageProvider(ABC):
@@ -25,6 +34,30 @@ class JsonStorageProvider(ABC):
         """Compute the hash of a JSON object"""
         pass
 
+    # Batch operations; providers override them if they can
+    # save round trips compared to handling the objects one by one.
+
+    def load_many(self, json_hashes: List[str]) -> List[dict]:
+        """Retrieve JSON objects in the order of `json_hashes`"""
+        return [self.load(h) for h in json_hashes]
+
+    def exists_many(self, json_hashes: List[str]) -> List[bool]:
+        """Check for each JSON hash if the associated JSON object exists"""
+        return [self.exists(h) for h in json_hashes]
+
+    def store_many(self, json_dicts: List[dict]) -> List[str]:
+        """Store JSON objects in one transaction and return their hashes"""
+        with self.transaction():
+            return [self.store(d) for d in json_dicts]
+
+    def transaction(self):
+        """Context manager grouping the objects stored within it
+
+        Providers supporting it store the objects of a transaction
+        atomically. By default, objects are stored one by one.
+        """
+        return nullcontext()
+
 
 class JsonObjectIndex(ABC):
 
@@ -38,23 +71,203 @@ class JsonObjectIndex(ABC):
         """Return size of JSON object associated with JSON hash"""
         pass
 
+    @abstractmethod
+    def mtime(self, json_hash: str) -> float:
+        """Return time of storage of JSON object as seconds since epoch"""
+        pass
+
+    @abstractmethod
+    def remove(self, json_hash: str) -> None:
+        """Delete JSON object associated with JSON hash"""
+        pass
+
 
 class LocalJsonStorageProvider(JsonStorageProvider, JsonObjectIndex):
+    """Store JSON objects as files named by their hashes in a directory
+
+    If `bloom_filter_fpr` is given, a Bloom filter over the stored
+    hashes with this false positive rate answers most `exists` queries
+    for absent objects without touching the file system. The filter is
+    created on first use and doubled in size whenever it is full. Once
+    created, the filter in the storage directory is also used and kept
+    up to date by providers without `bloom_filter_fpr`.
 
-    def __init__(self, storage_dir: Path):
+    Batch operations access the files in a pool of `BATCH_THREADS`
+    threads, which overlaps the latencies of network file systems.
+
+    New objects are hashed with `hash_algorithm` (see
+    `checksum.HASH_ALGORITHMS`). Since hashes identify their algorithm,
+    objects stored with other algorithms remain readable.
+    """
+
+    BATCH_THREADS = 8
+
+    def __init__(self, storage_dir: Path, compression: Optional[str]=None,
+                 compression_level: Optional[int]=None,
+                 bloom_filter_fpr: Optional[float]=None,
+                 hash_algorithm: str=jsu.DEFAULT_HASH_ALGORITHM):
+        jsu.check_hash_algorithm(hash_algorithm)
         self._storage_dir = Path(storage_dir)
+        self._hash_algorithm = hash_algorithm
+        self._compression = compression
+        self._compression_level = compression_level
+        self._dictionary = None
+        if compression is not None:
+            check_codec_available(compression)
+            self._dictionary = jsu.load_current_dictionary(self._storage_dir)
+        self._bloom_filter = None
+        if bloom_filter_fpr is not None:
+            self._bloom_filter = self._open_bloom_filter(bloom_filter_fpr)
+        else:
+            # otherwise, objects stored here would be missing in the filter
+            try:
+                self._bloom_filter = BloomFilter(self._get_bloom_filter_filepath())
+            except FileNotFoundError:
+                pass
+        self._executor = None
+
+    def _map(self, func: Callable, items: list) -> list:
+        if len(items) < 2:
+            return [func(item) for item in items]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.BATCH_THREADS)
+        return list(self._executor.map(func, items))
+
+    def _get_bloom_filter_filepath(self) -> Path:
+        return self._storage_dir / jsu.BLOOM_FILTER_FILENAME
+
+    def _open_bloom_filter(self, false_positive_rate: float) -> BloomFilter:
+        filepath = self._get_bloom_filter_filepath()
+        try:
+            bloom_filter = BloomFilter(filepath)
+        except FileNotFoundError:
+            return self.rebuild_bloom_filter(false_positive_rate)
+        if bloom_filter.get_false_positive_rate() != false_positive_rate:
+            bloom_filter.close()
+            return self.rebuild_bloom_filter(false_positive_rate)
+        return bloom_filter
+
+    def rebuild_bloom_filter(self, false_positive_rate: Optional[float]=None,
+                             capacity: Optional[int]=None) -> BloomFilter:
+        """Create the Bloom filter anew from the stored objects
+
+        This drops removed objects from the filter. By default, the false
+        positive rate of the current filter is kept and the capacity is
+        twice the number of stored objects.
+        """
+        if false_positive_rate is None:
+            if self._bloom_filter is None:
+                raise ValueError('No false positive rate for the Bloom filter given')
+            false_positive_rate = self._bloom_filter.get_false_positive_rate()
+        filepath = self._get_bloom_filter_filepath()
+        # waits for objects added to the current filter to be written
+        with locked_bloom_filter_writers(filepath, shared=False), locked_bloom_filter(filepath):
+            json_hashes = self.index()
+            if capacity is None:
+                capacity = max(2 * len(json_hashes), 1024)
+            bloom_filter = BloomFilter.create(
+                filepath, json_hashes, capacity, false_positive_rate
+            )
+        if self._bloom_filter is not None:
+            self._bloom_filter.close()
+        self._bloom_filter = bloom_filter
+        return bloom_filter
 
     def load(self, json_hash: str) -> dict:
         return jsu.load_json_object(json_hash, self._storage_dir)
 
+    def load_many(self, json_hashes: List[str]) -> List[dict]:
+        return self._map(self.load, list(json_hashes))
+
+    def _store_file(self, json_dict: dict, json_hash: str, absent_hashes: set) -> str:
+        # objects unknown to the filter need not be looked up
+        exists_func = (lambda h: False) if json_hash in absent_hashes else self.exists
+        return jsu.store_json_object(
+            json_dict, self._storage_dir, self._compression,
+            self._compression_level, self._dictionary, exists_func,
+            self._hash_algorithm, json_hash
+        )
+
+    def _writing_objects(self):
+        """Context manager held from adding hashes to the filter
+        until their objects are written"""
+        if self._bloom_filter is None:
+            return nullcontext()
+        return locked_bloom_filter_writers(self._get_bloom_filter_filepath())
+
+    def _add_to_bloom_filter(self, json_hashes: List[str]) -> set:
+        """Add hashes to the filter and return those it did not contain"""
+        absent_hashes = set()
+        if self._bloom_filter is None:
+            return absent_hashes
+        for json_hash in json_hashes:
+            if not self._bloom_filter.might_contain(json_hash):
+                absent_hashes.add(json_hash)
+            self._bloom_filter.add(json_hash)
+        return absent_hashes
+
+    def _grow_full_bloom_filter(self) -> None:
+        # only once the objects are written, which the rebuild waits for
+        if self._bloom_filter is not None and self._bloom_filter.is_full():
+            self.rebuild_bloom_filter()
+
     def store(self, json_dict: dict) -> str:
-        return jsu.store_json_object(json_dict, self._storage_dir)
+        json_hash = self.compute_hash(json_dict)
+        # added before the file is written, so that the filter never
+        # misses a stored object, whereas a false positive is harmless
+        with self._writing_objects():
+            absent_hashes = self._add_to_bloom_filter([json_hash])
+            self._store_file(json_dict, json_hash, absent_hashes)
+        self._grow_full_bloom_filter()
+        return json_hash
+
+    def store_many(self, json_dicts: List[dict]) -> List[str]:
+        json_dicts = list(json_dicts)
+        json_hashes = self._map(self.compute_hash, json_dicts)
+        with self._writing_objects():
+            # the filter is only updated by this thread
+            absent_hashes = self._add_to_bloom_filter(json_hashes)
+            json_hashes = self._map(
+                lambda item: self._store_file(*item, absent_hashes),
+                list(zip(json_dicts, json_hashes))
+            )
+        self._grow_full_bloom_filter()
+        return json_hashes
 
     def exists(self, json_hash: str) -> bool:
+        if self._bloom_filter is not None \
+                and not self._bloom_filter.might_contain(json_hash):
+            return False
         return jsu.is_json_object_stored(json_hash, self._storage_dir)
 
+    def exists_many(self, json_hashes: List[str]) -> List[bool]:
+        return self._map(self.exists, list(json_hashes))
+
     def compute_hash(self, json_dict: dict) -> str:
-        return jsu.compute_json_hash(json_dict)
+        return jsu.compute_json_hash(json_dict, self._hash_algorithm)
+
+    def get_hash_algorithm(self) -> str:
+        return self._hash_algorithm
+
+    def train_dictionary(self, dict_size: int=64*1024, max_samples: int=2000,
+                         compression: Optional[str]=None) -> int:
+        """Train a compression dictionary from stored objects
+
+        The dictionary is used to compress objects stored from now on;
+        objects compressed with earlier dictionaries remain readable.
+        Returns the identifier of the new dictionary.
+        """
+        compression = self._compression if compression is None else compression
+        if compression is None:
+            raise ValueError('No compression codec configured for the storage')
+        json_hashes = self.index()
+        if len(json_hashes) > max_samples:
+            json_hashes = random.sample(json_hashes, max_samples)
+        samples = [jsu.read_json_object_bytes(h, self._storage_dir) for h in json_hashes]
+        dictionary = train_dictionary(samples, dict_size, compression)
+        dict_id = jsu.store_dictionary(self._storage_dir, dictionary)
+        self._dictionary = dictionary
+        return dict_id
 
     def index(self):
         itera = self._storage_dir.iterdir()
@@ -64,3 +277,138 @@ class LocalJsonStorageProvider(JsonStorageProvider, JsonObjectIndex):
     def size(self, json_hash: str) -> int:
         fp = jsu.construct_filepath(json_hash, self._storage_dir)
         return fp.stat().st_size
+
+    def mtime(self, json_hash: str) -> float:
+        fp = jsu.construct_filepath(json_hash, self._storage_dir)
+        return fp.stat().st_mtime
+
+    def remove(self, json_hash: str) -> None:
+        jsu.check_json_hash_wellformed(json_hash)
+        fp = jsu.construct_filepath(json_hash, self._storage_dir)
+        fp.unlink()
+
+
+class CachedJsonStorageProvider(JsonStorageProvider):
+    """Keep recently used JSON objects of another provider in memory
+
+    Objects are content-addressed and therefore immutable, so entries
+    never need to be invalidated. They are kept as canonical JSON bytes
+    in least-recently-used order to hand out independent copies. The
+    cache is safe to use from several threads if the backend is.
+    """
+
+    def __init__(self, backend: JsonStorageProvider, max_objects: int=10000):
+        self._backend = backend
+        self._max_objects = max_objects
+        self._objects = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_backend(self) -> JsonStorageProvider:
+        return self._backend
+
+    def _remember(self, json_hash: str, json_dict: dict) -> None:
+        json_bytes = orjson.dumps(json_dict, option=orjson.OPT_SORT_KEYS)
+        with self._lock:
+            self._objects[json_hash] = json_bytes
+            self._objects.move_to_end(json_hash)
+            while len(self._objects) > self._max_objects:
+                self._objects.popitem(last=False)
+
+    def _recall(self, json_hash: str) -> Optional[bytes]:
+        with self._lock:
+            json_bytes = self._objects.get(json_hash, None)
+            if json_bytes is not None:
+                self._objects.move_to_end(json_hash)
+            return json_bytes
+
+    def load(self, json_hash: str) -> dict:
+        json_bytes = self._recall(json_hash)
+        if json_bytes is not None:
+            return orjson.loads(json_bytes)
+        json_dict = self._backend.load(json_hash)
+        self._remember(json_hash, json_dict)
+        return json_dict
+
+    def load_many(self, json_hashes: List[str]) -> List[dict]:
+        json_dicts = dict()
+        for json_hash in json_hashes:
+            json_bytes = self._recall(json_hash)
+            if json_bytes is not None:
+                json_dicts[json_hash] = orjson.loads(json_bytes)
+        missing = [h for h in dict.fromkeys(json_hashes) if h not in json_dicts]
+        for json_hash, json_dict in zip(missing, self._backend.load_many(missing)):
+            self._remember(json_hash, json_dict)
+            json_dicts[json_hash] = json_dict
+        # duplicate hashes must not share the same object
+        return [
+            json_dicts.pop(h) if h in json_dicts else self.load(h)
+            for h in json_hashes
+        ]
+
+    def store(self, json_dict: dict) -> str:
+        json_hash = self._backend.store(json_dict)
+        self._remember(json_hash, json_dict)
+        return json_hash
+
+    def store_many(self, json_dicts: List[dict]) -> List[str]:
+        json_hashes = self._backend.store_many(json_dicts)
+        for json_hash, json_dict in zip(json_hashes, json_dicts):
+            self._remember(json_hash, json_dict)
+        return json_hashes
+
+    def exists(self, json_hash: str) -> bool:
+        if json_hash in self._objects:
+            return True
+        return self._backend.exists(json_hash)
+
+    def exists_many(self, json_hashes: List[str]) -> List[bool]:
+        missing = [h for h in json_hashes if h not in self._objects]
+        found = dict(zip(missing, self._backend.exists_many(missing)))
+        return [found.get(h, True) for h in json_hashes]
+
+    def compute_hash(self, json_dict: dict) -> str:
+        return self._backend.compute_hash(json_dict)
+
+    def transaction(self):
+        return self._backend.transaction()
+
+
+class MemoryJsonStorageProvider(JsonStorageProvider):
+    """Keep JSON objects in memory, e.g. as the fastest tier of a storage
+
+    Objects are kept as canonical JSON bytes. If `max_objects` is given,
+    the least recently used objects are dropped beyond that number.
+    `hash_func` defaults to the SHA-256 hash of the canonical JSON.
+    """
+
+    def __init__(self, hash_func: Optional[Callable[[dict], str]]=None,
+                 max_objects: Optional[int]=None):
+        self._hash_func = jsu.compute_json_hash if hash_func is None else hash_func
+        self._max_objects = max_objects
+        self._objects = OrderedDict()
+
+    def load(self, json_hash: str) -> dict:
+        json_bytes = self._objects.get(json_hash, None)
+        if json_bytes is None:
+            raise KeyError(f'No JSON object stored under hash {json_hash}')
+        self._objects.move_to_end(json_hash)
+        return orjson.loads(json_bytes)
+
+    def store(self, json_dict: dict) -> str:
+        json_hash = self.compute_hash(json_dict)
+        self.store_under_hash(json_hash, json_dict)
+        return json_hash
+
+    def store_under_hash(self, json_hash: str, json_dict: dict) -> None:
+        """Store an object whose hash is already known"""
+        self._objects[json_hash] = orjson.dumps(json_dict, option=orjson.OPT_SORT_KEYS)
+        self._objects.move_to_end(json_hash)
+        if self._max_objects is not None:
+            while len(self._objects) > self._max_objects:
+                self._objects.popitem(last=False)
+
+    def exists(self, json_hash: str) -> bool:
+        return json_hash in self._objects
+
+    def compute_hash(self, json_dict: dict) -> str:
+        return self._hash_func(json_dict)
@@ -1,11 +1,24 @@
-from typing import Union
+import os
+from typing import Callable, Union, Optional
+from functools import lru_cache
 import orjson
 from pathlib import Path
 from .checksum import (
+    DEFAULT_HASH_ALGORITHM,
+    check_hash_algorithm,
     is_hexadecimal,
     compute_json_hash,
     is_hash_wellformed,
+    verify_json_hash,
 )
+from . import compression
+from .json_events import compute_json_file_hash
+from .file_utils import write_file_atomic, mapped_file
+
+
+DICTIONARY_DIRNAME = 'dictionaries'
+BLOOM_FILTER_FILENAME = 'objects.bloom'
+CURRENT_DICTIONARY_FILENAME = 'current'
 
 
 def check_json_hash_wellformed(json_hash: str) -> bool:
@@ -17,13 +30,7 @@ def is_filename_wellformed(filename: Path) -> bool:
     f = Path(filename)
     if not f.suffix == '.json':
         return False
-    if not len(f.stem) == 64:
-        return False
-    try:
-        int(f.stem, 16)
-    except ValueError:
-        return False
-    return True
+    return is_hash_wellformed(f.stem)
 
 
 def construct_filepath(json_hash: str, storage_dir: Path) -> str:
@@ -32,36 +39,115 @@ def construct_filepath(json_hash: str, storage_dir: Path) -> str:
 
 def load_json_file(filepath: Path) -> dict:
     try:
-        with open(Path(filepath), 'r') as f:
-            json_dict = orjson.loads(f.read())
+        with mapped_file(Path(filepath)) as data:
+            json_dict = orjson.loads(data)
     except orjson.JSONDecodeError as e:
         raise orjson.JSONDecodeError('Invalid JSON file', e.doc, e.pos)
     return json_dict
 
 
+def hash_json_file(filepath: Path, algo: str=DEFAULT_HASH_ALGORITHM,
+                   stream_min_size: Optional[int]=None) -> str:
+    """Compute the hash of the document in a JSON file
+
+    Files of at least `stream_min_size` bytes are hashed by the event
+    parser of `json_events` without loading them.
+    """
+    if stream_min_size is not None and os.path.getsize(filepath) >= stream_min_size:
+        return compute_json_file_hash(filepath, algo)
+    return compute_json_hash(load_json_file(filepath), algo)
+
+
 def is_json_object_stored(json_hash: str, storage_dir: Path):
     check_json_hash_wellformed(json_hash)
     filepath = construct_filepath(json_hash, storage_dir) 
     return filepath.is_file()
 
 
+def get_dictionary_dir(storage_dir: Path) -> Path:
+    return Path(storage_dir) / DICTIONARY_DIRNAME
+
+
+@lru_cache(maxsize=16)
+def _load_dictionary(dictionary_dir: str, dict_id: int) -> bytes:
+    filepath = Path(dictionary_dir) / f'{dict_id:08x}.dict'
+    with open(filepath, 'rb') as f:
+        return f.read()
+
+
+def load_dictionary(storage_dir: Path, dict_id: int) -> bytes:
+    """Load a compression dictionary by its identifier"""
+    return _load_dictionary(str(get_dictionary_dir(storage_dir)), dict_id)
+
+
+def store_dictionary(storage_dir: Path, dictionary: bytes, make_current: bool=True) -> int:
+    """Store a compression dictionary and return its identifier"""
+    dict_id = compression.compute_dictionary_id(dictionary)
+    dictionary_dir = get_dictionary_dir(storage_dir)
+    dictionary_dir.mkdir(exist_ok=True)
+    write_file_atomic(dictionary_dir / f'{dict_id:08x}.dict', dictionary)
+    if make_current:
+        current_filepath = dictionary_dir / CURRENT_DICTIONARY_FILENAME
+        write_file_atomic(current_filepath, f'{dict_id:08x}'.encode('utf-8'))
+    return dict_id
+
+
+def load_current_dictionary(storage_dir: Path) -> Optional[bytes]:
+    """Load the dictionary used to compress new objects if there is one"""
+    filepath = get_dictionary_dir(storage_dir) / CURRENT_DICTIONARY_FILENAME
+    if not filepath.is_file():
+        return None
+    with open(filepath, 'r') as f:
+        dict_id = int(f.read().strip(), 16)
+    return load_dictionary(storage_dir, dict_id)
+
+
+def read_json_object_bytes(json_hash: str, storage_dir: Path) -> bytes:
+    """Read the canonical JSON bytes of a stored object, decompressing if needed"""
+    filepath = construct_filepath(json_hash, storage_dir)
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    if compression.is_compressed(data):
+        load_func = lambda dict_id: load_dictionary(storage_dir, dict_id)
+        data = compression.decompress(data, load_func)
+    return data
+
+
 def load_json_object(json_hash: str, storage_dir: Path) -> dict:
     """Load JSON object from content-addressable storage."""
     check_json_hash_wellformed(json_hash)
-    filepath = construct_filepath(json_hash, storage_dir)
-    json_dict = load_json_file(filepath)
-    if json_hash != compute_json_hash(json_dict):
+    json_dict = orjson.loads(read_json_object_bytes(json_hash, storage_dir))
+    if not verify_json_hash(json_dict, json_hash):
         raise ValueError('JSON object compromised')
     return json_dict
 
 
-def store_json_object(json_dict: dict, storage_dir: Path) -> None:
-    """Store JSON object in content-addressable storage"""
-    json_hash = compute_json_hash(json_dict)
-    if is_json_object_stored(json_hash, storage_dir):
+def store_json_object(json_dict: dict, storage_dir: Path,
+                      compression_codec: Optional[str]=None,
+                      compression_level: Optional[int]=None,
+                      dictionary: Optional[bytes]=None,
+                      exists_func: Optional[Callable[[str], bool]]=None,
+                      hash_algorithm: str=DEFAULT_HASH_ALGORITHM,
+                      json_hash: Optional[str]=None) -> None:
+    """Store JSON object in content-addressable storage
+
+    The object is compressed if `compression_codec` is given. Its hash
+    is always computed from the uncompressed canonical JSON, unless
+    already passed as `json_hash`. Existing objects are looked up with
+    `exists_func` if provided.
+    """
+    if json_hash is None:
+        json_hash = compute_json_hash(json_dict, hash_algorithm)
+    if exists_func is None:
+        exists_func = lambda h: is_json_object_stored(h, storage_dir)
+    if exists_func(json_hash):
         load_json_object(json_hash, storage_dir)
         return json_hash
     filepath = construct_filepath(json_hash, storage_dir) 
-    with open(filepath, 'wb') as f:
-        f.write(orjson.dumps(json_dict, option=orjson.OPT_SORT_KEYS))
+    data = orjson.dumps(json_dict, option=orjson.OPT_SORT_KEYS)
+    if compression_codec is not None:
+        data = compression.compress(
+            data, compression_codec, compression_level, dictionary
+        )
+    write_file_atomic(filepath, data)
     return json_hash
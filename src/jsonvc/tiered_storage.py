@@ -0,0 +1,274 @@
+import os
+import time
+import warnings
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional
+import orjson
+from .storage import JsonStorageProvider, JsonObjectIndex
+from .file_utils import write_file_atomic, locked_file
+
+
+class DirectoryJsonStorageProvider(JsonStorageProvider, JsonObjectIndex):
+    """Store canonical JSON files named by hashes computed by `hash_func`
+
+    In contrast to `LocalJsonStorageProvider`, any hash scheme can be
+    used, e.g. the content identifiers of IPFS, which makes it suitable
+    as local tier of other storages. Objects are not verified on
+    loading because computing the hash may be expensive.
+    """
+
+    def __init__(self, directory: Path, hash_func: Callable[[dict], str]):
+        self._directory = Path(directory)
+        self._hash_func = hash_func
+
+    def load(self, json_hash: str) -> dict:
+        with open(self._directory / json_hash, 'rb') as f:
+            return orjson.loads(f.read())
+
+    def store(self, json_dict: dict) -> str:
+        json_hash = self.compute_hash(json_dict)
+        self.store_under_hash(json_hash, json_dict)
+        return json_hash
+
+    def store_under_hash(self, json_hash: str, json_dict: dict) -> None:
+        """Store an object whose hash is already known"""
+        data = orjson.dumps(json_dict, option=orjson.OPT_SORT_KEYS)
+        write_file_atomic(self._directory / json_hash, data)
+
+    def exists(self, json_hash: str) -> bool:
+        return (self._directory / json_hash).is_file()
+
+    def compute_hash(self, json_dict: dict) -> str:
+        return self._hash_func(json_dict)
+
+    def index(self):
+        # hidden files include temporary files
+        return [
+            e.name for e in os.scandir(self._directory)
+            if e.is_file() and not e.name.startswith('.')
+        ]
+
+    def size(self, json_hash: str) -> int:
+        return (self._directory / json_hash).stat().st_size
+
+    def mtime(self, json_hash: str) -> float:
+        return (self._directory / json_hash).stat().st_mtime
+
+    def remove(self, json_hash: str) -> None:
+        (self._directory / json_hash).unlink()
+
+
+def _store_in_tier(tier: JsonStorageProvider, json_hash: str, json_dict: dict) -> None:
+    if hasattr(tier, 'store_under_hash'):
+        tier.store_under_hash(json_hash, json_dict)
+        return
+    tier_hash = tier.store(json_dict)
+    if tier_hash != json_hash:
+        raise ValueError(
+            f'Storage tier {type(tier).__name__} uses another hash scheme '
+            f'({tier_hash} instead of {json_hash})'
+        )
+
+
+class WriteBackQueue:
+    """Durable queue of objects waiting to be stored in a slow storage
+
+    Every pending object is a file in `queue_dir`, whose name starts
+    with the time it was queued. Objects are stored in that order,
+    so sources are always stored before the nodes referencing them.
+    Objects that cannot be stored remain in the queue and are retried,
+    also by later processes using the same directory. Up to `batch_size`
+    objects are passed to `store_many` of the target at once.
+    """
+
+    FAILED_DIRNAME = 'failed'
+    LOCK_FILENAME = '.lock'
+
+    def __init__(self, queue_dir: Path, target: JsonStorageProvider,
+                 retry_delay: float=1.0, max_retry_delay: float=300.0,
+                 batch_size: int=64):
+        self._queue_dir = Path(queue_dir)
+        self._queue_dir.mkdir(parents=True, exist_ok=True)
+        self._target = target
+        self._batch_size = batch_size
+        self._retry_delay = retry_delay
+        self._max_retry_delay = max_retry_delay
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def enqueue(self, json_hash: str, json_dict: dict) -> None:
+        filename = f'{time.time_ns():020d}-{json_hash}'
+        data = orjson.dumps(json_dict, option=orjson.OPT_SORT_KEYS)
+        write_file_atomic(self._queue_dir / filename, data, fsync=True)
+        self._wakeup.set()
+
+    def get_pending(self) -> List[str]:
+        """Return the file names of the pending objects in queue order"""
+        return sorted(
+            e.name for e in os.scandir(self._queue_dir)
+            if e.is_file() and not e.name.startswith('.')
+        )
+
+    def load(self, json_hash: str) -> Optional[dict]:
+        """Return a pending object or None"""
+        for filename in self.get_pending():
+            if filename.split('-', 1)[1] == json_hash:
+                try:
+                    with open(self._queue_dir / filename, 'rb') as f:
+                        return orjson.loads(f.read())
+                except FileNotFoundError:
+                    # stored in the meantime
+                    return None
+        return None
+
+    def process(self) -> int:
+        """Store the pending objects in order and return how many are left
+
+        Stops at the first failed batch to preserve the order. Processes
+        sharing the queue directory take turns.
+        """
+        with self._lock, locked_file(self._queue_dir / self.LOCK_FILENAME):
+            pending = self.get_pending()
+            while len(pending) > 0:
+                filenames = []
+                json_dicts = []
+                for filename in pending[:self._batch_size]:
+                    try:
+                        with open(self._queue_dir / filename, 'rb') as f:
+                            json_dicts.append(orjson.loads(f.read()))
+                    except FileNotFoundError:
+                        # processed concurrently by another process
+                        continue
+                    filenames.append(filename)
+                try:
+                    stored_hashes = self._target.store_many(json_dicts)
+                except Exception:
+                    return len(pending)
+                for filename, stored_hash in zip(filenames, stored_hashes):
+                    self._finish(filename, stored_hash)
+                del pending[:self._batch_size]
+            return 0
+
+    def _finish(self, filename: str, stored_hash: str) -> None:
+        filepath = self._queue_dir / filename
+        json_hash = filename.split('-', 1)[1]
+        if stored_hash != json_hash:
+            failed_dir = self._queue_dir / self.FAILED_DIRNAME
+            failed_dir.mkdir(exist_ok=True)
+            os.replace(filepath, failed_dir / filename)
+            warnings.warn(
+                f'Object {json_hash} was stored as {stored_hash}, '
+                f'moved it to {failed_dir}'
+            )
+        else:
+            try:
+                filepath.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _run(self) -> None:
+        delay = self._retry_delay
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            if self.process() == 0:
+                delay = self._retry_delay
+                self._wakeup.wait()
+            else:
+                self._wakeup.wait(delay)
+                delay = min(2 * delay, self._max_retry_delay)
+
+    def start(self) -> None:
+        """Process the queue in a background thread"""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        # a daemon thread does not delay the exit of the process;
+        # objects not stored until then stay in the queue
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+
+
+class TieredJsonStorageProvider(JsonStorageProvider):
+    """Compose storages into tiers from fastest to slowest
+
+    Objects are looked up tier by tier and copied into all faster tiers
+    once found (promotion). New objects are stored in all tiers, the
+    slowest one via `write_back_queue` if given, so that `store`
+    returns after the faster tiers have been written. All tiers must
+    use the hash scheme of the slowest tier, which also computes
+    the hashes.
+    """
+
+    def __init__(self, tiers: List[JsonStorageProvider],
+                 write_back_queue: Optional[WriteBackQueue]=None):
+        if len(tiers) == 0:
+            raise ValueError('At least one storage tier is required')
+        self._tiers = list(tiers)
+        self._write_back_queue = write_back_queue
+
+    def get_tiers(self) -> List[JsonStorageProvider]:
+        return list(self._tiers)
+
+    def get_write_back_queue(self) -> Optional[WriteBackQueue]:
+        return self._write_back_queue
+
+    def load(self, json_hash: str) -> dict:
+        for i, tier in enumerate(self._tiers[:-1]):
+            if tier.exists(json_hash):
+                try:
+                    json_dict = tier.load(json_hash)
+                except (KeyError, FileNotFoundError):
+                    # evicted in the meantime
+                    continue
+                break
+        else:
+            json_dict = None
+            if self._write_back_queue is not None:
+                json_dict = self._write_back_queue.load(json_hash)
+            if json_dict is None:
+                json_dict = self._tiers[-1].load(json_hash)
+            i = len(self._tiers) - 1
+        for tier in self._tiers[:i]:
+            _store_in_tier(tier, json_hash, json_dict)
+        return json_dict
+
+    def store(self, json_dict: dict) -> str:
+        json_hash = self.compute_hash(json_dict)
+        for tier in self._tiers[:-1]:
+            _store_in_tier(tier, json_hash, json_dict)
+        if self._write_back_queue is not None:
+            self._write_back_queue.enqueue(json_hash, json_dict)
+        else:
+            _store_in_tier(self._tiers[-1], json_hash, json_dict)
+        return json_hash
+
+    def exists(self, json_hash: str) -> bool:
+        for tier in self._tiers:
+            if tier.exists(json_hash):
+                return True
+        if self._write_back_queue is not None:
+            return self._write_back_queue.load(json_hash) is not None
+        return False
+
+    def compute_hash(self, json_dict: dict) -> str:
+        return self._tiers[-1].compute_hash(json_dict)
+
+    def flush(self) -> int:
+        """Store all pending objects in the slowest tier now
+
+        Returns the number of objects still pending after a failure.
+        """
+        if self._write_back_queue is None:
+            return 0
+        return self._write_back_queue.process()
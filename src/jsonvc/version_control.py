@@ -1,20 +1,40 @@
+import os
+import time
+import asyncio
 from typing import Callable, List, Dict, Optional
 import orjson
+import jsonpointer
 from .jsonpatch_ext import (
     create_patch,
     apply_patch,
     create_ext_patch,
 )
+from .patch_composition import (
+    PatchCompositionError,
+    make_base_resolver,
+    squash_ext_patches,
+)
 from .checksum import (
+    compute_json_hash,
+    get_hash_algorithm,
     is_hash_prefix_wellformed,
+    pack_hash,
+    unpack_hash,
 )
 from pathlib import Path
 from .json.models import JsonGraphNode, ExtJsonPatch
-from .storage_utils import load_json_file
+from .storage_utils import load_json_file, hash_json_file
+from .path_index import JsonPathIndex, iter_leaf_pointers
+from .file_index import JsonFileIndex
+from .commit_graph import CommitGraph, write_commit_graph
 from .storage import (
     JsonStorageProvider,
     JsonObjectIndex,
+    LocalJsonStorageProvider,
+    CachedJsonStorageProvider,
 )
+from .sqlite_storage import SqliteJsonStorageProvider
+from .async_storage import AsyncJsonStorageProvider, AsyncJsonStorageAdapter
 from .custom_exceptions import (
     HashPrefixAmbiguousError,
     HashNotFoundError,
@@ -25,6 +45,10 @@ from .custom_exceptions import (
 )
 
 
+# longest chain of stored patches composed instead of diffing documents
+MAX_COMPOSED_PATCHES = 100
+
+
 class JsonTrackGraph:
 
     def __init__(self, storage_provider: JsonStorageProvider):
@@ -34,16 +58,17 @@ class JsonTrackGraph:
         return self._storage
 
     def create_genesis_node(self, json_dict: dict, meta: Optional[dict]=None) -> str:
-        doc_hash = self._storage.store(json_dict)
-        genesis_node = JsonGraphNode(
-            extJsonPatchHash = None,
-            documentHash = doc_hash,
-            sourceHashes = None,
-            meta = meta,
-            hash_func = self._storage.compute_hash,
-        )
-        # update cache
-        node_hash = self._storage.store(genesis_node.model_dump())
+        with self._storage.transaction():
+            doc_hash = self._storage.store(json_dict)
+            genesis_node = JsonGraphNode(
+                extJsonPatchHash = None,
+                documentHash = doc_hash,
+                sourceHashes = None,
+                meta = meta,
+                hash_func = self._storage.compute_hash,
+            )
+            # update cache
+            node_hash = self._storage.store(genesis_node.model_dump())
         return node_hash
 
     def create_node(
@@ -54,10 +79,10 @@ class JsonTrackGraph:
         patch = ExtJsonPatch(**ext_json_patch)
         patch_source_hashes = patch.get_source_hashes()
         doc_map = {}
-        for snh in source_hashes:
+        for snh, source_node_dict in zip(source_hashes, self._storage.load_many(source_hashes)):
             source_node = JsonGraphNode(
                 hash_func = self._storage.compute_hash,
-                **self._storage.load(snh)
+                **source_node_dict
             )
             doc_hash = source_node.get_document_hash()
             doc_map[doc_hash] = snh
@@ -67,9 +92,9 @@ class JsonTrackGraph:
                 'inconsistent with document hashes of source nodes'
             )
         # apply the patch and store new JSON doc, ext JSON patch and graph node
-        new_doc = patch.apply(self._storage.load)
-        patch_hash = self._storage.store(patch.model_dump())
-        new_doc_hash = self._storage.store(new_doc)
+        new_doc = patch.apply(self._storage.load, self._storage.load_many)
+        # check before storing anything to not leave orphaned objects behind
+        new_doc_hash = self._storage.compute_hash(new_doc)
         if new_doc_hash != expected_doc_hash:
             raise ValueError(
                 'The hash of the new document is not equal to the '
@@ -77,63 +102,221 @@ class JsonTrackGraph:
                 'package has created an inapropriate patch to transform a '
                 'given source document into a given destination document.'
             )
-        new_node = JsonGraphNode(
-            hash_func = self._storage.compute_hash,
-            extJsonPatchHash = patch_hash,
-            documentHash = new_doc_hash,
-            sourceHashes = source_hashes,
-            meta = meta,
-        )
-        new_node_hash = self._storage.store(new_node.model_dump())
+        # store everything in one transaction if the storage supports it
+        with self._storage.transaction():
+            patch_hash, new_doc_hash = self._storage.store_many([patch.model_dump(), new_doc])
+            new_node = JsonGraphNode(
+                hash_func = self._storage.compute_hash,
+                extJsonPatchHash = patch_hash,
+                documentHash = new_doc_hash,
+                sourceHashes = source_hashes,
+                meta = meta,
+            )
+            new_node_hash = self._storage.store(new_node.model_dump())
         return new_node_hash
 
 
+def _merge_hashes(cached_hashes: Optional[tuple], new_hashes) -> tuple:
+    if cached_hashes is None:
+        return tuple(dict.fromkeys(new_hashes))
+    added = tuple(h for h in dict.fromkeys(new_hashes) if h not in cached_hashes)
+    if len(added) == 0:
+        # mostly already registered, e.g. when nodes are discovered again
+        return cached_hashes
+    return cached_hashes + added
+
+
 class JsonNodeCache:
+    """Cache of the node graph and the documents associated with nodes
 
-    def __init__(self, storage_provider: JsonStorageProvider) -> None:
+    Internally, hexadecimal hashes are kept in binary form (see
+    `pack_hash`) and the sources of a node as well as the nodes of a
+    document as tuples, which take a fraction of the memory of hex
+    strings in sets. All occurrences of a hash share one object, which
+    is looked up in a table of interned hashes when it is registered.
+    Hashes are converted back to hex strings by all public methods.
+
+    The `*_async` methods use `async_storage_provider`, which defaults
+    to running the calls of `storage_provider` in a thread pool.
+    """
+
+    def __init__(self, storage_provider: JsonStorageProvider,
+                 async_storage_provider: Optional[AsyncJsonStorageProvider]=None) -> None:
         self._storage = storage_provider
+        self._async_storage = async_storage_provider
         self._known_nodes = dict()
         self._known_docs = dict()
         self._unavail_nodes = set()
         self._should_skip = lambda h: False
+        self._dirty_nodes = set()
+        self._dirty_docs = set()
+        self._interned = dict()
+        self._commit_graph = None
+        # algorithms of the document hashes, which differ after
+        # the hash algorithm of the storage has been changed
+        self._doc_hash_algorithms = set()
+
+    @staticmethod
+    def _unpack_entries(entries: dict, packed_hashes) -> dict:
+        return {
+            unpack_hash(h): sorted(unpack_hash(v) for v in entries[h])
+            for h in packed_hashes
+        }
 
     def to_dict(self):
-        known_nodes = {h: sorted(v) for h, v in self._known_nodes.items()}
-        known_docs = {h: sorted(v) for h, v in self._known_docs.items()}
+        return {
+            'known_nodes': self._unpack_entries(self._known_nodes, self._known_nodes),
+            'known_docs': self._unpack_entries(self._known_docs, self._known_docs),
+        }
+
+    def from_dict(self, cache_dict, update=True):
+        if not update:
+            self._known_nodes = dict()
+            self._known_docs = dict()
+            self._doc_hash_algorithms = set()
+            self._interned = dict()
+        intern = self._intern
+        known_nodes = cache_dict['known_nodes']
+        for h in known_nodes:
+            intern(h)
+        # merge instead of replace, so that entries persisted
+        # by concurrent processes can be combined
+        for h, v in known_nodes.items():
+            h = intern(h)
+            self._known_nodes[h] = _merge_hashes(
+                self._known_nodes.get(h), (intern(x) for x in v)
+            )
+        for h, v in cache_dict['known_docs'].items():
+            h = intern(h)
+            if h not in self._known_docs:
+                self._add_doc_hash_algorithm(h)
+            self._known_docs[h] = _merge_hashes(
+                self._known_docs.get(h), (intern(x) for x in v)
+            )
+
+    def pop_delta(self) -> Optional[dict]:
+        """Return entries registered since the last call in `to_dict` format"""
+        if len(self._dirty_nodes) == 0 and len(self._dirty_docs) == 0:
+            return None
+        known_nodes = self._unpack_entries(self._known_nodes, self._dirty_nodes)
+        known_docs = self._unpack_entries(self._known_docs, self._dirty_docs)
+        self._dirty_nodes = set()
+        self._dirty_docs = set()
         return {
             'known_nodes': known_nodes,
             'known_docs': known_docs,
         }
 
-    def from_dict(self, cache_dict, update=True):
-        known_nodes = {h: set(v) for h, v in cache_dict['known_nodes'].items()}
-        known_docs = {h: set(v) for h, v in cache_dict['known_docs'].items()}
-        if update:
-            self._known_nodes.update(known_nodes)
-            self._known_docs.update(known_docs)
-        else:
-            self._known_nodes = known_nodes
-            self._known_docs = known_docs
+    def _intern(self, json_hash: str):
+        packed = pack_hash(json_hash)
+        return self._interned.setdefault(packed, packed)
 
     def get_storage_provider(self) -> JsonStorageProvider:
         return self._storage
 
+    def get_async_storage_provider(self) -> AsyncJsonStorageProvider:
+        if self._async_storage is None:
+            self._async_storage = AsyncJsonStorageAdapter(self._storage)
+        return self._async_storage
+
+    def attach_commit_graph(self, commit_graph: Optional[CommitGraph]) -> None:
+        """Look up nodes missing in the cache entries in a binary snapshot"""
+        if self._commit_graph is not None:
+            self._commit_graph.close()
+        self._commit_graph = commit_graph
+
+    def get_commit_graph(self) -> Optional[CommitGraph]:
+        return self._commit_graph
+
+    def write_commit_graph(self, filepath: Path) -> None:
+        """Move the cache entries into a binary snapshot and attach it
+
+        Nodes whose hashes cannot be represented in the snapshot,
+        e.g. IPFS CIDs, remain in the cache entries.
+        """
+        known_nodes = dict()
+        node_docs = dict()
+        graph = self._commit_graph
+        if graph is not None:
+            for node_id in range(len(graph)):
+                node_hash = graph.get_node_hash(node_id)
+                known_nodes[node_hash] = {
+                    graph.get_node_hash(i) for i in graph.get_parent_ids(node_id)
+                }
+                node_docs[node_hash] = graph.get_doc_hash(node_id)
+        cache_dict = self.to_dict()
+        for node_hash, source_node_hashes in cache_dict['known_nodes'].items():
+            known_nodes.setdefault(node_hash, set()).update(source_node_hashes)
+        for doc_hash, doc_node_hashes in cache_dict['known_docs'].items():
+            for node_hash in doc_node_hashes:
+                node_docs[node_hash] = doc_hash
+        included = write_commit_graph(filepath, known_nodes, node_docs)
+        self.attach_commit_graph(CommitGraph(filepath))
+        self._forget_nodes({pack_hash(h) for h in included})
+
+    def detach_commit_graph(self) -> None:
+        """Move the entries of the attached snapshot back into the cache entries"""
+        graph = self._commit_graph
+        if graph is None:
+            return
+        for node_id in range(len(graph)):
+            node_hash = graph.get_node_hash(node_id)
+            source_node_hashes = [graph.get_node_hash(i) for i in graph.get_parent_ids(node_id)]
+            self.update_node_cache(node_hash, source_node_hashes)
+            self.update_doc_cache(graph.get_doc_hash(node_id), node_hash)
+        self.attach_commit_graph(None)
+
+    def _find_graph_node_id(self, node_hash: str) -> Optional[int]:
+        if self._commit_graph is None:
+            return None
+        return self._commit_graph.find_node_id(node_hash)
+
+    def has_node(self, node_hash: str) -> bool:
+        return pack_hash(node_hash) in self._known_nodes \
+            or self._find_graph_node_id(node_hash) is not None
+
     def update_doc_cache(self, doc_hash: str, node_hash: str) -> None:
         """Register node hash under its associated JSON doc hash."""
         # NOTE: Several distinct nodes may be associated with the
         #       same JSON document.
-        blocks_linked_to_doc = (
-            self._known_docs.setdefault(doc_hash, set())
-            )
-        blocks_linked_to_doc.add(node_hash)
+        doc_hash = self._intern(doc_hash)
+        cached_hashes = self._known_docs.get(doc_hash)
+        if cached_hashes is None:
+            self._add_doc_hash_algorithm(doc_hash)
+        merged_hashes = _merge_hashes(cached_hashes, [self._intern(node_hash)])
+        if merged_hashes is not cached_hashes:
+            self._known_docs[doc_hash] = merged_hashes
+            self._dirty_docs.add(doc_hash)
+
+    def _add_doc_hash_algorithm(self, packed_doc_hash) -> None:
+        if isinstance(packed_doc_hash, bytes) and len(packed_doc_hash) == 32:
+            self._doc_hash_algorithms.add('sha256')
+            return
+        try:
+            self._doc_hash_algorithms.add(get_hash_algorithm(unpack_hash(packed_doc_hash)))
+        except ValueError:
+            # e.g. IPFS CIDs
+            pass
+
+    def get_doc_hash_algorithms(self) -> set[str]:
+        """Return the hash algorithms of the registered document hashes"""
+        algos = set(self._doc_hash_algorithms)
+        if self._commit_graph is not None and len(self._commit_graph) > 0:
+            # the snapshot only holds SHA-256 hashes
+            algos.add('sha256')
+        return algos
 
     def update_node_cache(self, node_hash: str, child_hashes: List[str]) -> None:
         """Register node hash and associated ancestor hashes"""
-        cached_child_hashes = self._known_nodes.setdefault(node_hash, set())
-        cached_child_hashes.update(child_hashes)
+        node_hash = self._intern(node_hash)
+        cached_hashes = self._known_nodes.get(node_hash)
+        merged_hashes = _merge_hashes(cached_hashes, [self._intern(h) for h in child_hashes])
+        if merged_hashes is not cached_hashes:
+            self._known_nodes[node_hash] = merged_hashes
+            self._dirty_nodes.add(node_hash)
 
     def update(self, node_hash: str) -> JsonGraphNode:
-        if node_hash in self._known_nodes:
+        if self.has_node(node_hash):
             return
         if not self._storage.exists(node_hash):
             self._unavail_nodes.add(node_hash)
@@ -146,62 +329,263 @@ class JsonNodeCache:
             hash_func=self._storage.compute_hash,
             **self._storage.load(node_hash)
         )
+        self._register_node(node_hash, cur_node)
+
+    def _register_node(self, node_hash: str, node: JsonGraphNode) -> None:
         # Here the function will fail if the node is not a valid JsonGraphNode
-        source_node_hashes = cur_node.get_source_hashes()
-        self._known_nodes[node_hash] = source_node_hashes
-        cur_doc_hash = cur_node.get_document_hash()
+        source_node_hashes = node.get_source_hashes()
+        cur_doc_hash = node.get_document_hash()
         self.update_doc_cache(cur_doc_hash, node_hash)
         self.update_node_cache(node_hash, source_node_hashes)
 
+    def update_many(self, node_hashes: List[str]) -> None:
+        """Like `update` for several nodes, using batch operations of the storage"""
+        new_node_hashes = [h for h in dict.fromkeys(node_hashes) if not self.has_node(h)]
+        exist_flags = self._storage.exists_many(new_node_hashes)
+        avail_node_hashes = []
+        for node_hash, exists in zip(new_node_hashes, exist_flags):
+            if exists:
+                self._unavail_nodes.discard(node_hash)
+                avail_node_hashes.append(node_hash)
+            else:
+                self._unavail_nodes.add(node_hash)
+        for node_hash, node_dict in zip(avail_node_hashes, self._storage.load_many(avail_node_hashes)):
+            node = JsonGraphNode(hash_func=self._storage.compute_hash, **node_dict)
+            self._register_node(node_hash, node)
+
+    async def update_async(self, node_hash: str) -> None:
+        if self.has_node(node_hash):
+            return
+        storage = self.get_async_storage_provider()
+        if not await storage.exists(node_hash):
+            self._unavail_nodes.add(node_hash)
+            return
+        self._unavail_nodes.discard(node_hash)
+        cur_node = JsonGraphNode(
+            hash_func=self._storage.compute_hash,
+            **(await storage.load(node_hash))
+        )
+        if not self.has_node(node_hash):
+            self._register_node(node_hash, cur_node)
+
     def discover_nodes(self, seed_node_hashes: List[str]):
+        # the nodes are loaded one generation at a time
         visited_nodes = set()
-        for node_hash in seed_node_hashes:
-            already_visited = node_hash in self._known_nodes
-            self.update(node_hash)
-            if node_hash not in self._known_nodes:
-                # some problem retrieving the node
-                continue
-            if not already_visited:
-                visited_nodes.add(node_hash)
-            source_node_hashes = self._known_nodes[node_hash]
-            nodes_to_visit = source_node_hashes.difference(self._known_nodes)
-            visited_nodes.update(self.discover_nodes(nodes_to_visit))
+        seen_nodes = set()
+        pending = list(dict.fromkeys(seed_node_hashes))
+        while len(pending) > 0:
+            seen_nodes.update(pending)
+            new_node_hashes = [h for h in pending if not self.has_node(h)]
+            self.update_many(new_node_hashes)
+            visited_nodes.update(h for h in new_node_hashes if self.has_node(h))
+            next_pending = dict()
+            for node_hash in pending:
+                if not self.has_node(node_hash):
+                    # some problem retrieving the node
+                    continue
+                for h in self.get_node_ancestor_hashes(node_hash):
+                    if not self.has_node(h) and h not in seen_nodes:
+                        next_pending[h] = None
+            pending = list(next_pending)
+        return visited_nodes
+
+    async def discover_nodes_async(self, seed_node_hashes: List[str]):
+        """Like `discover_nodes`, loading each generation of sources concurrently"""
+        visited_nodes = set()
+        seen_nodes = set()
+        pending = set(seed_node_hashes)
+        while len(pending) > 0:
+            seen_nodes.update(pending)
+            new_node_hashes = [h for h in pending if not self.has_node(h)]
+            await asyncio.gather(*(self.update_async(h) for h in new_node_hashes))
+            visited_nodes.update(h for h in new_node_hashes if self.has_node(h))
+            next_pending = set()
+            for node_hash in pending:
+                if not self.has_node(node_hash):
+                    # some problem retrieving the node
+                    continue
+                next_pending.update(
+                    h for h in self.get_node_ancestor_hashes(node_hash)
+                    if not self.has_node(h)
+                )
+            pending = next_pending - seen_nodes
         return visited_nodes
 
+    def _forget_nodes(self, packed_node_hashes: set) -> None:
+        for node_hash in packed_node_hashes:
+            self._known_nodes.pop(node_hash, None)
+            self._dirty_nodes.discard(node_hash)
+            self._interned.pop(node_hash, None)
+        for doc_hash in list(self._known_docs):
+            doc_node_hashes = tuple(
+                h for h in self._known_docs[doc_hash] if h not in packed_node_hashes
+            )
+            if len(doc_node_hashes) == 0:
+                del self._known_docs[doc_hash]
+                self._dirty_docs.discard(doc_hash)
+                self._interned.pop(doc_hash, None)
+            else:
+                self._known_docs[doc_hash] = doc_node_hashes
+
+    def remove_nodes(self, node_hashes: List[str]) -> None:
+        """Forget nodes, e.g. after their objects have been deleted"""
+        self._forget_nodes({pack_hash(h) for h in node_hashes})
+
     def find_associated_node_hashes(self, doc_hash: str) -> List[str]:
-        return self._known_docs.get(doc_hash, set()).copy()
+        node_hashes = {
+            unpack_hash(h) for h in self._known_docs.get(pack_hash(doc_hash), ())
+        }
+        graph = self._commit_graph
+        if graph is not None:
+            node_hashes.update(
+                graph.get_node_hash(i) for i in graph.find_doc_node_ids(doc_hash)
+            )
+        return node_hashes
 
     def get_doc_hashes(self) -> list[str]:
-        return list(self._known_docs)
+        doc_hashes = [unpack_hash(h) for h in self._known_docs]
+        if self._commit_graph is None:
+            return doc_hashes
+        return list(set(doc_hashes).union(self._commit_graph.iter_doc_hashes()))
 
     def get_node_hashes(self) -> list[str]:
-        return list(self._known_nodes)
+        node_hashes = [unpack_hash(h) for h in self._known_nodes]
+        if self._commit_graph is None:
+            return node_hashes
+        return list(set(node_hashes).union(self._commit_graph.iter_node_hashes()))
+
+    def find_node_hashes_by_prefix(self, hash_prefix: str) -> list[str]:
+        node_hashes = (unpack_hash(h) for h in self._known_nodes)
+        matches = {n for n in node_hashes if n.startswith(hash_prefix)}
+        graph = self._commit_graph
+        if graph is not None:
+            matches.update(
+                graph.get_node_hash(i) for i in graph.find_node_ids_by_prefix(hash_prefix)
+            )
+        return list(matches)
 
     def get_node_ancestor_hashes(self, node_hash) -> list[str]:
-        return self._known_nodes[node_hash]
+        source_node_hashes = self._known_nodes.get(pack_hash(node_hash))
+        if source_node_hashes is not None:
+            return {unpack_hash(h) for h in source_node_hashes}
+        node_id = self._find_graph_node_id(node_hash)
+        if node_id is None:
+            raise KeyError(node_hash)
+        graph = self._commit_graph
+        return {graph.get_node_hash(i) for i in graph.get_parent_ids(node_id)}
+
+    def get_linear_history_hashes(self, node_hash: str) -> list[str]:
+        """Return the node hashes of the history, oldest first"""
+        node_hashes = [node_hash]
+        history = []
+        while len(node_hashes) > 0:
+            if len(node_hashes) > 1:
+                raise SeveralAncestorsError('Several ancestors detected', node_hashes)
+            cur_node_hash = list(node_hashes)[0]
+            node_id = self._find_graph_node_id(cur_node_hash)
+            if node_id is not None:
+                # the sources of snapshot nodes are in the snapshot, too
+                graph = self._commit_graph
+                history_ids = graph.get_linear_history_ids(node_id)
+                history.extend(graph.get_node_hash(i) for i in history_ids)
+                parent_ids = graph.get_parent_ids(history_ids[-1])
+                if len(parent_ids) > 1:
+                    raise SeveralAncestorsError(
+                        'Several ancestors detected',
+                        {graph.get_node_hash(i) for i in parent_ids}
+                    )
+                break
+            self.update(cur_node_hash)
+            history.append(cur_node_hash)
+            node_hashes = self.get_node_ancestor_hashes(cur_node_hash)
+        return history[::-1]
+
+    async def get_linear_history_hashes_async(self, node_hash: str) -> list[str]:
+        """Like `get_linear_history_hashes` without blocking on the storage
+
+        Uncached ancestors are necessarily loaded one after the other.
+        """
+        node_hashes = [node_hash]
+        while len(node_hashes) == 1:
+            cur_node_hash = node_hashes[0]
+            if self._find_graph_node_id(cur_node_hash) is not None:
+                break
+            await self.update_async(cur_node_hash)
+            if not self.has_node(cur_node_hash):
+                break
+            node_hashes = list(self.get_node_ancestor_hashes(cur_node_hash))
+        # all nodes are cached now or the error is raised
+        return self.get_linear_history_hashes(node_hash)
+
+    def is_ancestor(self, ancestor_hash: str, node_hash: str) -> bool:
+        """Check if a node is reachable from another node via source nodes"""
+        ancestor_id = self._find_graph_node_id(ancestor_hash)
+        node_id = self._find_graph_node_id(node_hash)
+        if ancestor_id is not None and node_id is not None:
+            return self._commit_graph.is_ancestor(ancestor_id, node_id)
+        visited = set()
+        pending = [node_hash]
+        while len(pending) > 0:
+            cur_node_hash = pending.pop()
+            if cur_node_hash == ancestor_hash:
+                return True
+            if cur_node_hash in visited:
+                continue
+            visited.add(cur_node_hash)
+            self.update(cur_node_hash)
+            if self.has_node(cur_node_hash):
+                pending.extend(self.get_node_ancestor_hashes(cur_node_hash))
+        return False
+
+    @staticmethod
+    def _make_node(node_hash: str, node_dict: dict) -> JsonGraphNode:
+        # a node keeps the hash it was loaded with, which may have been
+        # computed with another algorithm than the one of the storage now
+        return JsonGraphNode(hash_func=lambda d: node_hash, **node_dict)
 
     def get_node(self, node_hash: str) -> JsonGraphNode:
         self.update(node_hash)
-        return JsonGraphNode(
-            hash_func = self._storage.compute_hash,
-            **self._storage.load(node_hash)
-        )
+        return self._make_node(node_hash, self._storage.load(node_hash))
+
+    def get_nodes(self, node_hashes: List[str]) -> List[JsonGraphNode]:
+        """Load several nodes with one batch operation of the storage"""
+        node_hashes = list(node_hashes)
+        nodes = [
+            self._make_node(node_hash, node_dict)
+            for node_hash, node_dict in zip(node_hashes, self._storage.load_many(node_hashes))
+        ]
+        for node_hash, node in zip(node_hashes, nodes):
+            if not self.has_node(node_hash):
+                self._register_node(node_hash, node)
+        return nodes
+
+    async def get_node_async(self, node_hash: str) -> JsonGraphNode:
+        storage = self.get_async_storage_provider()
+        node = self._make_node(node_hash, await storage.load(node_hash))
+        if not self.has_node(node_hash):
+            self._register_node(node_hash, node)
+        return node
 
 
 class JsonDocVersionControl:
 
-    def __init__(self, storage_provider: JsonStorageProvider) -> None:
+    def __init__(self, storage_provider: JsonStorageProvider,
+                 async_storage_provider: Optional[AsyncJsonStorageProvider]=None) -> None:
         if not isinstance(storage_provider, JsonStorageProvider):
             raise TypeError(
                 'argument `storage provider` must be instance of `JsonStorageProvider`'
             )
         self._graph = JsonTrackGraph(storage_provider)
-        self._cache = JsonNodeCache(storage_provider)
+        self._cache = JsonNodeCache(storage_provider, async_storage_provider)
+        self._path_index = JsonPathIndex()
         self._storage = storage_provider
 
     def get_cache(self):
         return self._cache
 
+    def get_path_index(self):
+        return self._path_index
+
     def get_storage_provider(self):
         return self._storage
 
@@ -209,7 +593,35 @@ class JsonDocVersionControl:
 
     def get_associated_node_hashes(self, json_dict: dict) -> list[str]:
         json_hash = self._storage.compute_hash(json_dict)
-        return self._cache.find_associated_node_hashes(json_hash)
+        node_hashes = self._cache.find_associated_node_hashes(json_hash)
+        if len(node_hashes) == 0:
+            node_hashes = self.find_nodes_by_other_hashes(json_dict, json_hash)
+        return node_hashes
+
+    def find_nodes_by_other_hashes(self, json_dict: dict, json_hash: str) -> set[str]:
+        """Return the nodes of a document tracked before the hash algorithm was changed
+
+        `json_hash` is the hash of the document computed by the storage.
+        The document is hashed with every other algorithm of the
+        document hashes in the cache.
+        """
+        node_hashes = set()
+        if self.get_hash_algorithm() is None:
+            return node_hashes
+        for algo in sorted(self._cache.get_doc_hash_algorithms()):
+            doc_hash = compute_json_hash(json_dict, algo)
+            if doc_hash != json_hash:
+                node_hashes.update(self._cache.find_associated_node_hashes(doc_hash))
+        return node_hashes
+
+    def get_hash_algorithm(self) -> Optional[str]:
+        """Return the hash algorithm if the storage hashes the canonical JSON bytes"""
+        store = self._storage
+        while isinstance(store, CachedJsonStorageProvider):
+            store = store.get_backend()
+        if isinstance(store, (LocalJsonStorageProvider, SqliteJsonStorageProvider)):
+            return store.get_hash_algorithm()
+        return None
 
     def is_tracked(self, json_dict: dict) -> bool:
         node_hashes = self.get_associated_node_hashes(json_dict)
@@ -221,12 +633,13 @@ class JsonDocVersionControl:
         meta = {'message': message}
         node_hash = self._graph.create_genesis_node(json_dict, meta)
         self._cache.update(node_hash)
+        self._path_index.add_genesis_node(node_hash)
         return node_hash
 
     # methods taking node hashes as inputs
 
     def get_messages(self, node_hashes: list[str]) -> dict[str, str]:
-        nodes = [self._cache.get_node(h) for h in node_hashes]
+        nodes = self._cache.get_nodes(node_hashes)
         messages = {h: n.get_meta()['message'] for h, n in zip(node_hashes, nodes)}
         return messages
 
@@ -234,9 +647,11 @@ class JsonDocVersionControl:
                message: str, force: bool=False) -> str:
         if self.is_tracked(new_json_dict) and not force:
             raise DocAlreadyTrackedError('The new JSON document is already in the system')
-        old_json_dict = self.get_doc(old_node_hash)
-        hash_func = self._storage.compute_hash
-        ext_patch = create_ext_patch(old_json_dict, new_json_dict, hash_func)
+        old_doc_hash = self._cache.get_node(old_node_hash).get_document_hash()
+        old_json_dict = self._storage.load(old_doc_hash)
+        # refer to the source by its stored hash, which may have been
+        # computed with another algorithm than the current one
+        ext_patch = create_ext_patch(old_json_dict, new_json_dict, lambda d: old_doc_hash)
         meta = {'message': message}
         new_doc_hash = self._storage.compute_hash(new_json_dict)
         source_node_hashes = [old_node_hash]
@@ -244,31 +659,73 @@ class JsonDocVersionControl:
             ext_patch, source_node_hashes, meta, new_doc_hash
         )
         self._cache.update(new_node)
+        self._path_index.add_node(new_node, ext_patch)
         return new_node
 
     def get_linear_history(self, node_hash: str) -> list[JsonGraphNode]:
-        node_hashes = [node_hash]
-        nodes = []
-        while len(node_hashes) > 0:
-            # TODO: extend log show capability to deal with merge commits
-            if len(node_hashes) > 1:
-                raise SeveralAncestorsError('Several ancestors detected', node_hashes)
-            cur_node_hash = list(node_hashes)[0]
-            cur_node = self._cache.get_node(cur_node_hash)
-            nodes.append(cur_node)
-            node_hashes = self._cache.get_node_ancestor_hashes(cur_node_hash)
-        return nodes[::-1]
+        # TODO: extend log show capability to deal with merge commits
+        history = self._cache.get_linear_history_hashes(node_hash)
+        return self._cache.get_nodes(history)
+
+    async def get_linear_history_async(self, node_hash: str) -> list[JsonGraphNode]:
+        """Like `get_linear_history`, loading the nodes concurrently"""
+        history = await self._cache.get_linear_history_hashes_async(node_hash)
+        return list(await asyncio.gather(*(self._cache.get_node_async(h) for h in history)))
+
+    def get_linear_history_hashes(self, node_hash: str) -> list[str]:
+        """Return the node hashes of the history using only the cache"""
+        return self._cache.get_linear_history_hashes(node_hash)
+
+    def index_paths(self, node_hashes: List[str]) -> None:
+        """Register nodes missing in the path index (backfill)"""
+        node_hashes = [h for h in node_hashes if not self._path_index.is_indexed(h)]
+        patch_map = {}
+        for node_hash, node in zip(node_hashes, self._cache.get_nodes(node_hashes)):
+            patch_hash = node.get_ext_patch_hash()
+            if patch_hash is None:
+                self._path_index.add_genesis_node(node_hash)
+            else:
+                patch_map[node_hash] = patch_hash
+        patches = self._storage.load_many(list(patch_map.values()))
+        for node_hash, ext_patch in zip(patch_map, patches):
+            self._path_index.add_node(node_hash, ext_patch)
+
+    def get_path_history(self, node_hash: str, pointer: str) -> list[str]:
+        """Return the nodes in the history that modified the value at `pointer`"""
+        history = self.get_linear_history_hashes(node_hash)
+        self.index_paths(history)
+        touched = self._path_index.find_nodes(pointer)
+        return [h for h in history if h in touched]
+
+    def blame(self, node_hash: str, pointer: str='') -> dict[str, str]:
+        """Map each leaf below `pointer` to the node that last modified it"""
+        history = self.get_linear_history_hashes(node_hash)
+        self.index_paths(history)
+        position = {h: i for i, h in enumerate(history)}
+        doc = self.get_doc(node_hash)
+        value = jsonpointer.resolve_pointer(doc, pointer)
+        blame_map = {}
+        for leaf_pointer, _ in iter_leaf_pointers(value, pointer):
+            touched = self._path_index.find_nodes(leaf_pointer)
+            blame_map[leaf_pointer] = max(
+                (h for h in touched if h in position), key=position.get
+            )
+        return blame_map
 
     def get_doc(self, node_hash: str) -> dict:
         node = self._cache.get_node(node_hash)
         doc_hash = node.get_document_hash()
         return self._storage.load(doc_hash)
 
+    async def get_doc_async(self, node_hash: str) -> dict:
+        node = await self._cache.get_node_async(node_hash)
+        doc_hash = node.get_document_hash()
+        return await self._cache.get_async_storage_provider().load(doc_hash)
+
     # auxiliary (but essential) functions for class users
 
     def expand_hash_prefix(self, hash_prefix: str) -> dict:
-        node_hashes = self._cache.get_node_hashes()
-        matches = [n for n in node_hashes if n.startswith(hash_prefix)]
+        matches = self._cache.find_node_hashes_by_prefix(hash_prefix)
         if len(matches) == 0:
             raise HashNotFoundError('No node registered under the hash provided')
         elif len(matches) > 1:
@@ -293,23 +750,139 @@ class JsonDocVersionControl:
             )
         return patch
 
+    def _find_patch_chain(self, old_node_hash: str, new_node_hash: str) -> Optional[list]:
+        """Return the nodes after the old node up to the new one, oldest first
+
+        Only the ancestors of the new node are visited, up to
+        MAX_COMPOSED_PATCHES of them. Returns None if the old node is
+        not found this way or a node with several sources is met.
+        """
+        chain = []
+        cur_node_hash = new_node_hash
+        while cur_node_hash != old_node_hash:
+            if len(chain) == MAX_COMPOSED_PATCHES:
+                return None
+            self._cache.update(cur_node_hash)
+            if not self._cache.has_node(cur_node_hash):
+                return None
+            source_node_hashes = self._cache.get_node_ancestor_hashes(cur_node_hash)
+            if len(source_node_hashes) != 1:
+                return None
+            chain.append(cur_node_hash)
+            cur_node_hash = next(iter(source_node_hashes))
+        return chain[::-1]
+
+    def squash_patches(self, old_node_hash: str, new_node_hash: str) -> Optional[dict]:
+        """Compose the stored patches leading from one node to a descendant
+
+        Returns an extended patch with the document of the old node as
+        its source, or None if the new node does not descend from the old
+        one along a linear history. The patch of a direct child is
+        returned as stored. The document of the old node is only loaded
+        if the patches cannot be composed without it.
+        """
+        chain = self._find_patch_chain(old_node_hash, new_node_hash)
+        if chain is None or len(chain) == 0:
+            return None
+        old_node, *nodes = self._cache.get_nodes([old_node_hash] + chain)
+        ext_patches = self._storage.load_many([n.get_ext_patch_hash() for n in nodes])
+        if len(ext_patches) == 1:
+            return ext_patches[0]
+        old_doc_hash = old_node.get_document_hash()
+        alias = ext_patches[0]['target']
+        resolve_base = make_base_resolver(lambda: {alias: self._storage.load(old_doc_hash)})
+        return squash_ext_patches(ext_patches, resolve_base)
+
+    def get_node_diff(self, old_node_hash: str, new_node_hash: str) -> Optional[list]:
+        """Return the diff of the documents of two nodes from their history
+
+        If the new node descends from the old one, the stored patches are
+        composed into one without loading intermediate documents; for a
+        direct child, the stored patch is used as is. These patches were
+        validated when the nodes were created. Returns None if the nodes
+        are not related this way.
+        """
+        if old_node_hash == new_node_hash:
+            return []
+        ext_patch = self.squash_patches(old_node_hash, new_node_hash)
+        if ext_patch is None or len(ext_patch['sourceHashes']) != 1:
+            return None
+        prefix = '/' + ext_patch['target']
+        patch = []
+        for operation in ext_patch['operations']:
+            operation = dict(operation)
+            for key in ('path', 'from'):
+                if key in operation:
+                    operation[key] = operation[key][len(prefix):]
+            patch.append(operation)
+        return patch
+
 
 class JsonFileVersionControl:
 
-    def __init__(self, storage_provider: JsonStorageProvider) -> None:
+    def __init__(self, storage_provider: JsonStorageProvider,
+                 stream_min_size: Optional[int]=None) -> None:
         self._docvc = JsonDocVersionControl(storage_provider)
+        self._file_index = JsonFileIndex()
+        # files this large are hashed without loading them
+        self._stream_min_size = stream_min_size
 
     def get_cache(self):
         return self._docvc.get_cache()
 
+    def get_path_index(self):
+        return self._docvc.get_path_index()
+
+    def get_file_index(self):
+        return self._file_index
+
+    def get_file_doc_hash(self, json_file: Path) -> str:
+        """Return the document hash of a file, avoiding to read unchanged files"""
+        stat_result = os.stat(json_file)
+        doc_hash = self._file_index.lookup(json_file, stat_result)
+        if doc_hash is None:
+            read_ns = time.time_ns()
+            doc_hash = self.compute_file_hash(json_file)
+            self._file_index.record(json_file, stat_result, doc_hash, read_ns)
+        return doc_hash
+
+    def compute_file_hash(self, json_file: Path) -> str:
+        """Compute the document hash of a file, streaming large files if enabled"""
+        algo = self.get_hash_algorithm()
+        if algo is None:
+            return self.get_storage_provider().compute_hash(load_json_file(json_file))
+        return hash_json_file(json_file, algo, self._stream_min_size)
+
+    def get_hash_algorithm(self) -> Optional[str]:
+        return self._docvc.get_hash_algorithm()
+
+    def find_file_node_hashes(self, json_file: Path, doc_hash: Optional[str]=None) -> set[str]:
+        """Return the nodes associated with the document of a file
+
+        Files whose document was tracked before the hash algorithm was
+        changed are loaded again to hash them with the old algorithms.
+        """
+        if doc_hash is None:
+            doc_hash = self.get_file_doc_hash(json_file)
+        cache = self.get_cache()
+        node_hashes = cache.find_associated_node_hashes(doc_hash)
+        algo = self.get_hash_algorithm()
+        if len(node_hashes) == 0 and algo is not None \
+                and len(cache.get_doc_hash_algorithms() - {algo}) > 0:
+            json_dict = load_json_file(json_file)
+            node_hashes = self._docvc.find_nodes_by_other_hashes(json_dict, doc_hash)
+        return node_hashes
+
+    def get_stream_min_size(self) -> Optional[int]:
+        return self._stream_min_size
+
     def get_storage_provider(self):
         return self._docvc.get_storage_provider()
 
     def _get_hash_from_objref(self, json_objref: str, source: str='any') -> None:
         if source in ('any', 'file'):
             try:
-                json_dict = load_json_file(json_objref)
-                node_hashes = self._docvc.get_associated_node_hashes(json_dict)
+                node_hashes = self.find_file_node_hashes(json_objref)
                 if len(node_hashes) == 0:
                     raise DocNotTrackedError('JSON document not tracked in the system')
                 if len(node_hashes) > 1:
@@ -329,6 +902,10 @@ class JsonFileVersionControl:
             return self._docvc.expand_hash_prefix(json_objref)
         raise ValueError('argument `source` must be one of `any`, `file`, `cache`')
 
+    def get_node_hash(self, json_objref: str) -> str:
+        """Return the hash of the node referenced by file name or hash prefix"""
+        return self._get_hash_from_objref(json_objref)
+
     def _get_doc_from_objref(self, json_objref: str, source: str='any') -> dict:
         if source in ('any', 'file'):
             try:
@@ -342,26 +919,33 @@ class JsonFileVersionControl:
         raise ValueError('argument `source` must be one of `any`, `file`, `cache`')
 
     def get_associated_node_hashes(self, json_file: Path) -> list[str]:
-        json_dict = load_json_file(json_file)
-        return self._docvc.get_associated_node_hashes(json_dict)
+        node_hashes = self.find_file_node_hashes(json_file)
+        if len(node_hashes) == 1:
+            self._file_index.set_tracked_node(json_file, list(node_hashes)[0])
+        return node_hashes
 
     def get_messages(self, json_file: Path) -> dict[str, str]:
         node_hashes = self.get_associated_node_hashes(json_file)
         return self._docvc.get_messages(node_hashes)
 
     def is_tracked(self, json_file: Path) -> bool:
-        json_dict = load_json_file(Path(json_file))
-        return self._docvc.is_tracked(json_dict)
+        node_hashes = self.get_associated_node_hashes(Path(json_file))
+        return len(node_hashes) > 0
 
     def track(self, json_file: Path, message: str, force: bool=False) -> str:
         json_dict = load_json_file(Path(json_file))
-        return self._docvc.track(json_dict, message, force)
+        node_hash = self._docvc.track(json_dict, message, force)
+        self._file_index.set_tracked_node(json_file, node_hash)
+        return node_hash
 
     def update(self, old_json_objref: str, new_json_objref: Path,
                message: str, force: bool=False) -> str:
         old_node_hash = self._get_hash_from_objref(old_json_objref)
         new_json_dict = self._get_doc_from_objref(new_json_objref, source='any')
-        return self._docvc.update(old_node_hash, new_json_dict, message, force)
+        node_hash = self._docvc.update(old_node_hash, new_json_dict, message, force)
+        if os.path.isfile(new_json_objref):
+            self._file_index.set_tracked_node(new_json_objref, node_hash)
+        return node_hash
 
     def replace(self, target_json_file: Path, update_json_file: Path,
                 message: str, force: bool=False, target_hash_prefix: Optional[str]=None) -> str:
@@ -383,6 +967,7 @@ class JsonFileVersionControl:
         new_json_dict = self._get_doc_from_objref(str(update_json_file), source='file')
         ret = self._docvc.update(target_node_hash, new_json_dict, message, force)
         update_json_file.replace(target_json_file)
+        self._file_index.set_tracked_node(target_json_file, ret)
         return ret
 
     def get_linear_history(self, json_objref: str) -> list[JsonGraphNode]:
@@ -390,18 +975,48 @@ class JsonFileVersionControl:
         linear_history = self._docvc.get_linear_history(node_hash)
         return linear_history
 
+    def load_doc(self, json_objref: str) -> dict:
+        return self._get_doc_from_objref(json_objref, source='cache')
+
+    def get_path_history(self, json_objref: str, pointer: str) -> list[JsonGraphNode]:
+        node_hash = self._get_hash_from_objref(json_objref)
+        node_hashes = self._docvc.get_path_history(node_hash, pointer)
+        return self.get_cache().get_nodes(node_hashes)
+
+    def blame(self, json_objref: str, pointer: str='') -> dict[str, str]:
+        node_hash = self._get_hash_from_objref(json_objref)
+        return self._docvc.blame(node_hash, pointer)
+
     def get_doc(self, json_objref: str, json_dumps_args: Optional[dict]=None) -> str:
-        json_dict = self._get_doc_from_objref(json_objref, source='cache')
+        json_dict = self.load_doc(json_objref)
         option = 0
         if json_dumps_args.get('indent', False):
             option |= orjson.OPT_INDENT_2
         return orjson.dumps(json_dict, option=option).decode('utf-8')
 
-    def get_diff(self, old_json_objref: str, new_json_objref: str,
-                 json_dumps_args: Optional[dict]=None) -> str:
+    def _get_node_diff(self, old_json_objref: str, new_json_objref: str) -> Optional[list]:
+        try:
+            old_node_hash = self._get_hash_from_objref(old_json_objref)
+            new_node_hash = self._get_hash_from_objref(new_json_objref)
+        except (KeyError, ValueError, SeveralNodesWithDocError):
+            # untracked files are compared by content
+            return None
+        try:
+            return self._docvc.get_node_diff(old_node_hash, new_node_hash)
+        except PatchCompositionError:
+            return None
+
+    def create_diff(self, old_json_objref: str, new_json_objref: str) -> list:
+        patch = self._get_node_diff(old_json_objref, new_json_objref)
+        if patch is not None:
+            return patch
         old_json_dict = self._get_doc_from_objref(old_json_objref)
         new_json_dict = self._get_doc_from_objref(new_json_objref)
-        diff_dict = self._docvc.get_diff(old_json_dict, new_json_dict)
+        return self._docvc.get_diff(old_json_dict, new_json_dict)
+
+    def get_diff(self, old_json_objref: str, new_json_objref: str,
+                 json_dumps_args: Optional[dict]=None) -> str:
+        diff_dict = self.create_diff(old_json_objref, new_json_objref)
         option = 0
         if json_dumps_args.get('indent', False):
             option |= orjson.OPT_INDENT_2
@@ -0,0 +1,103 @@
+import asyncio
+from pathlib import Path
+import pytest
+from jsonvc.async_storage import AsyncJsonStorageProvider, AsyncLocalJsonStorageProvider
+from jsonvc.storage import LocalJsonStorageProvider, CachedJsonStorageProvider
+from jsonvc.sqlite_storage import SqliteJsonStorageProvider
+from jsonvc.version_control import JsonDocVersionControl
+
+
+class SlowAsyncStorageProvider(AsyncJsonStorageProvider):
+    """Delay every call and record the maximum number of concurrent loads"""
+
+    def __init__(self, backend):
+        self._backend = backend
+        self.num_loading = 0
+        self.max_num_loading = 0
+
+    async def load(self, json_hash):
+        self.num_loading += 1
+        self.max_num_loading = max(self.max_num_loading, self.num_loading)
+        await asyncio.sleep(0.01)
+        self.num_loading -= 1
+        return self._backend.load(json_hash)
+
+    async def store(self, json_dict):
+        return self._backend.store(json_dict)
+
+    async def exists(self, json_hash):
+        return self._backend.exists(json_hash)
+
+    async def compute_hash(self, json_dict):
+        return self._backend.compute_hash(json_dict)
+
+
+@pytest.fixture(scope='function')
+def test_dir(tmpdir):
+    return Path(tmpdir)
+
+
+def _create_history(store, num_nodes):
+    docvc = JsonDocVersionControl(store)
+    node_hashes = [docvc.track({'x': 0}, 'first')]
+    for i in range(1, num_nodes):
+        node_hashes.append(docvc.update(node_hashes[-1], {'x': i}, f'update {i}'))
+    return docvc, node_hashes
+
+
+def test_async_local_storage(test_dir):
+    docvc, node_hashes = _create_history(LocalJsonStorageProvider(test_dir), 5)
+    async_store = AsyncLocalJsonStorageProvider(test_dir)
+    async_docvc = JsonDocVersionControl(LocalJsonStorageProvider(test_dir), async_store)
+
+    async def run():
+        assert await async_store.exists(node_hashes[0])
+        assert await async_store.compute_hash({'x': 4}) == await async_store.store({'x': 4})
+        visited = await async_docvc.get_cache().discover_nodes_async([node_hashes[-1]])
+        history = await async_docvc.get_linear_history_async(node_hashes[-1])
+        doc = await async_docvc.get_doc_async(node_hashes[2])
+        return visited, history, doc
+
+    visited, history, doc = asyncio.run(run())
+    async_store.close()
+    assert visited == set(node_hashes)
+    assert [n.get_hash() for n in history] == \
+        [n.get_hash() for n in docvc.get_linear_history(node_hashes[-1])]
+    assert doc == {'x': 2}
+
+
+def test_async_loads_are_concurrent(test_dir):
+    store = LocalJsonStorageProvider(test_dir)
+    docvc, node_hashes = _create_history(store, 8)
+    branch = docvc.update(node_hashes[0], {'y': 1}, 'branch')
+    async_store = SlowAsyncStorageProvider(store)
+    docvc = JsonDocVersionControl(store, async_store)
+    # the nodes of both branches are discovered one generation at a time
+    asyncio.run(docvc.get_cache().discover_nodes_async([node_hashes[-1], branch]))
+    assert async_store.max_num_loading == 2
+
+    async_store.max_num_loading = 0
+    history = asyncio.run(docvc.get_linear_history_async(node_hashes[-1]))
+    assert len(history) == 8
+    assert async_store.max_num_loading == 8
+
+
+def test_async_sqlite_storage(test_dir):
+    store = SqliteJsonStorageProvider(test_dir / 'objects.db')
+    docvc, node_hashes = _create_history(store, 8)
+    branch = docvc.update(node_hashes[0], {'y': 1}, 'branch')
+    # the synchronous storage is called from the threads of an adapter
+    docvc = JsonDocVersionControl(CachedJsonStorageProvider(store))
+
+    async def run():
+        return await asyncio.gather(
+            docvc.get_linear_history_async(node_hashes[-1]),
+            docvc.get_doc_async(branch),
+            *(docvc.get_doc_async(h) for h in node_hashes),
+        )
+
+    history, branch_doc, *docs = asyncio.run(run())
+    assert [n.get_hash() for n in history] == \
+        [n.get_hash() for n in docvc.get_linear_history(node_hashes[-1])]
+    assert branch_doc == {'y': 1}
+    assert docs == [{'x': i} for i in range(8)]
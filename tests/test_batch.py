@@ -0,0 +1,52 @@
+import json
+import orjson
+import pytest
+from pathlib import Path
+from jsonvc.storage import LocalJsonStorageProvider
+from jsonvc.version_control import JsonFileVersionControl
+from jsonvc.batch import run_batch
+
+
+@pytest.fixture(scope='function')
+def test_dir(tmpdir):
+    return Path(tmpdir)
+
+
+def _save_json_file(filename, json_dict):
+    with open(filename, 'w') as f:
+        json.dump(json_dict, f)
+
+
+def test_batch_operations(test_dir):
+    storage_dir = test_dir / 'storage'
+    storage_dir.mkdir()
+    fvc = JsonFileVersionControl(LocalJsonStorageProvider(storage_dir))
+    orig_file = test_dir / 'orig.json'
+    upd_file = test_dir / 'upd.json'
+    _save_json_file(orig_file, {'a': 23})
+    _save_json_file(upd_file, {'a': 27})
+    operations = [
+        {'op': 'istracked', 'filename': str(orig_file)},
+        {'op': 'track', 'filename': str(orig_file), 'message': 'first'},
+        {'op': 'update', 'old_objref': str(orig_file), 'new_objref': str(upd_file),
+         'message': 'second', 'id': 'upd'},
+        {'op': 'showlog', 'objref': str(upd_file)},
+        {'op': 'showdiff', 'old_objref': str(orig_file), 'new_objref': str(upd_file)},
+        {'op': 'track', 'filename': str(orig_file), 'message': 'again'},
+        {'op': 'nonsense'},
+    ]
+    lines = [json.dumps(op) for op in operations] + ['', 'not json']
+    output = []
+    num_failed = run_batch(fvc, lines, output.append)
+    results = [orjson.loads(r) for r in output]
+    assert num_failed == 3
+    assert len(results) == 8
+    assert results[0]['result']['tracked'] is False
+    assert results[2]['id'] == 'upd'
+    log = results[3]['result']['log']
+    assert [e['message'] for e in log] == ['first', 'second']
+    assert log[1]['hash'] == results[2]['result']['node_hash']
+    assert results[4]['result']['patch'] == [{'op': 'replace', 'path': '/a', 'value': 27}]
+    assert results[5]['error_type'] == 'DocAlreadyTrackedError'
+    assert results[6]['ok'] is False
+    assert results[7]['ok'] is False
@@ -0,0 +1,77 @@
+from pathlib import Path
+import pytest
+from jsonvc.storage import (
+    LocalJsonStorageProvider,
+    CachedJsonStorageProvider,
+    MemoryJsonStorageProvider,
+)
+from jsonvc.sqlite_storage import SqliteJsonStorageProvider
+from jsonvc.version_control import JsonDocVersionControl
+from jsonvc.garbage_collection import find_reachable_objects
+
+
+class CountingStorageProvider(MemoryJsonStorageProvider):
+    """Record how often single and batch loads are requested"""
+
+    def __init__(self):
+        super().__init__()
+        self.num_loads = 0
+        self.num_load_many = 0
+
+    def load(self, json_hash):
+        self.num_loads += 1
+        return super().load(json_hash)
+
+    def load_many(self, json_hashes):
+        self.num_load_many += 1
+        return [super(CountingStorageProvider, self).load(h) for h in json_hashes]
+
+
+@pytest.fixture(scope='function')
+def test_dir(tmpdir):
+    return Path(tmpdir)
+
+
+@pytest.mark.parametrize('backend', ['local', 'sqlite', 'memory', 'cached'])
+def test_batch_operations(test_dir, backend):
+    if backend == 'local':
+        store = LocalJsonStorageProvider(test_dir, bloom_filter_fpr=0.01)
+    elif backend == 'sqlite':
+        store = SqliteJsonStorageProvider(test_dir / 'objects.db')
+    elif backend == 'memory':
+        store = MemoryJsonStorageProvider()
+    else:
+        store = CachedJsonStorageProvider(LocalJsonStorageProvider(test_dir), max_objects=2)
+    json_dicts = [{'x': i} for i in range(5)] + [{'x': 0}]
+    json_hashes = store.store_many(json_dicts)
+    assert json_hashes == [store.compute_hash(d) for d in json_dicts]
+    assert store.load_many(json_hashes) == json_dicts
+    loaded = store.load_many([json_hashes[0], json_hashes[0]])
+    assert loaded[0] is not loaded[1]
+    absent_hash = store.compute_hash({'absent': True})
+    assert store.exists_many([json_hashes[1], absent_hash]) == [True, False]
+    assert store.load_many([]) == []
+    with pytest.raises(Exception):
+        store.load_many([json_hashes[2], absent_hash])
+
+
+def test_call_sites_use_batches():
+    store = CountingStorageProvider()
+    docvc = JsonDocVersionControl(store)
+    node_hashes = [docvc.track({'x': 0}, 'first')]
+    for i in range(1, 5):
+        node_hashes.append(docvc.update(node_hashes[-1], {'x': i}, f'update {i}'))
+
+    store.num_loads = 0
+    store.num_load_many = 0
+    messages = docvc.get_messages(node_hashes)
+    history = docvc.get_linear_history(node_hashes[-1])
+    assert messages[node_hashes[2]] == 'update 2'
+    assert [n.get_hash() for n in history] == node_hashes
+    assert store.num_loads == 0
+    assert store.num_load_many == 2
+
+    docvc = JsonDocVersionControl(store)
+    assert docvc.get_cache().discover_nodes([node_hashes[-1]]) == set(node_hashes)
+    reachable = find_reachable_objects(store, [node_hashes[-1]])
+    assert len(reachable) == 3 * len(node_hashes) - 1
@@ -0,0 +1,104 @@
+import threading
+import multiprocessing
+from pathlib import Path
+import pytest
+from jsonvc.bloom_filter import BloomFilter, locked_bloom_filter
+from jsonvc.storage import LocalJsonStorageProvider
+from jsonvc import storage_utils as jsu
+
+
+@pytest.fixture(scope='function')
+def json_storage_dir(tmpdir):
+    return Path(tmpdir)
+
+
+def test_bloom_filter_false_positive_rate(json_storage_dir):
+    filepath = json_storage_dir / 'test.bloom'
+    items = [f'item{i}' for i in range(1000)]
+    with locked_bloom_filter(filepath):
+        bloom_filter = BloomFilter.create(filepath, items[:500], 1000, 0.01)
+    for item in items[500:]:
+        bloom_filter.add(item)
+    # items already reported as contained are not counted
+    assert 980 <= len(bloom_filter) <= 1000
+    assert all(bloom_filter.might_contain(item) for item in items)
+    # the same file opened by another process sees all additions
+    other_filter = BloomFilter(filepath)
+    false_positives = sum(other_filter.might_contain(f'other{i}') for i in range(10000))
+    assert false_positives < 300
+
+
+def test_storage_bloom_filter(json_storage_dir):
+    store = LocalJsonStorageProvider(json_storage_dir)
+    old_hash = store.store({'old': True})
+    # the filter is built from the objects already stored
+    store = LocalJsonStorageProvider(json_storage_dir, bloom_filter_fpr=0.01)
+    other_store = LocalJsonStorageProvider(json_storage_dir, bloom_filter_fpr=0.01)
+    assert store.exists(old_hash)
+    json_hashes = [store.store({'i': i}) for i in range(3000)]
+    # the filter has been replaced by larger ones in the meantime
+    assert all(other_store.exists(h) for h in json_hashes)
+    assert not other_store.exists(store.compute_hash({'i': -1}))
+    bloom_filter = BloomFilter(json_storage_dir / jsu.BLOOM_FILTER_FILENAME)
+    assert bloom_filter.get_capacity() >= 3001
+    assert set(store.index()) == set(json_hashes) | {old_hash}
+
+
+def test_bloom_filter_updated_before_writing(json_storage_dir, monkeypatch):
+    store = LocalJsonStorageProvider(json_storage_dir, bloom_filter_fpr=0.01)
+
+    def failing_write(filepath, data):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(jsu, 'write_file_atomic', failing_write)
+    with pytest.raises(OSError):
+        store.store({'a': 1})
+    bloom_filter = BloomFilter(json_storage_dir / jsu.BLOOM_FILTER_FILENAME)
+    assert bloom_filter.might_contain(store.compute_hash({'a': 1}))
+    monkeypatch.undo()
+    # objects known to the filter are still written
+    json_hash = store.store({'a': 1})
+    assert jsu.is_json_object_stored(json_hash, json_storage_dir)
+
+
+def test_bloom_filter_kept_by_other_writers(json_storage_dir):
+    store = LocalJsonStorageProvider(json_storage_dir, bloom_filter_fpr=0.01)
+    # e.g. a command run without the filter configured
+    other_store = LocalJsonStorageProvider(json_storage_dir)
+    json_hashes = other_store.store_many([{'i': i} for i in range(3000)])
+    assert all(store.exists(h) for h in json_hashes)
+    assert all(other_store.exists(h) for h in json_hashes)
+
+
+def _slow_writer(storage_dir, adding_done, writing_allowed):
+    store = LocalJsonStorageProvider(storage_dir, bloom_filter_fpr=0.01)
+    write_file_atomic = jsu.write_file_atomic
+
+    def slow_write(filepath, data):
+        adding_done.set()
+        writing_allowed.wait(10)
+        write_file_atomic(filepath, data)
+
+    jsu.write_file_atomic = slow_write
+    store.store({'a': 1})
+
+
+def test_bloom_filter_rebuilt_while_writing(json_storage_dir):
+    store = LocalJsonStorageProvider(json_storage_dir, bloom_filter_fpr=0.01)
+    ctx = multiprocessing.get_context('spawn')
+    adding_done, writing_allowed = ctx.Event(), ctx.Event()
+    writer = ctx.Process(target=_slow_writer, args=(json_storage_dir, adding_done, writing_allowed))
+    writer.start()
+    try:
+        assert adding_done.wait(30)
+        # the hash is in the filter, but its file is not written yet
+        rebuild = threading.Thread(target=store.rebuild_bloom_filter)
+        rebuild.start()
+        rebuild.join(0.5)
+        assert rebuild.is_alive()
+    finally:
+        writing_allowed.set()
+        writer.join(30)
+    rebuild.join(30)
+    assert writer.exitcode == 0
+    assert store.exists(store.compute_hash({'a': 1}))
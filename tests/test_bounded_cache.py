@@ -0,0 +1,143 @@
+import os
+import orjson
+import pytest
+from jsonvc.bounded_cache import BoundedDirectoryJsonStorageProvider
+from jsonvc.ipfs_cid import compute_unixfs_file_cid, matches_file_cid
+from jsonvc.storage_utils import compute_json_hash
+
+
+def make_object(i):
+    # 100 bytes when serialized
+    return {'i': i, 'pad': 'x' * (85 - len(str(i)))}
+
+
+def make_cache(directory, **kwargs):
+    return BoundedDirectoryJsonStorageProvider(directory, compute_json_hash, **kwargs)
+
+
+def test_unixfs_file_cid():
+    assert str(compute_unixfs_file_cid(b'hello world\n')) == \
+        'QmT78zSuBmuS4z925WZfrqQ1qHaJ56DQaTfyMUF7F8ff5o'
+    # several chunks linked by a parent node
+    content = bytes(range(256)) * 4096
+    cid = compute_unixfs_file_cid(content)
+    assert matches_file_cid(str(cid), content)
+    assert not matches_file_cid(str(cid), content[:-1])
+
+
+@pytest.mark.parametrize('policy', ['lru', 'lfu'])
+def test_eviction_by_size(tmp_path, policy):
+    cache = make_cache(tmp_path, max_bytes=1000, policy=policy)
+    hashes = []
+    for i in range(10):
+        json_hash = compute_json_hash(make_object(i))
+        cache.store_under_hash(json_hash, make_object(i))
+        hashes.append(json_hash)
+    # the first object is used most often and most recently
+    for _ in range(3):
+        cache.load(hashes[0])
+    assert cache.get_total_bytes() == 1000
+    json_hash = compute_json_hash(make_object(10))
+    cache.store_under_hash(json_hash, make_object(10))
+    # evicted down to the low watermark
+    assert cache.get_total_bytes() <= 900
+    assert cache.exists(hashes[0])
+    assert not cache.exists(hashes[1])
+    assert not (tmp_path / hashes[1]).exists()
+    assert cache.exists(json_hash)
+    # except for the files of the index
+    assert sorted(cache.index()) == sorted(n for n in os.listdir(tmp_path) if not n.startswith('.'))
+
+
+def test_pinned_objects_are_kept(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=500)
+    hashes = []
+    for i in range(5):
+        json_hash = compute_json_hash(make_object(i))
+        cache.store_under_hash(json_hash, make_object(i))
+        hashes.append(json_hash)
+    cache.set_pinned_func(lambda: {hashes[0]})
+    cache.store_under_hash(compute_json_hash(make_object(5)), make_object(5))
+    assert cache.exists(hashes[0])
+    assert not cache.exists(hashes[1])
+
+
+def test_reachable_objects(tmp_path):
+    cache = make_cache(tmp_path)
+    doc_hash = compute_json_hash({'a': 1})
+    cache.store_under_hash(doc_hash, {'a': 1})
+    parent = {'sourceHashes': None, 'documentHash': doc_hash, 'extJsonPatchHash': None}
+    parent_hash = compute_json_hash(parent)
+    cache.store_under_hash(parent_hash, parent)
+    # the patch is not cached
+    child = {'sourceHashes': [parent_hash], 'documentHash': doc_hash, 'extJsonPatchHash': '0' * 64}
+    child_hash = compute_json_hash(child)
+    cache.store_under_hash(child_hash, child)
+    assert cache.find_reachable_objects([child_hash]) == {child_hash, parent_hash, doc_hash}
+    assert cache.find_reachable_objects([parent_hash]) == {parent_hash, doc_hash}
+
+
+def test_corrupt_object_is_removed(tmp_path):
+    content = orjson.dumps({'x': 1})
+    cid = str(compute_unixfs_file_cid(content))
+    cache = make_cache(tmp_path, verify_func=matches_file_cid)
+    cache.store_under_hash(cid, {'x': 1})
+    assert cache.load(cid) == {'x': 1}
+    (tmp_path / cid).write_bytes(b'{"x":2}')
+    with pytest.raises(FileNotFoundError):
+        cache.load(cid)
+    assert not cache.exists(cid)
+    assert not (tmp_path / cid).exists()
+
+
+def test_index_persistence(tmp_path):
+    cache = make_cache(tmp_path, policy='lfu')
+    first_hash = compute_json_hash(make_object(1))
+    cache.store_under_hash(first_hash, make_object(1))
+    for _ in range(5):
+        cache.load(first_hash)
+    cache.save_index()
+    # stored by another process
+    second_hash = compute_json_hash(make_object(2))
+    make_cache(tmp_path, max_bytes=1000).store_under_hash(second_hash, make_object(2))
+    cache = make_cache(tmp_path, max_bytes=150, policy='lfu')
+    assert cache.get_total_bytes() == 200
+    assert sorted(cache.index()) == sorted([first_hash, second_hash])
+    # the access count survived, so the other object is evicted
+    cache.evict(150)
+    assert cache.exists(first_hash)
+    assert not cache.exists(second_hash)
+
+
+def test_directory_listed_without_index(tmp_path):
+    json_hash = compute_json_hash(make_object(1))
+    (tmp_path / json_hash).write_bytes(orjson.dumps(make_object(1)))
+    cache = make_cache(tmp_path)
+    assert cache.index() == [json_hash]
+    cache.save_index()
+    # not listed again once there is an index
+    other_hash = compute_json_hash(make_object(2))
+    (tmp_path / other_hash).write_bytes(orjson.dumps(make_object(2)))
+    cache = make_cache(tmp_path)
+    assert cache.index() == [json_hash]
+    # but indexed once read
+    assert cache.load(other_hash) == make_object(2)
+    assert cache.get_total_bytes() == 200
+
+
+def test_eviction_counts_other_processes(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=500)
+    other_cache = make_cache(tmp_path, max_bytes=500)
+    hashes = []
+    for i in range(6):
+        json_hash = compute_json_hash(make_object(i))
+        # both caches store in turn, so that each one alone stays below the limit
+        (cache if i % 2 == 0 else other_cache).store_under_hash(json_hash, make_object(i))
+        hashes.append(json_hash)
+    assert other_cache.get_total_bytes() <= 450
+    assert not (tmp_path / hashes[0]).exists()
+    assert sorted(other_cache.index()) == \
+        sorted(n for n in os.listdir(tmp_path) if not n.startswith('.'))
+    # the removals are seen by the other cache on its next check
+    cache.store_under_hash(compute_json_hash(make_object(6)), make_object(6))
+    assert cache.get_total_bytes() == other_cache.get_total_bytes() + 100
@@ -0,0 +1,90 @@
+import io
+import pytest
+from jsonvc.bundle import InvalidBundleError, read_bundle, write_bundle
+from jsonvc.storage import MemoryJsonStorageProvider
+from jsonvc.version_control import JsonDocVersionControl
+
+
+class RecordingStorageProvider(MemoryJsonStorageProvider):
+
+    def __init__(self):
+        super().__init__()
+        self.stored = []
+        self.batches = []
+
+    def store(self, json_dict):
+        json_hash = super().store(json_dict)
+        self.stored.append(json_hash)
+        return json_hash
+
+    def store_many(self, json_dicts):
+        json_hashes = super().store_many(json_dicts)
+        self.batches.append(json_hashes)
+        return json_hashes
+
+
+@pytest.fixture(scope='function')
+def history():
+    storage = MemoryJsonStorageProvider()
+    docvc = JsonDocVersionControl(storage)
+    first = docvc.track({'x': [1, 2]}, 'first')
+    second = docvc.update(first, {'x': [1, 2, 3]}, 'second')
+    third = docvc.update(second, {'x': [1, 2, 3], 'y': 1}, 'third')
+    return storage, [first, second, third]
+
+
+@pytest.mark.parametrize('compression', ['none', 'zlib'])
+def test_bundle_roundtrip(history, compression):
+    storage, (first, second, third) = history
+    bundle = io.BytesIO()
+    assert write_bundle(storage, bundle, [third], compression=compression) == 8
+    bundle.seek(0)
+    dst = RecordingStorageProvider()
+    info = read_bundle(dst, bundle, batch_size=3)
+    assert info.heads == [third]
+    assert info.num_objects == 8
+    # nodes follow their history
+    assert dst.stored.index(first) < dst.stored.index(second) < dst.stored.index(third)
+    # nodes are not stored in one batch with their history, which
+    # storages may write in parallel
+    for batch in dst.batches:
+        for node_hash in {first, second, third}.intersection(batch):
+            node_dict = dst.load(node_hash)
+            history_hashes = [node_dict['documentHash'], node_dict['extJsonPatchHash']]
+            history_hashes.extend(node_dict['sourceHashes'] or [])
+            assert not set(history_hashes).intersection(batch)
+    assert JsonDocVersionControl(dst).get_doc(third) == {'x': [1, 2, 3], 'y': 1}
+
+
+def test_bundle_with_base(history):
+    storage, (first, second, third) = history
+    bundle = io.BytesIO()
+    assert write_bundle(storage, bundle, [third], [second]) == 3
+    bundle.seek(0)
+    with pytest.raises(InvalidBundleError, match='requires'):
+        read_bundle(MemoryJsonStorageProvider(), bundle)
+
+    dst = MemoryJsonStorageProvider()
+    base_bundle = io.BytesIO()
+    write_bundle(storage, base_bundle, [second])
+    base_bundle.seek(0)
+    read_bundle(dst, base_bundle)
+    bundle.seek(0)
+    assert read_bundle(dst, bundle).num_objects == 3
+    assert JsonDocVersionControl(dst).get_doc(third) == {'x': [1, 2, 3], 'y': 1}
+
+
+def test_corrupt_and_truncated_bundle(history):
+    storage, (first, second, third) = history
+    bundle = io.BytesIO()
+    write_bundle(storage, bundle, [third], compression='none')
+    data = bundle.getvalue()
+    with pytest.raises(InvalidBundleError, match='truncated'):
+        read_bundle(MemoryJsonStorageProvider(), io.BytesIO(data[:-10]))
+    corrupt = data.replace(b'[1,2,3]', b'[1,2,4]', 1)
+    assert corrupt != data
+    dst = MemoryJsonStorageProvider()
+    with pytest.raises(InvalidBundleError, match='hash'):
+        read_bundle(dst, io.BytesIO(corrupt))
+    with pytest.raises(InvalidBundleError, match='Not a jsonvc bundle'):
+        read_bundle(dst, io.BytesIO(b'{"x": 1}'))
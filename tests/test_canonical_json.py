@@ -0,0 +1,67 @@
+import io
+import orjson
+import pytest
+from hypothesis import given, settings, strategies as st
+from jsonvc import canonical_json
+from jsonvc.canonical_json import dump_canonical_json, iter_canonical_json
+from jsonvc.checksum import compute_json_hash
+
+
+scalars = (
+    st.none() | st.booleans() | st.text()
+    | st.integers(min_value=-2**63, max_value=2**64 - 1)
+    | st.floats(allow_nan=True, allow_infinity=True)
+)
+json_values = st.recursive(
+    scalars,
+    lambda children: (
+        st.lists(children) | st.lists(children).map(tuple)
+        | st.dictionaries(st.text(), children)
+    ),
+    max_leaves=200,
+)
+
+
+def _dumps(value):
+    return orjson.dumps(value, option=orjson.OPT_SORT_KEYS)
+
+
+@given(json_values)
+def test_identical_to_orjson(value):
+    assert b''.join(iter_canonical_json(value, chunk_size=16)) == _dumps(value)
+
+
+@settings(max_examples=50)
+@given(json_values)
+def test_identical_to_orjson_piecewise(value):
+    # force containers to be encoded piecewise
+    original = canonical_json.BATCH_WEIGHT
+    canonical_json.BATCH_WEIGHT = 3
+    try:
+        assert b''.join(iter_canonical_json(value)) == _dumps(value)
+    finally:
+        canonical_json.BATCH_WEIGHT = original
+
+
+@given(st.dictionaries(st.text(), json_values))
+def test_hash_while_writing(json_dict):
+    fileobj = io.BytesIO()
+    json_hash = dump_canonical_json(json_dict, fileobj)
+    assert fileobj.getvalue() == _dumps(json_dict)
+    assert json_hash == compute_json_hash(json_dict)
+    assert compute_json_hash(json_dict, streaming=True) == json_hash
+    # other algorithms give multihashes
+    assert dump_canonical_json(json_dict, algo='blake2b-256') == \
+        compute_json_hash(json_dict, 'blake2b-256')
+
+
+def test_same_errors_as_orjson():
+    deep = 1
+    for _ in range(canonical_json.MAX_DEPTH):
+        deep = [deep]
+    assert b''.join(iter_canonical_json(deep)) == _dumps(deep)
+    for value in ([deep], {'a': [deep]}, {1: 2}, [{'a': 1}, {2: 3}], [2**64], {'a': object()}):
+        with pytest.raises(TypeError):
+            _dumps(value)
+        with pytest.raises(TypeError):
+            b''.join(iter_canonical_json(value))
@@ -0,0 +1,88 @@
+from pathlib import Path
+import pytest
+from jsonvc.storage import LocalJsonStorageProvider
+from jsonvc.version_control import JsonDocVersionControl
+from jsonvc.commit_graph import CommitGraph, write_commit_graph
+from jsonvc.custom_exceptions import SeveralAncestorsError
+
+
+@pytest.fixture(scope='function')
+def test_dir(tmpdir):
+    return Path(tmpdir)
+
+
+def test_commit_graph_snapshot(test_dir):
+    store = LocalJsonStorageProvider(test_dir)
+    docvc = JsonDocVersionControl(store)
+    first = docvc.track({'x': 0}, 'first')
+    history = [first]
+    for i in range(1, 5):
+        history.append(docvc.update(history[-1], {'x': i}, f'update {i}'))
+    other = docvc.track({'y': 0}, 'other')
+    cache = docvc.get_cache()
+    expected_node_hashes = set(cache.get_node_hashes())
+
+    graph_path = test_dir / 'commit-graph.bin'
+    cache.write_commit_graph(graph_path)
+    # all entries moved into the snapshot
+    assert cache.to_dict() == {'known_nodes': {}, 'known_docs': {}}
+    assert set(cache.get_node_hashes()) == expected_node_hashes
+    assert docvc.get_linear_history_hashes(history[-1]) == history
+    assert docvc.expand_hash_prefix(history[2][:10]) == history[2]
+    assert cache.find_associated_node_hashes(store.compute_hash({'x': 3})) == {history[3]}
+    assert cache.is_ancestor(first, history[-1])
+    assert not cache.is_ancestor(history[-1], first)
+    assert not cache.is_ancestor(other, history[-1])
+
+    # new nodes extend the snapshot via the regular cache entries
+    newest = docvc.update(history[-1], {'x': 5}, 'update 5')
+    assert docvc.get_linear_history_hashes(newest) == history + [newest]
+    assert cache.is_ancestor(first, newest)
+
+    # the snapshot can also be opened on its own
+    graph = CommitGraph(graph_path)
+    node_id = graph.find_node_id(history[1])
+    assert graph.get_generation(node_id) == 2
+    assert graph.get_parent_ids(node_id) == [graph.find_node_id(first)]
+    graph.close()
+
+    cache.detach_commit_graph()
+    assert cache.get_commit_graph() is None
+    assert set(cache.get_node_hashes()) == expected_node_hashes | {newest}
+
+
+def test_commit_graph_merge_history(test_dir):
+    store = LocalJsonStorageProvider(test_dir)
+    docvc = JsonDocVersionControl(store)
+    first = docvc.track({'x': 0}, 'first')
+    cache = docvc.get_cache()
+    # a node with two sources, registered directly in the cache
+    cache.update_node_cache('ab' * 32, [first, 'cd' * 32])
+    cache.update_node_cache('cd' * 32, [])
+    cache.update_doc_cache('ef' * 32, 'ab' * 32)
+    cache.update_doc_cache('ef' * 32, 'cd' * 32)
+    cache.write_commit_graph(test_dir / 'commit-graph.bin')
+    assert len(cache.get_commit_graph()) == 3
+    with pytest.raises(SeveralAncestorsError):
+        cache.get_linear_history_hashes('ab' * 32)
+    assert cache.is_ancestor(first, 'ab' * 32)
+
+
+def test_commit_graph_long_history(test_dir):
+    num_nodes = 50000
+    node_hashes = [f'{i:064x}' for i in range(num_nodes)]
+    known_nodes = {node_hashes[0]: set()}
+    known_nodes.update((node_hashes[i], {node_hashes[i-1]}) for i in range(1, num_nodes))
+    node_docs = {h: h for h in node_hashes}
+    # an IPFS node and its descendants cannot be included
+    known_nodes['Qm' + 'a' * 44] = {node_hashes[-1]}
+    known_nodes['f' * 64] = {'Qm' + 'a' * 44}
+    node_docs['Qm' + 'a' * 44] = 'e' * 64
+    node_docs['f' * 64] = 'f' * 64
+    included = write_commit_graph(test_dir / 'graph', known_nodes, node_docs)
+    assert included == set(node_hashes)
+    graph = CommitGraph(test_dir / 'graph')
+    last_id = graph.find_node_id(node_hashes[-1])
+    assert graph.get_generation(last_id) == num_nodes
+    assert len(graph.get_linear_history_ids(last_id)) == num_nodes
+    graph.close()
@@ -0,0 +1,42 @@
+import pytest
+from pathlib import Path
+from jsonvc.storage import LocalJsonStorageProvider
+from jsonvc.storage_utils import construct_filepath
+from jsonvc.compression import is_compressed, zstandard
+
+
+@pytest.fixture(scope='function')
+def json_storage_dir(tmpdir):
+    return Path(tmpdir)
+
+
+def _make_record(i):
+    return {
+        'reaction': f'(n,g) channel {i % 7}',
+        'crossSection': {'energies': [1.0, 2.0, 3.0], 'values': [i, i + 1, i + 2]},
+        'reference': {'author': 'Someone', 'year': 1990 + i % 30},
+    }
+
+
+@pytest.mark.parametrize('codec', [
+    'zlib',
+    pytest.param('zstd', marks=pytest.mark.skipif(zstandard is None, reason='zstandard missing')),
+])
+def test_compressed_storage(json_storage_dir, codec):
+    plain_store = LocalJsonStorageProvider(json_storage_dir)
+    old_hash = plain_store.store(_make_record(0))
+
+    store = LocalJsonStorageProvider(json_storage_dir, compression=codec)
+    hashes = [store.store(_make_record(i)) for i in range(1, 200)]
+    dict_id = store.train_dictionary(dict_size=4096)
+    dict_hash = store.store(_make_record(1000))
+
+    assert dict_id > 0
+    assert hashes[0] == plain_store.compute_hash(_make_record(1))
+    assert is_compressed(construct_filepath(dict_hash, json_storage_dir).read_bytes())
+    assert not is_compressed(construct_filepath(old_hash, json_storage_dir).read_bytes())
+
+    reader = LocalJsonStorageProvider(json_storage_dir)
+    assert reader.load(old_hash) == _make_record(0)
+    assert reader.load(hashes[5]) == _make_record(6)
+    assert reader.load(dict_hash) == _make_record(1000)
@@ -0,0 +1,61 @@
+import multiprocessing
+import pytest
+from pathlib import Path
+from jsonvc.storage import LocalJsonStorageProvider
+from jsonvc.version_control import JsonDocVersionControl
+from jsonvc.journal import JournaledStateFile
+
+
+NUM_PROCESSES = 8
+NUM_DOCS_PER_PROCESS = 25
+
+
+@pytest.fixture(scope='function')
+def test_dir(tmpdir):
+    return Path(tmpdir)
+
+
+def _get_state_file(test_dir):
+    # a tiny compaction threshold forces frequent concurrent compactions
+    return JournaledStateFile(
+        test_dir / 'cache.json', test_dir / 'cache.journal', min_compact_size=512
+    )
+
+
+def _writer(test_dir, worker_id):
+    store = LocalJsonStorageProvider(test_dir / 'storage')
+    state_file = _get_state_file(test_dir)
+    node_hashes = []
+    for i in range(NUM_DOCS_PER_PROCESS):
+        docvc = JsonDocVersionControl(store)
+        state_file.load(docvc.get_cache())
+        # the shared document is stored by all processes at the same time
+        shared = {'shared': i, 'payload': list(range(200))}
+        own = {'worker': worker_id, 'doc': i, 'payload': list(range(200))}
+        node_hash = docvc.track(own, f'worker {worker_id} doc {i}')
+        node_hashes.append(node_hash)
+        node_hashes.append(docvc.update(node_hash, shared, 'shared', force=True))
+        state_file.save(docvc.get_cache())
+    return node_hashes
+
+
+def test_parallel_writers(test_dir):
+    (test_dir / 'storage').mkdir()
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(NUM_PROCESSES) as pool:
+        results = pool.starmap(_writer, [(test_dir, i) for i in range(NUM_PROCESSES)])
+    expected_node_hashes = {h for r in results for h in r}
+
+    store = LocalJsonStorageProvider(test_dir / 'storage')
+    docvc = JsonDocVersionControl(store)
+    _get_state_file(test_dir).load(docvc.get_cache())
+    cache = docvc.get_cache()
+    assert set(cache.get_node_hashes()) == expected_node_hashes
+    assert len(expected_node_hashes) == 2 * NUM_PROCESSES * NUM_DOCS_PER_PROCESS
+    for i in range(NUM_DOCS_PER_PROCESS):
+        shared = {'shared': i, 'payload': list(range(200))}
+        assert len(docvc.get_associated_node_hashes(shared)) == NUM_PROCESSES
+    # every stored object is complete and matches its hash
+    for json_hash in store.index():
+        store.load(json_hash)
+    assert not any(p.name.startswith('.tmp') for p in (test_dir / 'storage').iterdir())
@@ -0,0 +1,60 @@
+import threading
+import pytest
+from pathlib import Path
+from jsonvc.storage import LocalJsonStorageProvider
+from jsonvc.version_control import JsonDocVersionControl
+from jsonvc.journal import JournaledStateFile
+from jsonvc import daemon
+
+
+@pytest.fixture(scope='function')
+def test_dir(tmpdir):
+    return Path(tmpdir)
+
+
+def test_cache_journal_roundtrip(test_dir):
+    store = LocalJsonStorageProvider(test_dir)
+    docvc = JsonDocVersionControl(store)
+    state_file = JournaledStateFile(test_dir / 'cache.json', test_dir / 'cache.journal')
+    first_hash = docvc.track({'a': 1}, 'first')
+    state_file.save(docvc.get_cache())
+    second_hash = docvc.update(first_hash, {'a': 2}, 'second')
+    state_file.save(docvc.get_cache())
+    assert (test_dir / 'cache.journal').is_file()
+    assert not (test_dir / 'cache.json').is_file()
+
+    other_docvc = JsonDocVersionControl(store)
+    state_file.load(other_docvc.get_cache())
+    assert other_docvc.get_cache().to_dict() == docvc.get_cache().to_dict()
+    state_file.compact(other_docvc.get_cache())
+    assert not (test_dir / 'cache.journal').is_file()
+
+    third_docvc = JsonDocVersionControl(store)
+    state_file.load(third_docvc.get_cache())
+    assert third_docvc.get_cache().get_node_ancestor_hashes(second_hash) == {first_hash}
+
+
+@pytest.mark.skipif(not daemon.is_daemon_supported(), reason='requires Unix sockets')
+def test_daemon_request_roundtrip(tmp_path_factory):
+    # keep the socket path short enough for AF_UNIX
+    socket_path = Path(tmp_path_factory.mktemp('d')) / 'd.sock'
+    requests = []
+
+    def handle_func(request):
+        requests.append(request)
+        return {'status': 'ok', 'echo': request['argv']}
+
+    assert daemon.send_request(socket_path, {'type': 'ping'}) is None
+    server = daemon.JsonVcDaemonServer(socket_path, handle_func)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        assert daemon.is_daemon_running(socket_path)
+        response = daemon.send_request(socket_path, {'type': 'command', 'argv': ['showlog', 'x']})
+        assert response['echo'] == ['showlog', 'x']
+        daemon.send_request(socket_path, {'type': 'shutdown'})
+        thread.join(timeout=10)
+    finally:
+        server.server_close()
+    assert len(requests) == 1
+    assert not socket_path.exists()
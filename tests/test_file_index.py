@@ -0,0 +1,49 @@
+import os
+import time
+from pathlib import Path
+import pytest
+from jsonvc.storage import LocalJsonStorageProvider
+from jsonvc.version_control import JsonFileVersionControl
+
+
+@pytest.fixture(scope='function')
+def test_dir(tmpdir):
+    return Path(tmpdir)
+
+
+def _write(filepath, content, mtime_ns):
+    filepath.write_text(content)
+    os.utime(filepath, ns=(mtime_ns, mtime_ns))
+
+
+def test_file_index(test_dir):
+    (test_dir / 'storage').mkdir()
+    filevc = JsonFileVersionControl(LocalJsonStorageProvider(test_dir / 'storage'))
+    file_index = filevc.get_file_index()
+    json_file = test_dir / 'doc.json'
+    old_ns = time.time_ns() - 10 * 10**9
+    _write(json_file, '{"x": 1}', old_ns)
+    node_hash = filevc.track(json_file, 'first')
+    assert filevc.get_associated_node_hashes(json_file) == {node_hash}
+    assert file_index.lookup(json_file, os.stat(json_file)) is not None
+
+    # same size and modification time: the file is not read again
+    _write(json_file, '{"x": 2}', old_ns)
+    assert filevc.is_tracked(json_file)
+    # a changed modification time invalidates the entry
+    _write(json_file, '{"x": 2}', old_ns + 10**9)
+    assert not filevc.is_tracked(json_file)
+
+    # racily clean: modified just before reading
+    _write(json_file, '{"x": 1}', time.time_ns())
+    assert filevc.is_tracked(json_file)
+    assert file_index.lookup(json_file, os.stat(json_file)) is None
+
+    # entries survive persistence
+    other_filevc = JsonFileVersionControl(filevc.get_storage_provider())
+    other_filevc.get_file_index().from_dict(file_index.pop_delta())
+    _write(json_file, '{"x": 1}', old_ns)
+    filevc.is_tracked(json_file)
+    other_filevc.get_file_index().from_dict(file_index.pop_delta())
+    assert other_filevc.get_file_index().lookup(json_file, os.stat(json_file)) \
+        == filevc.get_storage_provider().compute_hash({'x': 1})
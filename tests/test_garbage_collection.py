@@ -0,0 +1,33 @@
+import pytest
+from pathlib import Path
+from jsonvc.storage import LocalJsonStorageProvider
+from jsonvc.version_control import JsonDocVersionControl
+from jsonvc.garbage_collection import collect_garbage
+
+
+@pytest.fixture(scope='function')
+def json_storage_dir(tmpdir):
+    return Path(tmpdir)
+
+
+def test_collect_garbage(json_storage_dir):
+    store = LocalJsonStorageProvider(json_storage_dir)
+    docvc = JsonDocVersionControl(store)
+    first_hash = docvc.track({'a': 1}, 'first')
+    second_hash = docvc.update(first_hash, {'a': 2}, 'second')
+    other_hash = docvc.track({'b': 1}, 'other')
+    orphan_hash = store.store({'orphan': True})
+    reachable_count = 5
+
+    cache = docvc.get_cache()
+    removed = collect_garbage(store, store, cache.get_node_hashes(), grace_period=3600)
+    assert removed == []
+    removed = collect_garbage(store, store, cache.get_node_hashes(), dry_run=True)
+    assert removed == [orphan_hash]
+    assert store.exists(orphan_hash)
+
+    removed = collect_garbage(store, store, [second_hash])
+    assert set(removed) == {orphan_hash, other_hash, store.compute_hash({'b': 1})}
+    assert len(store.index()) == reachable_count
+    assert docvc.get_doc(first_hash) == {'a': 1}
+    assert docvc.get_doc(second_hash) == {'a': 2}
@@ -0,0 +1,87 @@
+import pytest
+from jsonvc.checksum import (
+    HASH_ALGORITHMS,
+    compute_json_hash,
+    get_hash_algorithm,
+    is_hash_wellformed,
+    shorten_hash,
+)
+from jsonvc.sqlite_storage import SqliteJsonStorageProvider
+from jsonvc.storage import LocalJsonStorageProvider
+from jsonvc.custom_exceptions import DocAlreadyTrackedError
+from jsonvc.status import get_file_status
+from jsonvc.version_control import JsonDocVersionControl, JsonFileVersionControl
+
+
+@pytest.mark.parametrize('algo', list(HASH_ALGORITHMS))
+def test_self_describing_hashes(algo):
+    json_hash = compute_json_hash({'a': [1, 2]}, algo)
+    assert get_hash_algorithm(json_hash) == algo
+    assert is_hash_wellformed(json_hash)
+    assert compute_json_hash({'a': [1, 2]}, algo, streaming=True) == json_hash
+    # the digest follows the algorithm prefix in abbreviations
+    assert len(shorten_hash(json_hash)) == 10 + len(json_hash) - 2 * HASH_ALGORITHMS[algo][2]
+
+
+def test_sha256_hashes_unchanged():
+    json_hash = compute_json_hash({'a': 1})
+    assert json_hash == '015abd7f5cc57a2dd94b7590f04ad8084273905ee33ec5cebeae62276a97f862'
+    assert shorten_hash(json_hash) == json_hash[:10]
+    for invalid in ('ab' * 20, '1220' + 'ab' * 31, 'Qm' + 'a' * 44, 'a0e40220' + 'xy' * 32):
+        assert not is_hash_wellformed(invalid)
+    with pytest.raises(ValueError):
+        LocalJsonStorageProvider('.', hash_algorithm='md5')
+
+
+def test_algorithms_coexist_in_local_storage(tmp_path):
+    old_storage = LocalJsonStorageProvider(tmp_path)
+    old_node_hash = JsonDocVersionControl(old_storage).track({'x': 1}, 'old')
+    storage = LocalJsonStorageProvider(tmp_path, hash_algorithm='blake2b-256')
+    docvc = JsonDocVersionControl(storage)
+    new_node_hash = docvc.update(old_node_hash, {'x': 2}, 'new')
+    assert get_hash_algorithm(old_node_hash) == 'sha256'
+    assert get_hash_algorithm(new_node_hash) == 'blake2b-256'
+    assert docvc.get_doc(old_node_hash) == {'x': 1}
+    assert docvc.get_doc(new_node_hash) == {'x': 2}
+    history = docvc.get_linear_history(new_node_hash)
+    assert [n.get_meta()['message'] for n in history] == ['old', 'new']
+    assert [n.get_hash() for n in history] == [old_node_hash, new_node_hash]
+    assert {old_node_hash, new_node_hash} <= set(storage.index())
+
+
+def test_algorithms_coexist_in_sqlite_storage(tmp_path):
+    db_path = tmp_path / 'objects.db'
+    sha256_hash = SqliteJsonStorageProvider(db_path).store({'x': 1})
+    storage = SqliteJsonStorageProvider(db_path, hash_algorithm='blake2s-256')
+    blake2s_hash = storage.store({'x': 1})
+    assert blake2s_hash != sha256_hash
+    assert storage.load_many([sha256_hash, blake2s_hash]) == [{'x': 1}, {'x': 1}]
+
+
+def test_documents_tracked_before_algorithm_change(tmp_path):
+    (tmp_path / 'store').mkdir()
+    old_filevc = JsonFileVersionControl(LocalJsonStorageProvider(tmp_path / 'store'))
+    a_file = tmp_path / 'a.json'
+    a_file.write_text('{"x": 1}')
+    old_node_hash = old_filevc.track(a_file, 'old')
+    storage = LocalJsonStorageProvider(tmp_path / 'store', hash_algorithm='blake2b-256')
+    filevc = JsonFileVersionControl(storage)
+    # as loaded from the cache file, but without the file index
+    filevc.get_cache().from_dict(old_filevc.get_cache().to_dict())
+    docvc = JsonDocVersionControl(storage)
+    docvc.get_cache().from_dict(old_filevc.get_cache().to_dict())
+    assert docvc.is_tracked({'x': 1})
+    with pytest.raises(DocAlreadyTrackedError):
+        docvc.track({'x': 1}, 'again')
+    assert filevc.is_tracked(a_file)
+    assert filevc.get_node_hash(str(a_file)) == old_node_hash
+    with pytest.raises(DocAlreadyTrackedError):
+        filevc.track(a_file, 'again')
+    [status] = get_file_status(filevc, [a_file], num_workers=1)
+    assert status.state == 'unchanged' and status.node_hashes == {old_node_hash}
+    b_file = tmp_path / 'b.json'
+    b_file.write_text('{"x": 2}')
+    new_node_hash = filevc.update(str(a_file), b_file, 'new')
+    assert get_hash_algorithm(new_node_hash) == 'blake2b-256'
+    assert filevc.get_node_hash(str(b_file)) == new_node_hash
+    assert filevc.get_node_hash(str(a_file)) == old_node_hash
@@ -0,0 +1,158 @@
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+import orjson
+import pytest
+from jsonvc.ipfs_cid import (
+    CODEC_RAW,
+    Cid,
+    DagPbLink,
+    compute_block_cid,
+    encode_dag_pb,
+    encode_unixfs_file_leaf,
+)
+from jsonvc.ipfs_gateways import IpfsGatewayPool, GatewayUnavailableError
+from jsonvc.ipfs_storage import IpfsJsonStorageProvider
+
+
+class StubGateway:
+    """Serve raw blocks with an injected delay, status or corruption"""
+
+    def __init__(self, blocks, delay=0.0, status=200, corrupt=False):
+        self.blocks = blocks
+        self.delay = delay
+        self.status = status
+        self.corrupt = corrupt
+        self.num_requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def _respond(self, with_body):
+                stub.num_requests += 1
+                time.sleep(stub.delay)
+                cid = urlparse(self.path).path.rsplit('/', 1)[-1]
+                block = stub.blocks.get(cid, None)
+                status = stub.status if block is not None else 404
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/vnd.ipld.raw')
+                body = b'' if block is None or status != 200 else block
+                if stub.corrupt:
+                    body = body[:-1] + b'!'
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if with_body:
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                self._respond(True)
+
+            def do_HEAD(self):
+                self._respond(False)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture(scope='function')
+def blocks():
+    json_bytes = orjson.dumps({'x': [1, 2, 3]})
+    leaf = encode_unixfs_file_leaf(json_bytes)
+    leaf_cid = compute_block_cid(leaf)
+    # a file of two chunks, the second one a raw block
+    raw_chunk = b', "y": 4}'
+    raw_cid = compute_block_cid(raw_chunk, CODEC_RAW, 1)
+    first_chunk = encode_unixfs_file_leaf(b'{"x": [1, 2, 3]')
+    first_cid = compute_block_cid(first_chunk)
+    root = encode_dag_pb(
+        [DagPbLink(first_cid, '', len(first_chunk)), DagPbLink(raw_cid, '', len(raw_chunk))],
+        bytes([0x08, 0x02])
+    )
+    root_cid = compute_block_cid(root)
+    return {
+        'single': str(leaf_cid),
+        'chunked': str(root_cid),
+        str(leaf_cid): leaf,
+        str(first_cid): first_chunk,
+        str(raw_cid): raw_chunk,
+        str(root_cid): root,
+    }
+
+
+@pytest.fixture(scope='function')
+def make_gateway(blocks):
+    gateways = []
+
+    def make(**kwargs):
+        gateway = StubGateway(blocks, **kwargs)
+        gateways.append(gateway)
+        return gateway
+
+    yield make
+    for gateway in gateways:
+        gateway.close()
+
+
+def test_verified_load(blocks, make_gateway):
+    gateway = make_gateway()
+    pool = IpfsGatewayPool([gateway.url])
+    assert pool.load_json_object(blocks['single']) == {'x': [1, 2, 3]}
+    assert pool.load_json_object(blocks['chunked']) == {'x': [1, 2, 3], 'y': 4}
+    assert pool.exists(blocks['chunked'])
+    absent = str(compute_block_cid(b'absent', CODEC_RAW, 1))
+    assert not pool.exists(absent)
+    with pytest.raises(GatewayUnavailableError):
+        pool.load_json_object(absent)
+
+
+def test_hedged_request(blocks, make_gateway):
+    slow = make_gateway(delay=2.0)
+    fast = make_gateway(delay=0.0)
+    # the slow gateway is asked first as it has not been measured yet
+    pool = IpfsGatewayPool([slow.url, fast.url], default_hedge_delay=0.1)
+    start = time.monotonic()
+    assert pool.load_json_object(blocks['single']) == {'x': [1, 2, 3]}
+    assert time.monotonic() - start < 1.0
+    assert slow.num_requests == 1
+    assert fast.num_requests == 1
+    # the fast gateway is preferred from now on
+    pool.load_json_object(blocks['single'])
+    assert fast.num_requests == 2
+
+
+def test_invalid_response_and_circuit_breaker(blocks, make_gateway):
+    corrupt = make_gateway(corrupt=True)
+    broken = make_gateway(status=500)
+    pool = IpfsGatewayPool(
+        [corrupt.url, broken.url], failure_threshold=2, open_duration=60
+    )
+    with pytest.raises(GatewayUnavailableError):
+        pool.load_json_object(blocks['single'])
+    healthy = make_gateway()
+    pool = IpfsGatewayPool(
+        [corrupt.url, broken.url, healthy.url], failure_threshold=2, open_duration=60
+    )
+    for _ in range(4):
+        assert pool.load_json_object(blocks['single']) == {'x': [1, 2, 3]}
+    num_requests = corrupt.num_requests + broken.num_requests
+    # the circuits of both gateways are open now
+    for _ in range(4):
+        pool.load_json_object(blocks['single'])
+    assert corrupt.num_requests + broken.num_requests == num_requests
+    assert [h.is_available() for h in pool.get_gateway_health()] == [False, False, True]
+
+
+def test_storage_provider_with_gateways(blocks, make_gateway):
+    gateways = [make_gateway(delay=1.0), make_gateway()]
+    store = IpfsJsonStorageProvider(None, [g.url for g in gateways], 'http://127.0.0.1:9/api/')
+    assert store.load(blocks['chunked']) == {'x': [1, 2, 3], 'y': 4}
+    assert store.exists(blocks['single'])
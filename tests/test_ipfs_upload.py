@@ -0,0 +1,92 @@
+import threading
+from email.parser import BytesParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import orjson
+import pytest
+from jsonvc.checksum import get_unique_json_repr
+from jsonvc.ipfs_cid import compute_unixfs_file_cid
+from jsonvc.ipfs_storage import IpfsJsonStorageProvider
+
+
+class StubRpcServer:
+    """Answer `add` and `routing/provide` like the IPFS RPC API"""
+
+    def __init__(self):
+        self.requests = []
+        self.provided = []
+        self.stored = dict()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                stub.requests.append(url.path)
+                if url.path == '/api/v0/add':
+                    header = b'Content-Type: ' + self.headers['Content-Type'].encode() + b'\r\n\r\n'
+                    message = BytesParser().parsebytes(header + body)
+                    lines = []
+                    for part in message.get_payload():
+                        content = part.get_payload(decode=True)
+                        cid = str(compute_unixfs_file_cid(content))
+                        stub.stored[cid] = content
+                        lines.append(orjson.dumps({
+                            'Name': part.get_filename(), 'Hash': cid, 'Size': str(len(content))
+                        }))
+                    response = b'\n'.join(lines) + b'\n'
+                elif url.path == '/api/v0/routing/provide':
+                    stub.provided.extend(parse_qs(url.query)['arg'])
+                    response = b''
+                else:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/api/'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture(scope='function')
+def rpc_server():
+    server = StubRpcServer()
+    yield server
+    server.close()
+
+
+def test_batched_upload(tmp_path, rpc_server):
+    store = IpfsJsonStorageProvider(tmp_path, 'http://127.0.0.1:9/', rpc_server.url)
+    store.enable_provide()
+    json_dicts = [{'i': i, 'b': [i, 'x']} for i in range(20)]
+    json_hashes = store.store_many(json_dicts)
+    assert rpc_server.requests == ['/api/v0/add', '/api/v0/routing/provide']
+    assert rpc_server.provided == json_hashes
+    for json_hash, json_dict in zip(json_hashes, json_dicts):
+        content = get_unique_json_repr(json_dict).encode('utf-8')
+        assert json_hash == str(compute_unixfs_file_cid(content))
+        assert rpc_server.stored[json_hash] == content
+        # cached, so no gateway is needed
+        assert store.load(json_hash) == json_dict
+
+
+def test_upload_in_several_batches(tmp_path, rpc_server):
+    store = IpfsJsonStorageProvider(None, 'http://127.0.0.1:9/', rpc_server.url)
+    store.UPLOAD_BATCH_SIZE = 8
+    json_dicts = [{'i': i} for i in range(20)]
+    json_hashes = store.store_many(json_dicts)
+    assert rpc_server.requests == ['/api/v0/add'] * 3
+    assert len(set(json_hashes)) == 20
+    assert [orjson.loads(rpc_server.stored[h]) for h in json_hashes] == json_dicts
@@ -0,0 +1,148 @@
+import tracemalloc
+import orjson
+import pytest
+import jsonpointer
+from hypothesis import given, settings, HealthCheck, strategies as st
+from jsonvc import file_utils, json_events
+from jsonvc.json_events import iter_json_events, compute_json_file_hash, load_json_pointer
+from jsonvc.checksum import compute_json_hash
+from jsonvc.storage_utils import load_json_file, hash_json_file
+
+
+scalars = (
+    st.none() | st.booleans() | st.text()
+    | st.integers(min_value=-2**63, max_value=2**64 - 1)
+    | st.floats(allow_nan=False, allow_infinity=False)
+)
+json_values = st.recursive(
+    scalars,
+    lambda children: st.lists(children) | st.dictionaries(st.text(), children),
+    max_leaves=100,
+)
+
+
+def _build(events, event, value):
+    if event == 'scalar':
+        return value
+    if event == 'start_array':
+        items = []
+        for event, value in events:
+            if event == 'end_array':
+                return items
+            items.append(_build(events, event, value))
+    result = dict()
+    for event, key in events:
+        if event == 'end_map':
+            return result
+        result[key] = _build(events, *next(events))
+
+
+@given(json_values)
+def test_events_describe_value(value):
+    data = orjson.dumps(value, option=orjson.OPT_INDENT_2)
+    events = iter_json_events(data)
+    assert _build(events, *next(events)) == value
+    assert list(events) == []
+
+
+@settings(suppress_health_check=[HealthCheck.function_scoped_fixture])
+@given(json_values)
+def test_file_hash_equals_loaded_hash(tmp_path, value):
+    filepath = tmp_path / 'doc.json'
+    # keys in insertion order, i.e. mostly unsorted
+    filepath.write_bytes(orjson.dumps(value))
+    assert compute_json_file_hash(filepath) == compute_json_hash(value)
+    assert compute_json_file_hash(filepath, 'blake2b-256') == compute_json_hash(value, 'blake2b-256')
+
+
+@settings(suppress_health_check=[HealthCheck.function_scoped_fixture], max_examples=50)
+@given(json_values)
+def test_file_hash_of_large_objects(tmp_path, monkeypatch, value):
+    # objects are re-parsed from the offsets of their values
+    monkeypatch.setattr(json_events, 'BUFFER_SIZE', 0)
+    filepath = tmp_path / 'doc.json'
+    filepath.write_bytes(orjson.dumps(value))
+    assert compute_json_file_hash(filepath) == compute_json_hash(value)
+
+
+def test_file_hash_memory_with_unsorted_root(tmp_path):
+    doc = {'z': [{'id': i, 'name': f'record {i}', 'meta': {'index': i}} for i in range(20000)], 'a': 1}
+    filepath = tmp_path / 'doc.json'
+    filepath.write_bytes(orjson.dumps(doc))
+    # orjson allocates its cache of keys once
+    compute_json_file_hash(filepath)
+    tracemalloc.start()
+    try:
+        json_hash = compute_json_file_hash(filepath)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert json_hash == compute_json_hash(doc)
+    assert peak < filepath.stat().st_size / 8
+
+
+def test_file_hash_of_unusual_texts(tmp_path, monkeypatch):
+    filepath = tmp_path / 'doc.json'
+    texts = (
+        b' {"b": [1.0E2, -0, "\\u00e9\\n"], "a": {"y": true, "x": null}} \n',
+        b'{"a": 1, "b": {"d": 1, "c": 2}, "a": {"z": 3, "y": 4}}',
+        b'[{"b": 1, "a": 2}, {"a": [], "b": {}}]',
+        b'{"b": {"y": [1, {"d": 1, "c": 2}], "x": 2}, "a": 1, "b": {"z": 3}}',
+        b'"\\ud83d\\ude00"',
+    )
+    for buffer_size in (json_events.BUFFER_SIZE, 0):
+        monkeypatch.setattr(json_events, 'BUFFER_SIZE', buffer_size)
+        for text in texts:
+            filepath.write_bytes(text)
+            assert compute_json_file_hash(filepath) == compute_json_hash(orjson.loads(text))
+
+
+def test_same_errors_as_orjson(tmp_path):
+    filepath = tmp_path / 'doc.json'
+    texts = (
+        b'', b' ', b'{', b'[1,]', b'{"a" 1}', b'{"a": 1,}', b'{1: 2}', b'[1 2]',
+        b'01', b'1.', b'-', b'nul', b'"abc', b'"\\x"', b'"\x01"', b'[1] x', b'{} {}',
+        b'1e400', b'"\xff"', b'[' * 1025 + b']' * 1025, b'NaN',
+    )
+    for text in texts:
+        with pytest.raises(orjson.JSONDecodeError):
+            orjson.loads(text)
+        with pytest.raises(orjson.JSONDecodeError):
+            list(iter_json_events(text))
+        filepath.write_bytes(text)
+        with pytest.raises(orjson.JSONDecodeError):
+            compute_json_file_hash(filepath)
+    filepath.write_bytes(b'[' * 1024 + b']' * 1024)
+    with pytest.raises(TypeError):
+        compute_json_file_hash(filepath)
+
+
+def test_load_json_pointer(tmp_path):
+    filepath = tmp_path / 'doc.json'
+    doc = {'a': [{'b/c': 1}, {'d': [True, None]}], 'a~': 'x', '': {'': 2}}
+    filepath.write_bytes(orjson.dumps(doc))
+    for pointer in ('', '/a', '/a/0/b~1c', '/a/1/d/1', '/a~0', '/', '//'):
+        assert load_json_pointer(filepath, pointer) == jsonpointer.resolve_pointer(doc, pointer)
+    for pointer in ('/b', '/a/2', '/a/-', '/a/01', '/a/0/b~1c/x', '/a~0/0'):
+        with pytest.raises(jsonpointer.JsonPointerException):
+            load_json_pointer(filepath, pointer)
+    filepath.write_bytes(b'{"a": {"b": 1}, "a": {"b": 2}}')
+    assert load_json_pointer(filepath, '/a/b') == 2
+    filepath.write_bytes(b'{"a": 1} x')
+    with pytest.raises(orjson.JSONDecodeError):
+        load_json_pointer(filepath, '/a')
+
+
+@pytest.mark.parametrize('threshold', [0, file_utils.MMAP_THRESHOLD])
+def test_mapped_loading(tmp_path, monkeypatch, threshold):
+    monkeypatch.setattr(file_utils, 'MMAP_THRESHOLD', threshold)
+    doc = {'records': [{'id': i, 'name': f'record {i}'} for i in range(1000)]}
+    filepath = tmp_path / 'doc.json'
+    filepath.write_bytes(orjson.dumps(doc))
+    assert load_json_file(filepath) == doc
+    assert hash_json_file(filepath) == compute_json_hash(doc)
+    assert hash_json_file(filepath, stream_min_size=1) == compute_json_hash(doc)
+    assert load_json_pointer(filepath, '/records/999/name') == 'record 999'
+    filepath.write_bytes(b'')
+    with pytest.raises(orjson.JSONDecodeError):
+        load_json_file(filepath)
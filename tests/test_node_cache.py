@@ -0,0 +1,64 @@
+from pathlib import Path
+import pytest
+from jsonvc.checksum import pack_hash, unpack_hash
+from jsonvc.storage import LocalJsonStorageProvider
+from jsonvc.version_control import JsonNodeCache
+
+
+CID = 'QmPZ9gcCEpqKTo6aq61g2nXGUhM4iCL3ewB6LDXZCtioEB'
+
+
+@pytest.fixture(scope='function')
+def json_storage_dir(tmpdir):
+    return Path(tmpdir)
+
+
+def test_pack_hash():
+    sha256_hash = 'ab' * 32
+    assert pack_hash(sha256_hash) == bytes.fromhex(sha256_hash)
+    assert unpack_hash(pack_hash(sha256_hash)) == sha256_hash
+    # anything that would not round-trip is kept as string
+    for json_hash in (CID, 'AB' * 32, 'abc', 'ab cd'):
+        assert pack_hash(json_hash) == json_hash
+        assert unpack_hash(pack_hash(json_hash)) == json_hash
+
+
+def test_packed_cache_roundtrip(json_storage_dir):
+    cache = JsonNodeCache(LocalJsonStorageProvider(json_storage_dir))
+    cache_dict = {
+        'known_nodes': {'01' * 32: [], '02' * 32: ['01' * 32], CID: ['02' * 32]},
+        'known_docs': {'0a' * 32: ['01' * 32, CID], '0b' * 32: ['02' * 32]},
+    }
+    cache.from_dict(cache_dict)
+    assert cache.to_dict() == cache_dict
+    assert cache.get_node_ancestor_hashes(CID) == {'02' * 32}
+    assert cache.find_associated_node_hashes('0a' * 32) == {'01' * 32, CID}
+    assert cache.find_node_hashes_by_prefix('0202') == ['02' * 32]
+    # merging keeps existing entries
+    cache.from_dict({'known_nodes': {}, 'known_docs': {'0a' * 32: ['03' * 32]}})
+    assert cache.find_associated_node_hashes('0a' * 32) == {'01' * 32, '03' * 32, CID}
+    cache.remove_nodes(['01' * 32, '03' * 32])
+    assert cache.find_associated_node_hashes('0a' * 32) == {CID}
+    assert sorted(cache.get_node_hashes()) == sorted(['02' * 32, CID])
+
+
+def test_registered_hashes_are_interned(json_storage_dir):
+    cache = JsonNodeCache(LocalJsonStorageProvider(json_storage_dir))
+    cache.from_dict({'known_nodes': {'01' * 32: []}, 'known_docs': {}})
+    cache.update_node_cache('02' * 32, ['01' * 32])
+    cache.update_doc_cache('0a' * 32, '02' * 32)
+    cache_dict = cache.pop_delta()
+    # the keys and values of all entries share one object per hash
+    objects = {}
+    for entries in (cache._known_nodes, cache._known_docs):
+        for h, v in entries.items():
+            for packed in (h, *v):
+                assert objects.setdefault(packed, packed) is packed
+    assert len(objects) == 3
+    # registering known entries again changes nothing
+    sources = cache._known_nodes[pack_hash('02' * 32)]
+    cache.update_node_cache('02' * 32, ['01' * 32])
+    cache.update_doc_cache('0a' * 32, '02' * 32)
+    assert cache._known_nodes[pack_hash('02' * 32)] is sources
+    assert cache.pop_delta() is None
+    assert cache_dict['known_docs'] == {'0a' * 32: ['02' * 32]}
@@ -0,0 +1,133 @@
+import random
+import jsonpatch
+import pytest
+from jsonvc.jsonpatch_ext import apply_patch
+from jsonvc.patch_composition import (
+    PatchCompositionError,
+    compose_patches,
+    make_base_resolver,
+)
+from jsonvc.storage import MemoryJsonStorageProvider
+from jsonvc.version_control import JsonDocVersionControl
+
+
+class CountingStorageProvider(MemoryJsonStorageProvider):
+
+    def __init__(self):
+        super().__init__()
+        self.loaded = []
+
+    def load(self, json_hash):
+        self.loaded.append(json_hash)
+        return super().load(json_hash)
+
+    def load_many(self, json_hashes):
+        self.loaded.extend(json_hashes)
+        return [MemoryJsonStorageProvider.load(self, h) for h in json_hashes]
+
+
+def _random_value(rng, depth=0):
+    r = rng.random()
+    if depth > 2 or r < 0.4:
+        return rng.choice([1, 2, 'a', None, True])
+    if r < 0.7:
+        return {rng.choice('abcde'): _random_value(rng, depth+1) for _ in range(rng.randint(0, 4))}
+    return [_random_value(rng, depth+1) for _ in range(rng.randint(0, 5))]
+
+
+def _mutate(rng, value, depth=0):
+    if isinstance(value, dict):
+        value = dict(value)
+        for key in list(value):
+            r = rng.random()
+            if r < 0.2:
+                del value[key]
+            elif r < 0.5:
+                value[key] = _mutate(rng, value[key], depth+1)
+        if rng.random() < 0.3:
+            value[rng.choice('abcdefg')] = _random_value(rng, depth+1)
+        return value
+    if isinstance(value, list):
+        value = list(value)
+        for _ in range(rng.randint(0, 3)):
+            r = rng.random()
+            if r < 0.3 and len(value) > 0:
+                del value[rng.randrange(len(value))]
+            elif r < 0.6:
+                value.insert(rng.randint(0, len(value)), _random_value(rng, depth+1))
+            elif len(value) > 0:
+                i = rng.randrange(len(value))
+                value[i] = _mutate(rng, value[i], depth+1)
+        return value
+    return _random_value(rng, depth) if rng.random() < 0.5 else value
+
+
+def test_compose_random_patches():
+    rng = random.Random(46)
+    for _ in range(500):
+        docs = [{'r': _random_value(rng)}]
+        for _ in range(rng.randint(1, 6)):
+            docs.append(_mutate(rng, docs[-1]))
+        patches = [jsonpatch.make_patch(a, b).patch for a, b in zip(docs, docs[1:])]
+        try:
+            patch = compose_patches(patches)
+        except PatchCompositionError:
+            # needs to look at the first document
+            patch = compose_patches(patches, make_base_resolver(lambda: docs[0]))
+        assert apply_patch(docs[0], patch) == docs[-1]
+
+
+def test_compose_collapses_operations():
+    patches = [
+        [{'op': 'replace', 'path': '/a', 'value': 1}],
+        [{'op': 'replace', 'path': '/a', 'value': 2}, {'op': 'replace', 'path': '/b', 'value': 1}],
+        [{'op': 'remove', 'path': '/a'}, {'op': 'add', 'path': '/l/-', 'value': 'x'}],
+        [{'op': 'add', 'path': '/l/-', 'value': 'y'}, {'op': 'replace', 'path': '/b', 'value': 3}],
+    ]
+    assert compose_patches(patches) == [
+        {'op': 'remove', 'path': '/a'},
+        {'op': 'replace', 'path': '/b', 'value': 3},
+        {'op': 'add', 'path': '/l/-', 'value': 'x'},
+        {'op': 'add', 'path': '/l/-', 'value': 'y'},
+    ]
+    with pytest.raises(PatchCompositionError):
+        compose_patches([[{'op': 'copy', 'from': '/a', 'path': '/b'}]])
+
+
+def test_node_diff_from_stored_patches():
+    storage = CountingStorageProvider()
+    docvc = JsonDocVersionControl(storage)
+    docs = [{'x': [1, 2], 'y': {'z': 0}}]
+    node_hashes = [docvc.track(docs[0], 'v0')]
+    for i in range(1, 10):
+        docs.append({'x': docs[-1]['x'] + [i], 'y': {'z': i}})
+        node_hashes.append(docvc.update(node_hashes[-1], docs[-1], f'v{i}'))
+    storage.loaded = []
+    patch = docvc.get_node_diff(node_hashes[2], node_hashes[9])
+    assert apply_patch(docs[2], patch) == docs[9]
+    # no document but the old one was loaded
+    doc_hashes = {storage.compute_hash(d) for d in docs[3:]}
+    assert doc_hashes.isdisjoint(storage.loaded)
+    assert docvc.get_node_diff(node_hashes[3], node_hashes[3]) == []
+    # not a descendant
+    assert docvc.get_node_diff(node_hashes[9], node_hashes[2]) is None
+
+    squashed = docvc.squash_patches(node_hashes[0], node_hashes[9])
+    assert squashed['sourceHashes'] == {'object': storage.compute_hash(docs[0])}
+    assert apply_patch({'object': docs[0]}, squashed['operations']) == {'object': docs[9]}
+
+
+def test_node_diff_of_child_uses_stored_patch():
+    storage = CountingStorageProvider()
+    docvc = JsonDocVersionControl(storage)
+    old_doc = {'x': list(range(5)), 'y': {'z': 0}}
+    new_doc = {'x': list(range(6)), 'y': {'z': 1}}
+    old_node_hash = docvc.track(old_doc, 'old')
+    new_node_hash = docvc.update(old_node_hash, new_doc, 'new')
+    storage.loaded = []
+    patch = docvc.get_node_diff(old_node_hash, new_node_hash)
+    assert apply_patch(old_doc, patch) == new_doc
+    assert all(not op['path'].startswith('/object') for op in patch)
+    # the new node and its patch but no document
+    doc_hashes = {storage.compute_hash(old_doc), storage.compute_hash(new_doc)}
+    assert doc_hashes.isdisjoint(storage.loaded)
@@ -0,0 +1,38 @@
+from pathlib import Path
+import pytest
+from jsonvc.storage import LocalJsonStorageProvider
+from jsonvc.version_control import JsonDocVersionControl
+
+
+@pytest.fixture(scope='function')
+def json_storage_dir(tmpdir):
+    return Path(tmpdir)
+
+
+def test_path_history_and_blame(json_storage_dir):
+    store = LocalJsonStorageProvider(json_storage_dir)
+    docvc = JsonDocVersionControl(store)
+    doc = {'title': 'x', 'reactions': [{'crossSection': 1}, {'crossSection': 2}]}
+    first = docvc.track(doc, 'first')
+    doc['reactions'][1]['crossSection'] = 3
+    second = docvc.update(first, doc, 'second')
+    doc['title'] = 'y'
+    third = docvc.update(second, doc, 'third')
+    doc['reactions'].insert(0, {'crossSection': 0})
+    fourth = docvc.update(third, doc, 'fourth')
+
+    assert docvc.get_path_history(third, '/reactions/1/crossSection') == [first, second]
+    assert docvc.get_path_history(third, '/title') == [first, third]
+    # pointers are matched literally, so array shifts are not traced back
+    assert docvc.get_path_history(fourth, '/reactions/2') == [first, fourth]
+    assert docvc.blame(third) == {
+        '/title': third,
+        '/reactions/0/crossSection': first,
+        '/reactions/1/crossSection': second,
+    }
+
+    # a fresh index is backfilled from the stored patches
+    other_docvc = JsonDocVersionControl(store)
+    other_docvc.get_cache().from_dict(docvc.get_cache().to_dict())
+    assert other_docvc.blame(third, '/reactions/1') == {'/reactions/1/crossSection': second}
+    assert other_docvc.get_path_index().pop_delta() is not None
@@ -0,0 +1,84 @@
+import hashlib
+import orjson
+from jsonvc.replication import Replicator, sync_storage
+from jsonvc.storage import MemoryJsonStorageProvider
+from jsonvc.version_control import JsonDocVersionControl
+
+
+class CountingStorageProvider(MemoryJsonStorageProvider):
+
+    def __init__(self, hash_func=None):
+        super().__init__(hash_func)
+        self.stored = []
+        self.num_exists_calls = 0
+
+    def store(self, json_dict):
+        json_hash = super().store(json_dict)
+        self.stored.append(json_hash)
+        return json_hash
+
+    def exists_many(self, json_hashes):
+        self.num_exists_calls += 1
+        return super().exists_many(json_hashes)
+
+
+def sha512_hash(json_dict):
+    return hashlib.sha512(orjson.dumps(json_dict, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def _create_history(storage):
+    docvc = JsonDocVersionControl(storage)
+    first = docvc.track({'x': [1, 2]}, 'first')
+    second = docvc.update(first, {'x': [1, 2, 3]}, 'second')
+    third = docvc.update(second, {'x': [1, 2, 3], 'y': 1}, 'third')
+    branch = docvc.update(first, {'x': [2]}, 'branch')
+    return first, second, third, branch
+
+
+def test_sync_same_hashes():
+    src = MemoryJsonStorageProvider()
+    first, second, third, branch = _create_history(src)
+    dst = CountingStorageProvider()
+    result = sync_storage(src, dst, [second])
+    # the genesis node has no patch
+    assert (result.num_nodes, result.num_objects) == (2, 5)
+    assert result.root_hashes == {second: second}
+    # nodes are stored after the objects they reference
+    assert dst.stored.index(first) < dst.stored.index(second)
+    assert dst.stored[-1] == second
+
+    # the history of the second node is already there
+    dst.stored = []
+    result = sync_storage(src, dst, [third, branch])
+    assert result.num_nodes == 2
+    assert first not in dst.stored and second not in dst.stored
+    assert JsonDocVersionControl(dst).get_doc(third) == {'x': [1, 2, 3], 'y': 1}
+    assert JsonDocVersionControl(dst).get_doc(branch) == {'x': [2]}
+
+    dst.num_exists_calls = 0
+    result = sync_storage(src, dst, [third, branch])
+    assert (result.num_nodes, result.num_objects) == (0, 0)
+    assert dst.num_exists_calls == 1
+
+
+def test_sync_with_other_hashes():
+    src = MemoryJsonStorageProvider()
+    first, second, third, branch = _create_history(src)
+    dst = CountingStorageProvider(sha512_hash)
+    hash_map = dict()
+    replicator = Replicator(src, dst, hash_map)
+    result = replicator.sync([second])
+    new_second = result.root_hashes[second]
+    assert new_second != second and len(new_second) == 128
+    docvc = JsonDocVersionControl(dst)
+    assert docvc.get_doc(new_second) == {'x': [1, 2, 3]}
+    assert [n.get_meta()['message'] for n in docvc.get_linear_history(new_second)] == \
+        ['first', 'second']
+
+    # resumed with the hashes of the first run
+    result = Replicator(src, dst, hash_map).sync([third, branch])
+    assert result.num_nodes == 2
+    assert hash_map[first] not in dst.stored[5:]
+    new_third = result.root_hashes[third]
+    assert docvc.get_doc(new_third) == {'x': [1, 2, 3], 'y': 1}
+    assert docvc.get_doc(result.root_hashes[branch]) == {'x': [2]}
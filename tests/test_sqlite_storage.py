@@ -0,0 +1,49 @@
+from pathlib import Path
+import pytest
+from jsonvc.sqlite_storage import SqliteJsonStorageProvider
+from jsonvc.storage import LocalJsonStorageProvider
+from jsonvc.version_control import JsonDocVersionControl
+from jsonvc.garbage_collection import collect_garbage
+
+
+@pytest.fixture(scope='function')
+def test_dir(tmpdir):
+    return Path(tmpdir)
+
+
+def test_sqlite_storage(test_dir):
+    store = SqliteJsonStorageProvider(test_dir / 'objects.db')
+    docvc = JsonDocVersionControl(store)
+    first = docvc.track({'x': [1, 2]}, 'first')
+    second = docvc.update(first, {'x': [1, 2, 3]}, 'second')
+    assert docvc.get_doc(second) == {'x': [1, 2, 3]}
+    # hashes agree with the local storage
+    local_store = LocalJsonStorageProvider(test_dir)
+    assert local_store.store({'x': [1, 2, 3]}) == store.store({'x': [1, 2, 3]})
+    assert len(store.index()) == 5
+    assert store.size(first) > 0
+
+    orphan = store.store({'orphan': True})
+    removed = collect_garbage(store, store, [second])
+    assert removed == [orphan]
+    assert not store.exists(orphan)
+    with pytest.raises(KeyError):
+        store.load(orphan)
+
+
+def test_sqlite_transaction(test_dir):
+    store = SqliteJsonStorageProvider(test_dir / 'objects.db')
+    other_store = SqliteJsonStorageProvider(test_dir / 'objects.db')
+    with store.transaction():
+        json_hash = store.store({'x': 1})
+        with store.transaction():
+            store.store({'x': 2})
+        # not visible to other connections before the commit
+        assert not other_store.exists(json_hash)
+    assert other_store.exists(json_hash)
+
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            json_hash = store.store({'x': 3})
+            raise RuntimeError('failure in the middle of a node')
+    assert not store.exists(json_hash)
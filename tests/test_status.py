@@ -0,0 +1,46 @@
+from pathlib import Path
+import pytest
+from jsonvc.storage import LocalJsonStorageProvider
+from jsonvc.version_control import JsonFileVersionControl
+from jsonvc.status import get_file_status
+
+
+@pytest.fixture(scope='function')
+def test_dir(tmpdir):
+    return Path(tmpdir)
+
+
+@pytest.mark.parametrize('num_workers', [1, 2])
+def test_file_status(test_dir, num_workers):
+    (test_dir / 'storage').mkdir()
+    work_dir = test_dir / 'work'
+    (work_dir / 'sub' / '.hidden').mkdir(parents=True)
+    filevc = JsonFileVersionControl(LocalJsonStorageProvider(test_dir / 'storage'))
+    files = {name: work_dir / name for name in (
+        'same.json', 'changed.json', 'sub/new.json', 'sub/invalid.json', 'sub/.hidden/x.json'
+    )}
+    for i, filepath in enumerate(files.values()):
+        filepath.write_text(f'{{"i": {i}}}')
+    same_node = filevc.track(files['same.json'], 'same')
+    changed_node = filevc.track(files['changed.json'], 'changed')
+    files['changed.json'].write_text('{"i": 100}')
+    files['sub/invalid.json'].write_text('{')
+
+    status = {
+        Path(s.path).relative_to(work_dir).as_posix(): s
+        for s in get_file_status(filevc, [work_dir], num_workers)
+    }
+    assert {p: s.state for p, s in status.items()} == {
+        'same.json': 'unchanged',
+        'changed.json': 'modified',
+        'sub/new.json': 'untracked',
+        'sub/invalid.json': 'invalid',
+    }
+    assert status['same.json'].node_hashes == {same_node}
+    assert status['changed.json'].ancestor_hash == changed_node
+
+    # registering the modification makes the file unchanged again
+    new_node = filevc.update(changed_node, str(files['changed.json']), 'update')
+    status = list(get_file_status(filevc, [files['changed.json']], num_workers))
+    assert status[0].state == 'unchanged'
+    assert status[0].ancestor_hash == new_node
@@ -0,0 +1,109 @@
+import time
+from pathlib import Path
+import pytest
+from jsonvc.storage import MemoryJsonStorageProvider
+from jsonvc.storage_utils import compute_json_hash
+from jsonvc.tiered_storage import (
+    DirectoryJsonStorageProvider,
+    TieredJsonStorageProvider,
+    WriteBackQueue,
+)
+from jsonvc.version_control import JsonDocVersionControl
+
+
+class StubRemoteStorageProvider(MemoryJsonStorageProvider):
+    """Remote tier that can be taken offline and records the store order"""
+
+    def __init__(self):
+        super().__init__()
+        self.online = True
+        self.stored = []
+        self.num_loads = 0
+
+    def load(self, json_hash):
+        if not self.online:
+            raise ConnectionError('remote offline')
+        self.num_loads += 1
+        return super().load(json_hash)
+
+    def store(self, json_dict):
+        if not self.online:
+            raise ConnectionError('remote offline')
+        json_hash = super().store(json_dict)
+        self.stored.append(json_hash)
+        return json_hash
+
+
+@pytest.fixture(scope='function')
+def test_dir(tmpdir):
+    return Path(tmpdir)
+
+
+def _create_tiered_storage(test_dir, remote):
+    tiers = [
+        MemoryJsonStorageProvider(),
+        DirectoryJsonStorageProvider(test_dir / 'cache', compute_json_hash),
+        remote,
+    ]
+    (test_dir / 'cache').mkdir(exist_ok=True)
+    queue = WriteBackQueue(test_dir / 'queue', remote)
+    return TieredJsonStorageProvider(tiers, queue)
+
+
+def test_write_back(test_dir):
+    remote = StubRemoteStorageProvider()
+    remote.online = False
+    store = _create_tiered_storage(test_dir, remote)
+    docvc = JsonDocVersionControl(store)
+    first = docvc.track({'x': [1, 2]}, 'first')
+    second = docvc.update(first, {'x': [1, 2, 3]}, 'second')
+    assert remote.stored == []
+    assert docvc.get_doc(second) == {'x': [1, 2, 3]}
+    assert store.flush() == 5
+
+    # the queue survives the process
+    store = _create_tiered_storage(test_dir, remote)
+    remote.online = True
+    assert store.flush() == 0
+    assert len(remote.stored) == 5
+    # sources are uploaded before the nodes referencing them
+    assert remote.stored.index(first) < remote.stored.index(second)
+    assert remote.stored[-1] == second
+    assert store.get_write_back_queue().get_pending() == []
+
+
+def test_write_back_thread(test_dir):
+    remote = StubRemoteStorageProvider()
+    store = _create_tiered_storage(test_dir, remote)
+    queue = store.get_write_back_queue()
+    queue.start()
+    try:
+        json_hash = store.store({'x': 1})
+        for _ in range(100):
+            if remote.exists(json_hash):
+                break
+            time.sleep(0.05)
+    finally:
+        queue.stop()
+    assert remote.exists(json_hash)
+
+
+def test_promotion(test_dir):
+    remote = StubRemoteStorageProvider()
+    json_hash = remote.store({'x': 1})
+    store = _create_tiered_storage(test_dir, remote)
+    memory_tier, directory_tier = store.get_tiers()[:2]
+    assert store.exists(json_hash)
+    assert store.load(json_hash) == {'x': 1}
+    assert memory_tier.exists(json_hash)
+    assert directory_tier.exists(json_hash)
+    assert directory_tier.index() == [json_hash]
+    assert store.load(json_hash) == {'x': 1}
+    assert remote.num_loads == 1
+
+    # a new process finds the object on disk
+    remote.online = False
+    store = _create_tiered_storage(test_dir, remote)
+    assert store.load(json_hash) == {'x': 1}
+    with pytest.raises(ConnectionError):
+        store.load(compute_json_hash({'y': 1}))